@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import Queue
+
+import dbus
+import dbus.connection
+import dbus.mainloop.glib
+
+import DhcpLeaseStatus
+import DbusLeaseState
+import DbusMainLoopThread
+
+class DhcpPendingCall:
+    """
+    Result of an asynchronous operation on a remote DHCP client, that will be available later
+    Completion can either be waited for (see result()) or notified via a callback (see add_done_callback())
+    """
+
+    def __init__(self):
+        self._done_event = threading.Event()
+        self._mutex = threading.Lock()    # This mutex protects writes to the _callbacks attribute
+        self._callbacks = []
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        """
+        Has this operation completed (successfully or not)?
+        """
+        return self._done_event.is_set()
+
+    def result(self, timeout = None):
+        """
+        Wait (up to timeout seconds if specified) for the operation to complete and return its result
+        Will raise the exception that made the operation fail if it failed, or an exception if timeout expired
+        """
+        if not self.done() and DbusMainLoopThread.DbusMainLoopThread.getShared().isCurrentThread():
+            raise Exception('BlockingWaitFromMainLoop')    # Waiting here would prevent the main loop from ever completing this operation
+        if not self._done_event.wait(timeout):
+            raise Exception('DhcpPendingCallTimeout')
+        if not self._exception is None:
+            raise self._exception
+        return self._result
+
+    def add_done_callback(self, callback):
+        """
+        Call callback (with this DhcpPendingCall object as argument) when the operation completes (or immediately if it has already completed)
+        Callbacks are run from the D-Bus main loop thread, so they should not block
+        """
+        with self._mutex:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _setResult(self, result = None):
+        self._complete(result, None)
+
+    def _setException(self, exception):
+        self._complete(None, exception)
+
+    def _complete(self, result, exception):
+        with self._mutex:
+            if self.done():
+                return
+            self._result = result
+            self._exception = exception
+            self._done_event.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        for callback in callbacks:
+            callback(self)
+
+
+class AsyncRemoteDhcpClientControl:
+    """
+    Non-blocking control of a remote (slave) DHCP client process, over D-Bus
+    Contrary to RemoteDhcpClientControl, no method of this object blocks: D-Bus methods are invoked asynchronously and return a DhcpPendingCall object
+    All AsyncRemoteDhcpClientControl objects of a process share the same main loop thread (and, unless connected peer-to-peer, the same D-Bus connection), so that many remote DHCP clients (one per network interface) can be driven concurrently
+    Lease state changes can be followed without blocking any thread via add_lease_listener()
+    Only D-Bus is supported: slaves controlled over a unix control socket (see UnixSocketRemoteDhcpClientControl) cannot be driven by this object
+    """
+
+    DBUS_NAME = 'com.legrandelectric.RobotFrameworkIPC.DhcpClientLibrary'    # The name of bus we are connecting to on D-Bus
+    DBUS_OBJECT_ROOT = '/com/legrandelectric/RobotFrameworkIPC/DhcpClientLibrary'    # The name of the D-Bus object under which we will communicate on D-Bus
+    DBUS_SERVICE_INTERFACE = 'com.legrandelectric.RobotFrameworkIPC.DhcpClientLibrary'    # The name of the D-Bus service under which we will perform input/output on D-Bus
+
+    def __init__(self, ifname, dbus_address = None):
+        """
+        Instantiate a new AsyncRemoteDhcpClientControl object that controls the slave DHCP client running on network interface ifname
+        The slave process must already be running
+        If dbus_address is provided, we connect directly (peer-to-peer) to the slave listening on this D-Bus address (see the --dbus-address option of the slave), otherwise we reach the slave via its name on the D-Bus system bus
+        """
+        self._ifname = ifname
+        self._dbus_address = dbus_address
+        DbusMainLoopThread.DbusMainLoopThread.getShared()    # Make sure D-Bus messages are handled in the background
+        if self._dbus_address is None:
+            self._bus = dbus.SystemBus()
+            bus_name = AsyncRemoteDhcpClientControl.DBUS_NAME
+        else:
+            self._bus = dbus.connection.Connection(self._dbus_address)    # This connection is private to this object
+            bus_name = None    # There is no bus daemon, so no bus name to resolve: messages go straight to the slave
+
+        dbus_object_name = AsyncRemoteDhcpClientControl.DBUS_OBJECT_ROOT + '/' + str(ifname)
+        self._dhcp_client_proxy = self._bus.get_object(bus_name, dbus_object_name, introspect = False)
+        self._dbus_iface = dbus.Interface(self._dhcp_client_proxy, AsyncRemoteDhcpClientControl.DBUS_SERVICE_INTERFACE)
+
+        self.status = DhcpLeaseStatus.DhcpLeaseStatus()
+
+        self._lease_mutex = threading.Lock()    # This mutex protects writes to the _lease_waiters, _event_queues and _lease_listeners attributes
+        self._lease_waiters = []    # DhcpPendingCall objects returned by wait_lease() that are not completed yet
+        self._event_queues = []    # One Queue per iterator returned by lease_events()
+        self._lease_listeners = []    # Callbacks installed by add_lease_listener()
+
+        self._signal_matches = []
+        self._signal_matches.append(self._dhcp_client_proxy.connect_to_signal('LeaseStateChanged',
+                                                                              self._handleLeaseStateChanged,
+                                                                              dbus_interface = AsyncRemoteDhcpClientControl.DBUS_SERVICE_INTERFACE,
+                                                                              byte_arrays = True))
+
+    def _call(self, method_name, *args):
+        """
+        Invoke D-Bus method method_name on the slave, asynchronously
+        Returns a DhcpPendingCall object that will be completed with the reply
+        """
+        pending_call = DhcpPendingCall()
+        getattr(self._dbus_iface, method_name)(*args,
+                                               reply_handler = lambda *reply: pending_call._setResult(reply[0] if reply else None),
+                                               error_handler = pending_call._setException)
+        return pending_call
+
+    def discover(self):
+        """
+        Instruct the slave to send a DHCP DISCOVER
+        """
+        return self._call('Discover')
+
+    def release(self):
+        """
+        Instruct the slave to release its current lease
+        """
+        return self._call('Release')
+
+    def get_pid(self):
+        """
+        Get the PID of the slave process
+        """
+        return self._call('GetPid')
+
+    def get_version(self):
+        """
+        Get the version of the slave process
+        """
+        return self._call('GetVersion')
+
+    def wait_lease(self):
+        """
+        Wait for the slave to obtain a lease
+        Returns a DhcpPendingCall object that will be completed with the IPv4 address obtained (immediately if we already have a valid lease)
+        """
+        pending_call = DhcpPendingCall()
+        with self._lease_mutex:    # _handleLeaseStateChanged() publishes a new lease before taking this mutex, so if the lease is not valid yet, it will see our pending call
+            lease = self.status.lease
+            if lease.ipv4_lease_valid:
+                pending_call._setResult(lease.ipv4_address)
+            else:
+                self._lease_waiters.append(pending_call)
+        return pending_call
+
+    def add_lease_listener(self, callback):
+        """
+        Call callback (with a dictionary returned by DbusLeaseState.decodeLeaseState() as argument, containing at least the 'event' and 'lease_valid' keys) for each lease state change of the slave (from now on)
+        Callbacks are run from the D-Bus main loop thread, so they should not block. This allows a single thread to follow the lease state changes of many slaves
+        """
+        with self._lease_mutex:
+            self._lease_listeners.append(callback)
+
+    def remove_lease_listener(self, callback):
+        """
+        Stop calling callback (previously installed by add_lease_listener()) for lease state changes
+        """
+        with self._lease_mutex:
+            self._lease_listeners.remove(callback)
+
+    def lease_events(self, timeout = None):
+        """
+        Get an iterator over the lease state changes of the slave (from now on)
+        Each item is a dictionary returned by DbusLeaseState.decodeLeaseState(), containing at least the 'event' (eg: 'DhcpAckRecv') and 'lease_valid' keys
+        Getting the next item blocks until the slave reports a lease state change (use add_lease_listener() to follow many slaves without blocking). If timeout is specified, iteration stops when no event has been received for timeout seconds
+        Events are collected as soon as this method returns (even before iteration starts), so an iterator created before calling discover() will not miss any of its events. They are collected until iteration stops, or until the iterator is closed or garbage-collected after its first next()
+        """
+        queue = Queue.Queue()
+        with self._lease_mutex:    # Registered now rather than on the first next(), which is when the body of a generator starts running
+            self._event_queues.append(queue)
+        return self._iterEvents(queue, timeout)
+
+    def _iterEvents(self, queue, timeout):
+        """
+        Generator yielding the events put in queue (already registered in _event_queues by lease_events()), and unregistering queue when it stops
+        """
+        try:
+            while True:
+                try:
+                    yield queue.get(timeout = timeout)
+                except Queue.Empty:
+                    return
+        finally:
+            with self._lease_mutex:
+                self._event_queues.remove(queue)
+
+    def _notifyEvent(self, event):
+        """
+        Dispatch event (a dictionary) to all iterators returned by lease_events() and to all callbacks installed by add_lease_listener()
+        """
+        with self._lease_mutex:
+            for queue in self._event_queues:
+                queue.put(event)
+            lease_listeners = list(self._lease_listeners)    # Callbacks are run outside of the mutex, so that they can add or remove listeners
+        for callback in lease_listeners:
+            callback(event)
+
+    def _handleLeaseStateChanged(self, lease_state, **kwargs):
+        """
+        Method called when receiving the LeaseStateChanged signal from the slave process
+        """
+        lease_state = DbusLeaseState.decodeLeaseState(lease_state)
+        if lease_state['event'] == 'DhcpAckRecv':
+            self.status.publish(DhcpLeaseStatus.DhcpLease.fromLeaseState(lease_state))
+            with self._lease_mutex:
+                lease_waiters = self._lease_waiters
+                self._lease_waiters = []
+            for pending_call in lease_waiters:
+                pending_call._setResult(lease_state['ipv4_address'])
+        elif not lease_state['lease_valid']:
+            self.status.reset()
+        self._notifyEvent(lease_state)
+
+    def close(self):
+        """
+        Stop receiving signals from the slave
+        Pending wait_lease() calls fail with exception ClosedRemoteDhcpClientControl
+        """
+        for match in self._signal_matches:
+            match.remove()
+        self._signal_matches = []
+        if not self._dbus_address is None:
+            self._bus.close()    # Peer-to-peer connections are private to this object
+        with self._lease_mutex:
+            lease_waiters = self._lease_waiters
+            self._lease_waiters = []
+        for pending_call in lease_waiters:
+            pending_call._setException(Exception('ClosedRemoteDhcpClientControl'))
+
+
+dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)    # Use Glib's mainloop as the default loop for all subsequent code
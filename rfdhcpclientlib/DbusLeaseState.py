@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""
+Encoding/decoding of the typed a{sv} dictionary carried by the LeaseStateChanged D-Bus signal (and returned by the GetLease D-Bus method)
+The dictionary always contains:
+- 'event' (string): the DHCP transition that triggered this signal (eg: 'DhcpAckRecv'). This key is absent from the dictionary returned by GetLease
+- 'lease_valid' (boolean): whether the DHCP client has a valid lease after this transition
+It may also contain (depending on the event):
+- 'ifname' (string): the network interface of the DHCP client
+- 'ip', 'netmask', 'defaultgw', 'serverid' (byte arrays): IPv4 addresses in network byte order
+- 'dns' (array of byte arrays): IPv4 addresses of the DNS servers
+- 'leasetime' (uint32): the lease duration in seconds
+- 'ip_config_applied' (boolean): whether the lease has been applied to the network interface
+"""
+
+import socket
+
+import dbus
+
+LEASE_STATE_IPV4_KEYS = {'ip': 'ipv4_address',
+                         'netmask': 'ipv4_netmask',
+                         'defaultgw': 'ipv4_defaultgw',
+                         'serverid': 'ipv4_dhcpserverid'}    # Keys of the dictionary holding one IPv4 address, with the name of the corresponding DhcpLeaseStatus attribute
+
+def ipv4ToDbus(ipv4_address):
+    """
+    Convert a dotted-decimal IPv4 address string into a D-Bus byte array
+    """
+    return dbus.ByteArray(socket.inet_aton(str(ipv4_address)))
+
+def ipv4FromDbus(value):
+    """
+    Convert an IPv4 address received as a D-Bus byte array (or array of bytes) into a dotted-decimal string
+    """
+    return socket.inet_ntoa(str(bytearray(value)))
+
+def encodeLeaseState(event, lease_valid, ifname = None, ip = None, netmask = None, defaultgw = None, serverid = None, dns = None, leasetime = None, ip_config_applied = None):
+    """
+    Build the dictionary to send in a LeaseStateChanged D-Bus signal (or, if event is None, to return from the GetLease D-Bus method)
+    IPv4 addresses are provided as dotted-decimal strings, dns is a list of such strings. Arguments left to None are not included
+    """
+    lease_state = {'lease_valid': dbus.Boolean(lease_valid)}
+    if not event is None:
+        lease_state['event'] = dbus.String(event)
+    if not ifname is None:
+        lease_state['ifname'] = dbus.String(ifname)
+    for (key, value) in (('ip', ip), ('netmask', netmask), ('defaultgw', defaultgw), ('serverid', serverid)):
+        if value:
+            lease_state[key] = ipv4ToDbus(value)
+    if not dns is None:
+        lease_state['dns'] = dbus.Array([ipv4ToDbus(server) for server in dns if server], signature = 'ay')
+    if not leasetime is None:
+        lease_state['leasetime'] = dbus.UInt32(leasetime)
+    if not ip_config_applied is None:
+        lease_state['ip_config_applied'] = dbus.Boolean(ip_config_applied)
+    return dbus.Dictionary(lease_state, signature = 'sv')
+
+def decodeLeaseState(lease_state):
+    """
+    Convert the dictionary received in a LeaseStateChanged D-Bus signal (or returned by GetLease) into a dictionary of native Python values
+    Keys holding lease details are renamed after the corresponding DhcpLeaseStatus attributes (eg: 'ip' becomes 'ipv4_address'), IPv4 addresses are returned as dotted-decimal strings
+    """
+    result = {'lease_valid': bool(lease_state['lease_valid'])}
+    if 'event' in lease_state:
+        result['event'] = str(lease_state['event'])
+    if 'ifname' in lease_state:
+        result['ifname'] = str(lease_state['ifname'])
+    for (key, attribute) in LEASE_STATE_IPV4_KEYS.iteritems():
+        if key in lease_state:
+            result[attribute] = ipv4FromDbus(lease_state[key])
+    if 'dns' in lease_state:
+        result['ipv4_dnslist'] = [ipv4FromDbus(server) for server in lease_state['dns']]
+    if 'leasetime' in lease_state:
+        result['ipv4_lease_duration'] = int(lease_state['leasetime'])
+    if 'ip_config_applied' in lease_state:
+        result['ip_config_applied'] = bool(lease_state['ip_config_applied'])
+    return result
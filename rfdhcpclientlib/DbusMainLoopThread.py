@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+import gobject
+import dbus.mainloop.glib
+
+class DbusMainLoopThread:
+    """
+    GLib main loop running in a background thread
+    One single instance (see getShared()) is shared by all objects of this process that need to receive D-Bus signals or asynchronous D-Bus replies, so that we never run more than one main loop thread, whatever the number of remote DHCP clients we control
+    """
+
+    _shared = None    # The shared DbusMainLoopThread instance
+    _shared_mutex = threading.Lock()    # This mutex protects writes to the _shared attribute
+
+    def __init__(self):
+        gobject.threads_init()    # Allow the mainloop to run as an independent thread
+        dbus.mainloop.glib.threads_init()
+        self._loop = gobject.MainLoop()
+        self._thread = threading.Thread(target = self._loop.run)
+        self._thread.setDaemon(True)    # Main loop should be forced to terminate when main program exits
+        self._thread.start()
+
+    @classmethod
+    def getShared(cls):
+        """
+        Get the DbusMainLoopThread instance shared by the whole process (start it if needed)
+        """
+        with cls._shared_mutex:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def isCurrentThread(self):
+        """
+        Are we running within the thread of this main loop?
+        """
+        return threading.current_thread() is self._thread
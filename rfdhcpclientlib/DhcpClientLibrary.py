@@ -8,18 +8,32 @@ import sys
 import threading
 import atexit
 
-import gobject
-import dbus
-import dbus.mainloop.glib
-
 import time
 import datetime
+import collections
 import subprocess
 import signal
+import shutil
+import socket
+
+try:
+    import dbus
+    import dbus.connection
+    import dbus.mainloop.glib
+    
+    import DbusLeaseState
+    import DbusMainLoopThread
+except ImportError:
+    dbus = None    # dbus-python or GLib are not installed, only UnixSocketRemoteDhcpClientControl can be used
 
 import DhcpLeaseStatus
+import DhcpEventJournal
+import DhcpControlChannel
+import LeaseTimerScheduler
+import DhcpOfferSelector
+from MonotonicClock import monotonic
 
-import tempfile # Temporary to debug TimeoutOnGetVersion
+import tempfile
 
 if __name__ != '__main__':
     from robot.api import logger
@@ -71,63 +85,51 @@ class RemoteDhcpClientControl:
     DBUS_NAME = 'com.legrandelectric.RobotFrameworkIPC.DhcpClientLibrary'    # The name of bus we are connecting to on D-Bus
     DBUS_OBJECT_ROOT = '/com/legrandelectric/RobotFrameworkIPC/DhcpClientLibrary'    # The name of the D-Bus object under which we will communicate on D-Bus
     DBUS_SERVICE_INTERFACE = 'com.legrandelectric.RobotFrameworkIPC.DhcpClientLibrary'    # The name of the D-Bus service under which we will perform input/output on D-Bus
+    DBUS_UNSERVED_OBJECT_ERRORS = ['org.freedesktop.DBus.Error.UnknownObject', 'org.freedesktop.DBus.Error.UnknownMethod']    # Errors returned by a bus name owner that does not serve our object path (eg: another slave, running on another interface)
 
-    def __init__(self, ifname):
+    def __init__(self, ifname, dbus_address = None):
         """
         Instantiate a new RemoteDhcpClientControl object that represents a DHCP client remotely-controlled via D-Bus
         This RemoteDhcpClientControl object will mimic the status/methods of the remotely-controlled DHCP client so that we can interact with RemoteDhcpClientControl without any knowledge of the actual remotely-controller DHCP client
+        If dbus_address is provided, we connect directly (peer-to-peer) to the slave listening on this D-Bus address (see the --dbus-address option of the slave), otherwise we reach the slave via its name on the D-Bus system bus
         """
 
-        self._dbus_loop = gobject.MainLoop()
-        self._bus = dbus.SystemBus()
-        wait_bus_owner_timeout = 5  # Wait for 5s to have an owner for the bus name we are expecting
-        logger.debug('Going to wait for an owner on bus name ' + RemoteDhcpClientControl.DBUS_NAME)
-        while not self._bus.name_has_owner(RemoteDhcpClientControl.DBUS_NAME):
-            time.sleep(0.2)
-            wait_bus_owner_timeout -= 0.2
-            if wait_bus_owner_timeout <= 0: # We timeout without having an owner for the expected bus name
-                raise Exception('No owner found for bus name ' + RemoteDhcpClientControl.DBUS_NAME)
+        if dbus is None:
+            raise Exception('DbusNotAvailable')
+        self._initSlaveState(ifname)
         
-        logger.debug('Got an owner for bus name ' + RemoteDhcpClientControl.DBUS_NAME)
-        gobject.threads_init()    # Allow the mainloop to run as an independent thread
-        dbus.mainloop.glib.threads_init()
+        self._dbus_address = dbus_address
+        if self._dbus_address is None:
+            self._bus = dbus.SystemBus()
+        DbusMainLoopThread.DbusMainLoopThread.getShared()    # Make sure D-Bus messages are handled in the background (by the main loop thread shared by all RemoteDhcpClientControl objects of this process)
         
-        dbus_object_name = RemoteDhcpClientControl.DBUS_OBJECT_ROOT + '/' + str(ifname)
-        logger.debug('Going to communicate with object ' + dbus_object_name)
-        self._dhcp_client_proxy = self._bus.get_object(RemoteDhcpClientControl.DBUS_SERVICE_INTERFACE, dbus_object_name)
-        self._dbus_iface = dbus.Interface(self._dhcp_client_proxy, RemoteDhcpClientControl.DBUS_SERVICE_INTERFACE)
+        self._dhcp_client_proxy = None
+        self._dbus_iface = None
+        self._signal_matches = []    # All D-Bus signal receivers we installed (they will be removed by exit())
         
-        logger.debug("Connected to D-Bus")
-        self._dhcp_client_proxy.connect_to_signal("IpConfigApplied",
-                                                  self._handleIpConfigApplied,
-                                                  dbus_interface = RemoteDhcpClientControl.DBUS_SERVICE_INTERFACE,
-                                                  message_keyword='dbus_message')   # Handle the IpConfigApplied signal
-        
-        self._dhcp_client_proxy.connect_to_signal("LeaseLost",
-                                                  self._handleLeaseLost,
-                                                  dbus_interface = RemoteDhcpClientControl.DBUS_SERVICE_INTERFACE,
-                                                  message_keyword='dbus_message')   # Handle the IpConfigApplied signal
-        
-        #Lionel: the following line is used for D-Bus debugging only
-        #self._bus.add_signal_receiver(catchall_signal_handler, interface_keyword='dbus_interface', member_keyword='member')
-        self._dbus_loop_thread = threading.Thread(target = self._loopHandleDbus)    # Start handling D-Bus messages in a background thread
-        self._dbus_loop_thread.setDaemon(True)    # D-Bus loop should be forced to terminate when main program exits
-        self._dbus_loop_thread.start()
+        self._exit_unlock_event = threading.Event() # Create a new threading event that will allow the exit() method to wait for the child to terminate properly
+        self._bus_owner_event = threading.Event() # Create a new threading event that will be set as soon as the slave owns the bus name we are expecting
+        self._getversion_unlock_event = threading.Event() # Create a new threading event that will allow the GetVersion() D-Bus call below to execute within a timed limit 
+        self._getversion_error = None
         
-        self._bus.watch_name_owner(RemoteDhcpClientControl.DBUS_NAME, self._handleBusOwnerChanged) # Install a callback to run when the bus owner changes
+        self._bus_owner_watch = None
         
-        self._callback_new_lease_mutex = threading.Lock()    # This mutex protects writes to the _callback_new_lease attribute
-        self._callback_new_lease = None
+        if self._dbus_address is None:
+            #Lionel: the following line is used for D-Bus debugging only
+            #self._bus.add_signal_receiver(catchall_signal_handler, interface_keyword='dbus_interface', member_keyword='member')
+            
+            logger.debug('Going to wait for an owner on bus name ' + RemoteDhcpClientControl.DBUS_NAME)
+            self._bus_owner_watch = self._bus.watch_name_owner(RemoteDhcpClientControl.DBUS_NAME, self._handleBusOwnerChanged) # Install a callback to run when the bus owner changes (it will also connect to the slave as soon as it gets the bus name)
+            if not self._bus_owner_event.wait(5):  # Wait for 5s to have an owner for the bus name we are expecting
+                self._bus_owner_watch.cancel()
+                raise Exception('No owner found for bus name ' + RemoteDhcpClientControl.DBUS_NAME)
+            
+            logger.debug('Got an owner for bus name ' + RemoteDhcpClientControl.DBUS_NAME)
+        else:
+            self._connectToPeer(5)    # Give 5s for the slave to listen on its D-Bus address
         
-        self._exit_unlock_event = threading.Event() # Create a new threading event that will allow the exit() method to wait for the child to terminate properly
-        self._getversion_unlock_event = threading.Event() # Create a new threading event that will allow the GetVersion() D-Bus call below to execute within a timed limit 
-
-        self.status = DhcpLeaseStatus.DhcpLeaseStatus()
-
-        self._getversion_unlock_event.clear()
-        self._remote_version = ''
-        self._dbus_iface.GetVersion(reply_handler = self._getVersionUnlock, error_handler = self._getVersionError)
         if not self._getversion_unlock_event.wait(10):   # We give 10s for slave to answer the GetVersion() request
+            self._disconnectFromSlave()
             logfile = tempfile.NamedTemporaryFile(prefix='TimeoutOnGetVersion-', suffix='.log', delete=False)
             if logfile:
                 print('Saving TimeoutOnGetVersion environment dump to file "' + logfile.name + '"', file=sys.stderr)
@@ -137,22 +139,134 @@ class RemoteDhcpClientControl:
                 subprocess.call('dbus-send --system --type=method_call --print-reply --dest=com.legrandelectric.RobotFrameworkIPC.DhcpClientLibrary /com/legrandelectric/RobotFrameworkIPC/DhcpClientLibrary/eth1 com.legrandelectric.RobotFrameworkIPC.DhcpClientLibrary.GetVersion', stdout=logfile, shell=True)
                 logfile.close()
             raise Exception('TimeoutOnGetVersion')
+        elif not self._getversion_error is None:
+            self._disconnectFromSlave()
+            logger.warn('Error on invocation of GetVersion() to slave, via D-Bus')
+            raise Exception('ErrorOnDBusGetVersion')
         else:
             logger.debug('Slave version: ' + self._remote_version)        
+    
+    def _initSlaveState(self, ifname):
+        """
+        Initialise our record of the slave's lease and events (this does not depend on the transport used to communicate with the slave)
+        """
+        self._ifname = ifname
+        
+        self._callback_new_lease_mutex = threading.Lock()    # This mutex protects writes to the _callback_new_lease and _callback_lease_expired attributes
+        self._callback_new_lease = None
+        self._callback_lease_expired = None
+        
+        self._slave_lost = False    # Will be set to True if the slave releases its bus name (eg: it terminated)
+
+        self.status = DhcpLeaseStatus.DhcpLeaseStatus()
+        self.journal = DhcpEventJournal.DhcpEventJournal()    # All DHCP transitions reported by the slave
+        self._expiry_timer = None    # LeaseTimer that will invalidate our record of the current lease when it expires (all RemoteDhcpClientControl objects share the same timer thread)
+
+        self._remote_version = ''
+        self.connect_timestamps = {}    # Monotonic timestamps of the steps of the connection to the slave ('bus_owner', 'signals_subscribed', 'version_received')
+    
+    def _connectToPeer(self, timeout):
+        """
+        Open a peer-to-peer D-Bus connection to the slave listening on self._dbus_address, retrying for up to timeout seconds (the slave may not listen yet), then connect to its D-Bus object
+        """
+        logger.debug('Going to connect to slave on D-Bus address ' + self._dbus_address)
+        deadline = monotonic() + timeout
+        while True:
+            try:
+                self._bus = dbus.connection.Connection(self._dbus_address)
+                break
+            except dbus.exceptions.DBusException:
+                if monotonic() >= deadline:
+                    raise Exception('No slave listening on D-Bus address ' + self._dbus_address)
+                time.sleep(0.01)
+        self._bus.call_on_disconnection(self._handlePeerDisconnected)
+        logger.debug('Connected to slave on D-Bus address ' + self._dbus_address)
+        self._connectToSlave(None)    # There is no bus daemon, so no bus name to resolve: messages go straight to the slave
+        self._bus_owner_event.set()
+    
+    def _handlePeerDisconnected(self, conn):
+        """
+        Callback called when our peer-to-peer D-Bus connection to the slave is closed (eg: the slave terminated)
+        """
+        logger.warn('Lost peer-to-peer D-Bus connection to slave on ' + self._dbus_address)
+        self._slave_lost = True
+    
+    def _connectToSlave(self, bus_owner):
+        """
+        Connect to the D-Bus object of the slave, subscribe to its signals and send the GetVersion() handshake
+        This method is run from the D-Bus main loop thread, as soon as the slave owns the bus name (bus_owner is its unique name), so that the handshake is pipelined right after the slave is ready
+        With a peer-to-peer connection, bus_owner is None and this method is run as soon as the connection to the slave is opened
+        """
+        self.connect_timestamps['bus_owner'] = monotonic()
+        dbus_object_name = RemoteDhcpClientControl.DBUS_OBJECT_ROOT + '/' + str(self._ifname)
+        logger.debug('Going to communicate with object ' + dbus_object_name)
+        self._dhcp_client_proxy = self._bus.get_object(bus_owner, dbus_object_name, introspect = False)    # Use the unique name we already got, no need for another name lookup or for introspection
+        self._dbus_iface = dbus.Interface(self._dhcp_client_proxy, RemoteDhcpClientControl.DBUS_SERVICE_INTERFACE)
+        
+        logger.debug("Connected to D-Bus")
+        self._signal_matches.append(self._dhcp_client_proxy.connect_to_signal("LeaseStateChanged",
+                                                                              self._handleLeaseStateChanged,
+                                                                              dbus_interface = RemoteDhcpClientControl.DBUS_SERVICE_INTERFACE,
+                                                                              message_keyword='dbus_message',
+                                                                              byte_arrays=True))   # Handle the LeaseStateChanged signal
+        self.connect_timestamps['signals_subscribed'] = monotonic()
+        
+        self._dbus_iface.GetVersion(reply_handler = self._getVersionUnlock, error_handler = self._getVersionError)
+    
+    def _disconnectFromSlave(self):
+        """
+        Stop receiving signals from the slave and stop following the owner of its bus name (or close our peer-to-peer connection to the slave)
+        """
+        for match in self._signal_matches:
+            match.remove()
+        self._signal_matches = []
+        if not self._bus_owner_watch is None:
+            self._bus_owner_watch.cancel()
+            self._bus_owner_watch = None
+        if not self._dbus_address is None:
+            self._bus.close()    # Peer-to-peer connections are private to this object
         
     # D-Bus-related methods
+    def _callRemote(self, method, timeout = 25):
+        """
+        Invoke method (one of DhcpControlChannel.CONTROL_METHODS) on the slave, and wait up to timeout seconds for its return value
+        This is the only method that subclasses need to override to use another transport for commands
+        """
+        if self._dbus_iface is None:
+            raise Exception('Method invoked on non existing D-Bus interface')
+        return getattr(self._dbus_iface, method)(timeout = timeout)
+    
     def getRemotePid(self):
-        return self._dbus_iface.GetPid()
+        return self._callRemote('GetPid')
     
-    def _loopHandleDbus(self):
+    def getTimingStatistics(self):
         """
-        This method should be run within a thread... This thread's aim is to run the Glib's main loop while the main thread does other actions in the meantime
-        This methods will loop infinitely to receive and send D-Bus messages and will only stop looping when the value of self._loopDbus is set to False (or when the Glib's main loop is stopped using .quit()) 
+        Get the latency statistics of the DHCP exchanges measured by the slave
+        Returns a dictionary indexed by exchange type ('discover_offer', 'request_ack', 'renew_ack'), each value being a dictionary with the number of exchanges ('count'), the number of retransmitted requests ('retransmissions') and, if there was at least one exchange, 'min', 'max', 'mean', 'p50', 'p90' and 'p99' durations (in seconds)
         """
-        logger.debug("Starting dbus mainloop")
-        self._dbus_loop.run()
-        logger.debug("Stopping dbus mainloop")
-        
+        remote_stats = self._callRemote('GetStats')
+        stats = {}
+        for (exchange, exchange_stats) in remote_stats.iteritems():
+            stats[str(exchange)] = dict([(str(key), int(value) if key in ['count', 'retransmissions'] else float(value)) for (key, value) in exchange_stats.iteritems()])
+        return stats
+    
+    def getOfferStatistics(self):
+        """
+        Get the statistics of the OFFERs received by the slave from each DHCP server
+        Returns a dictionary indexed by server identifier, each value being a dictionary with the number of OFFERs received ('count'), the number of these OFFERs selected by the slave ('selected') and, if there was at least one OFFER, 'min', 'max', 'mean', 'p50', 'p90' and 'p99' latencies (in seconds)
+        """
+        remote_stats = self._callRemote('GetOfferStats')
+        stats = {}
+        for (server_id, server_stats) in remote_stats.iteritems():
+            stats[str(server_id)] = dict([(str(key), int(value) if key in ['count', 'selected'] else float(value)) for (key, value) in server_stats.iteritems()])
+        return stats
+    
+    def getLease(self):
+        """
+        Get the whole current lease of the slave in one single request, so that all its values belong to the same lease (even if a renew occurs meanwhile)
+        Returns a dictionary with the key 'lease_valid' and, if the lease is valid, the lease details named after the DhcpLeaseStatus attributes (eg: 'ipv4_address', 'ipv4_dnslist'), as returned by DbusLeaseState.decodeLeaseState()
+        """
+        return DbusLeaseState.decodeLeaseState(self._callRemote('GetLease'))
     
     def _getVersionUnlock(self, return_value):
         """
@@ -160,16 +274,27 @@ class RemoteDhcpClientControl:
         It is run as a reply_handler to unlock the wait() on _getversion_unlock_event
         """
         #logger.debug('_getVersionUnlock() called')
+        self.connect_timestamps['version_received'] = monotonic()
         self._remote_version = str(return_value)
         self._getversion_unlock_event.set() # Unlock the wait() on self._getversion_unlock_event
         
     def _getVersionError(self, remote_exception):
         """
         This method is used as a callback for asynchronous D-Bus method call to GetVersion()
-        It is run as an error_handler to raise an exception when the call to GetVersion() failed
-        """
-        logger.warn('Error on invocation of GetVersion() to slave, via D-Bus')
-        raise Exception('ErrorOnDBusGetVersion')
+        It is run as an error_handler to unlock the wait() on _getversion_unlock_event and record that the call to GetVersion() failed
+        If the current owner of our bus name does not serve our object path, this owner is another slave (eg: a warm slave running on another interface) and the slave we expect has only queued its request for the bus name: we keep on waiting until it owns the bus name
+        """
+        if self._dbus_address is None and isinstance(remote_exception, dbus.exceptions.DBusException) and remote_exception.get_dbus_name() in RemoteDhcpClientControl.DBUS_UNSERVED_OBJECT_ERRORS:
+            logger.debug('Owner of bus name ' + RemoteDhcpClientControl.DBUS_NAME + ' does not serve interface ' + str(self._ifname) + ', waiting for another owner')
+            for match in self._signal_matches:
+                match.remove()
+            self._signal_matches = []
+            self._dhcp_client_proxy = None
+            self._dbus_iface = None
+            self._bus_owner_event.clear()    # _handleBusOwnerChanged() will connect to the next owner of the bus name
+            return
+        self._getversion_error = remote_exception
+        self._getversion_unlock_event.set() # Unlock the wait() on self._getversion_unlock_event
         
     def notifyNewLease(self, callback):
         """
@@ -179,49 +304,92 @@ class RemoteDhcpClientControl:
         if not hasattr(callback, '__call__'):
             raise Exception('WrongCallback')
         else:
-            with self.status._dhcp_status_mutex:
-                if self.status.ipv4_lease_valid:
+            with self._callback_new_lease_mutex:    # _handleNewLease() publishes the new lease before taking this mutex, so if the lease is not valid yet, it will see our callback
+                if self.status.lease.ipv4_lease_valid:
                     callback()  # Call callback function right now if lease is already valid
-                else:   # We still hold the mutex here because we don't want ipv4_lease_valid to be changed before we install the callback ;-)
-                    with self._callback_new_lease_mutex:
-                        self._callback_new_lease = callback
-    
-    def _handleIpConfigApplied(self, interface, ip, netmask, defaultgw, leasetime, dns_space_sep, serverid, **kwargs):
-        """
-        Method called when receiving the IpConfigApplied signal from the slave process
-        """
-        logger.debug('Got signal IpConfigApplied')
-        with self.status._dhcp_status_mutex:
-            self.status.ipv4_address = ip
-            self.status.ipv4_netmask = netmask
-            self.status.ipv4_defaultgw = defaultgw
-            self.status.ipv4_dhcpserverid = serverid
-            self.status.ipv4_lease_valid = True
-            self.status.ipv4_lease_duration = leasetime
-            self.status.ipv4_lease_expiry = datetime.datetime.now() + datetime.timedelta(seconds = int(leasetime))    # Calculate the time when the lease will expire
-            logger.debug('Lease obtained for IP: ' + ip + '. Will expire at ' + str(self.status.ipv4_lease_expiry))
-            self.status.ipv4_dnslist = dns_space_sep.split(' ')
-            if self.status.ipv4_dnslist:
-                logger.debug('Got DNS list: ' + str(self.status.ipv4_dnslist))
+                else:
+                    self._callback_new_lease = callback
+    
+    def notifyLeaseExpired(self, callback):
+        """
+        This method will call the specified callback each time the current lease expires without having been renewed (see _handleLeaseExpired())
+        callback must me callable or an exception will be raised
+        """
+        if not hasattr(callback, '__call__'):
+            raise Exception('WrongCallback')
+        else:
+            with self._callback_new_lease_mutex:
+                self._callback_lease_expired = callback
+    
+    def _handleLeaseStateChanged(self, lease_state, **kwargs):
+        """
+        Method called when receiving the LeaseStateChanged signal from the slave process
+        """
+        self._handleLeaseState(DbusLeaseState.decodeLeaseState(lease_state))
+    
+    def _handleLeaseState(self, lease_state):
+        """
+        Update our record of the lease according to the DHCP transition lease_state (a dictionary returned by DbusLeaseState.decodeLeaseState()) reported by the slave
+        """
+        logger.debug('Got signal LeaseStateChanged for event ' + lease_state['event'])
+        if lease_state['event'] == 'DhcpAckRecv':
+            self._handleNewLease(lease_state)
+        elif not lease_state['lease_valid']:
+            logger.debug('Lease lost')
+            self._cancelExpiryTimer()
+            self.status.reset() # Reset all data about the previous lease
+        self.journal.record(lease_state)    # Record the event once our status is up to date, so that threads waiting for it see the new status
+    
+    def _handleNewLease(self, lease_state):
+        """
+        Record the new lease described by lease_state (a dictionary returned by DbusLeaseState.decodeLeaseState())
+        """
+        lease = DhcpLeaseStatus.DhcpLease.fromLeaseState(lease_state)
+        self._cancelExpiryTimer()
+        self.status.publish(lease)
+        # Do not only rely on the slave to tell us when the lease expires (it may be frozen or lost), invalidate the lease on our side too
+        self._expiry_timer = LeaseTimerScheduler.ThreadedLeaseTimerScheduler.getShared().schedule(lease.ipv4_lease_deadline - monotonic(), self._handleLeaseExpired, lease)
+        logger.debug('Lease obtained for IP: ' + lease.ipv4_address + '. Will expire at ' + str(lease.ipv4_lease_expiry))
+        if lease.ipv4_dnslist:
+            logger.debug('Got DNS list: ' + str(list(lease.ipv4_dnslist)))
         with self._callback_new_lease_mutex:
             if not self._callback_new_lease is None:    # If we have a callback to call when lease becomes valid
                 self._callback_new_lease()    # Do the callback
-
-        # Lionel: FIXME: should start a timeout here to make the lease invalid at expiration (note: the client also does the same, and should issue a LeaseLost signal accordingly but just in case, shouldn't we double check on this side? 
-        
-    def _handleLeaseLost(self, **kwargs):
-        logger.debug('Got signal LeaseLost')
-        self.status.reset() # Reset all data about the previous lease
+    
+    def _handleLeaseExpired(self, lease):
+        """
+        Callback called by the shared timer thread when lease (a DhcpLease object) reaches its expiry deadline
+        """
+        with self._callback_new_lease_mutex:    # _handleNewLease() calls the new lease callback with this mutex held, so a lease published right after this expiry is still notified after our callback
+            expired = self.status.expire(lease)    # Only if no new lease was published meanwhile
+            if expired and not self._callback_lease_expired is None:
+                self._callback_lease_expired()
+        if expired:
+            logger.debug('Lease for IP ' + lease.ipv4_address + ' expired')
+            self.journal.record({'event': 'LeaseExpired', 'lease_valid': False, 'ifname': self._ifname})
+    
+    def _cancelExpiryTimer(self):
+        """
+        Cancel the timer that would invalidate the current lease at expiry (if any)
+        """
+        expiry_timer = self._expiry_timer
+        self._expiry_timer = None
+        if not expiry_timer is None:
+            expiry_timer.cancel()
     
     def _handleBusOwnerChanged(self, new_owner):
         """
         Callback called when our D-Bus bus owner changes 
         """
         if new_owner == '':
+            if not self._bus_owner_event.is_set():
+                return # Slave has not claimed the bus name yet, keep on waiting
             logger.warn('No owner anymore for bus name ' + RemoteDhcpClientControl.DBUS_NAME)
+            self._slave_lost = True
             raise Exception('LostDhcpSlave')
-        else:
-            pass # Owner exists
+        elif not self._bus_owner_event.is_set():    # Slave just claimed the bus name
+            self._connectToSlave(new_owner)
+            self._bus_owner_event.set()
 
     def _exitUnlock(self):
         """
@@ -239,84 +407,216 @@ class RemoteDhcpClientControl:
             raise Exception('Method invoked on non existing D-Bus interface')
         self._dbus_iface.Release(reply_handler = self._exitUnlock, error_handler = self._exitUnlock) # Call Exit() but ignore whether it gets acknowledged or not... this is because slave process may terminate before even acknowledge
         self._exit_unlock_event.wait(timeout = 5) # Give 5s for slave to acknowledge the Exit() D-Bus method call... otherwise, ignore and continue
-        # Once we have instructed the slave to send a Release, we can stop our own D-Bus loop (we won't communicate with the slave anymore)
-        # Stop the dbus loop
-        if not self._dbus_loop is None:
-            self._dbus_loop.quit()
-        
-        self._dbus_loop = None
+        self._cancelExpiryTimer()
+        # Once we have instructed the slave to send a Release, we can stop receiving its signals (we won't communicate with the slave anymore)
+        # Note: the main loop itself is shared with other RemoteDhcpClientControl objects, so it keeps running
+        self._disconnectFromSlave()
         
         logger.debug('Sending Exit() to remote DHCP client')
         self._exit_unlock_event.clear()
     
+    def isSlaveAlive(self):
+        """
+        Is the slave still owning its D-Bus name or connected to us (and thus able to process our requests)?
+        """
+        return not self._slave_lost
+    
+    def reset(self):
+        """
+        Ask the remote client (via D-Bus) to release its lease and get back to its startup state, without terminating it
+        Our own record of the lease is also reset, and the callback installed by notifyNewLease() is removed, so that this object can be reused for a new DHCP exchange
+        """
+        logger.debug('Sending Reset() to remote DHCP client')
+        self._callRemote('Reset', timeout = 5)
+        self._cancelExpiryTimer()
+        self.status.reset()
+        with self._callback_new_lease_mutex:
+            self._callback_new_lease = None
+    
     def sendDiscover(self):
         logger.info('Instructing slave to send DISCOVER')
-        self._dbus_iface.Discover() # Ask slave process to send a DHCP discover
+        self._callRemote('Discover') # Ask slave process to send a DHCP discover
     
     def getIpv4Address(self):
         """
         Get the current IPv4 address obtained by the DHCP client or None if we have no valid lease
         Returns it as string containing a dotted-decimal IPv4 address
         """
-        with self.status._dhcp_status_mutex:
-            if self.status.ipv4_lease_valid is None:
-                return None
-            else:
-                return self.status.ipv4_address
+        lease = self.status.lease
+        if not lease.ipv4_lease_valid:
+            return None
+        else:
+            return lease.ipv4_address
     
     def getIpv4Netmask(self):
         """
         Get the current IPv4 netmask obtained by the DHCP client or None if we have no valid lease
         Returns it as string containing a dotted-decimal IPv4 address
         """
-        with self.status._dhcp_status_mutex:
-            if self.status.ipv4_lease_valid is None:
-                return None
-            else:
-                return self.status.ipv4_netmask
+        lease = self.status.lease
+        if not lease.ipv4_lease_valid:
+            return None
+        else:
+            return lease.ipv4_netmask
             
     def getIpv4DefaultGateway(self):
         """
         Get the current IPv4 default gateway obtained by the DHCP client or None if we have no valid lease
         Returns it as string containing a dotted-decimal IPv4 address
         """
-        with self.status._dhcp_status_mutex:
-            if self.status.ipv4_lease_valid is None:
-                return None
-            else:
-                return self.status.ipv4_defaultgw
+        lease = self.status.lease
+        if not lease.ipv4_lease_valid:
+            return None
+        else:
+            return lease.ipv4_defaultgw
 
     def getIpv4DnsList(self):
         """
         Get the current list of IPv4 DNS obtained by the DHCP client or [None] if we have no valid lease
         Returns it as list of strings, each containing a dotted-decimal IPv4 address for each DNS server
         """
-        with self.status._dhcp_status_mutex:
-            if self.status.ipv4_lease_valid is None:
-                return [None]
-            else:
-                return self.status.ipv4_dnslist
+        lease = self.status.lease
+        if not lease.ipv4_lease_valid:
+            return [None]
+        else:
+            return list(lease.ipv4_dnslist)
             
     def getIpv4DhcpServerId(self):
         """
         Get the current IPv4 DHCP server ID gateway obtained by the DHCP client or None if we have no valid lease
         Returns it as string containing a dotted-decimal IPv4 address
         """
-        with self.status._dhcp_status_mutex:
-            if self.status.ipv4_lease_valid is None:
-                return None
-            else:
-                return self.status.ipv4_dhcpserverid
+        lease = self.status.lease
+        if not lease.ipv4_lease_valid:
+            return None
+        else:
+            return lease.ipv4_dhcpserverid
             
             
     def isLeaseValid(self):
         """
         Is the current lease valid?
         """
-        with self.status._dhcp_status_mutex:
-            return self.status.ipv4_lease_valid
+        return self.status.lease.ipv4_lease_valid
                 
 
+class UnixSocketRemoteDhcpClientControl(RemoteDhcpClientControl):
+
+    """
+    DHCP client object representing a remote (slave) DHCP client process, controlled over its unix control socket (see the --control-socket option of the slave) instead of D-Bus
+    Commands and DHCP transitions are carried by the compact messages of DhcpControlChannel, so neither dbus-python, GLib nor a D-Bus system bus are needed
+    Messages from the slave are read by a background thread owned by this object
+    """
+
+    def __init__(self, ifname, control_socket_path):
+        """
+        Connect to the slave listening on unix socket control_socket_path (retrying for up to 5s, as the slave may not listen yet) and perform the GetVersion() handshake
+        """
+        self._initSlaveState(ifname)
+        
+        self._control_socket_path = control_socket_path
+        self._pending_calls_mutex = threading.Lock()    # This mutex protects the _pending_calls and _next_call_id attributes
+        self._pending_calls = {}    # [threading.Event, reply message] lists for the requests waiting for a reply, indexed by request ID
+        self._next_call_id = 0
+        
+        logger.debug('Going to connect to slave on control socket ' + self._control_socket_path)
+        deadline = monotonic() + 5
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self._control_socket_path)
+                break
+            except socket.error:
+                sock.close()
+                if monotonic() >= deadline:
+                    raise Exception('No slave listening on control socket ' + self._control_socket_path)
+                time.sleep(0.01)
+        self.connect_timestamps['bus_owner'] = monotonic()
+        self._channel = DhcpControlChannel.DhcpControlChannel(sock)
+        self._reader_thread = threading.Thread(target = self._readMessages)
+        self._reader_thread.setDaemon(True)
+        self._reader_thread.start()
+        self.connect_timestamps['signals_subscribed'] = monotonic()    # The slave sends DHCP transitions to all connected peers, there is no explicit subscription
+        
+        try:
+            self._remote_version = str(self._callRemote('GetVersion', timeout = 10))
+        except Exception:
+            self._channel.close()
+            raise
+        self.connect_timestamps['version_received'] = monotonic()
+        logger.debug('Slave version: ' + self._remote_version)
+    
+    def _readMessages(self):
+        """
+        Background thread handling the replies and DHCP transitions sent by the slave, until the connection is closed
+        """
+        while True:
+            try:
+                messages = self._channel.receiveMessages()
+            except Exception:
+                messages = None
+            if messages is None:
+                break
+            for message in messages:
+                if 'event' in message:
+                    if message['event'].get('ifname') == self._ifname:
+                        self._handleLeaseState(message['event'])
+                else:
+                    with self._pending_calls_mutex:
+                        pending_call = self._pending_calls.pop(message.get('id'), None)
+                    if not pending_call is None:
+                        pending_call[1] = message
+                        pending_call[0].set()
+        if not self._slave_lost:
+            logger.warn('Lost connection to slave on control socket ' + self._control_socket_path)
+        self._slave_lost = True
+        with self._pending_calls_mutex:
+            pending_calls = self._pending_calls.values()
+            self._pending_calls = {}
+        for pending_call in pending_calls:    # Nobody will ever reply to these requests
+            pending_call[0].set()
+    
+    def _callRemote(self, method, timeout = 25):
+        if self._slave_lost:
+            raise Exception('LostDhcpSlave')
+        pending_call = [threading.Event(), None]
+        with self._pending_calls_mutex:
+            self._next_call_id += 1
+            call_id = self._next_call_id
+            self._pending_calls[call_id] = pending_call
+        self._channel.sendMessage({'id': call_id, 'ifname': self._ifname, 'method': method})
+        if not pending_call[0].wait(timeout):
+            with self._pending_calls_mutex:
+                self._pending_calls.pop(call_id, None)
+            raise Exception('TimeoutOn' + method)
+        reply = pending_call[1]
+        if reply is None:
+            raise Exception('LostDhcpSlave')
+        elif 'error' in reply:
+            raise Exception(str(reply['error']))
+        return reply.get('result')
+    
+    def getLease(self):
+        return self._callRemote('GetLease')    # The slave already decodes the lease for this transport
+    
+    def exit(self):
+        """
+        Ask the remote client to send a Release message, then close our control connection
+        """
+        logger.debug('Sending Release() to remote DHCP client')
+        try:
+            self._callRemote('Release', timeout = 5)
+        except Exception:
+            pass    # The slave may terminate before even acknowledging
+        self._cancelExpiryTimer()
+        self._slave_lost = True    # We won't communicate with the slave anymore
+        try:
+            self._channel.sock.shutdown(socket.SHUT_RDWR)    # Wake up our reader thread
+        except socket.error:
+            pass
+        self._channel.close()
+
+
 class SlaveDhcpClientProcess:
     """
     Slave DHCP client process manipulation
@@ -324,10 +624,20 @@ class SlaveDhcpClientProcess:
     dhcp_client_daemon_exec_path contains the name of the executable that implements the DHCP client
     ifname is the name of the network interface on which the DHCP client will run
     if log is set to False, no logging will be performed on the logger object 
+    if dbus_address is provided, the slave will listen for peer-to-peer D-Bus connections on this address instead of using the D-Bus system bus
+    if control_socket is provided, the slave will also accept commands on this unix socket (see DhcpControlChannel)
+    if runtime_dir is provided, this (temporary) directory holding the sockets of the slave is removed when the slave is killed
+    offer_window, offer_policy and preferred_server_id are passed to the slave to select which OFFER it requests (see rfdhcpclientlib.DhcpOfferSelector)
     """
     
-    def __init__(self, dhcp_client_daemon_exec_path, ifname, logger = None):
+    def __init__(self, dhcp_client_daemon_exec_path, ifname, logger = None, dbus_address = None, control_socket = None, runtime_dir = None, offer_window = 0, offer_policy = 'first', preferred_server_id = None):
         self._slave_dhcp_client_path = dhcp_client_daemon_exec_path
+        self._dbus_address = dbus_address
+        self._control_socket = control_socket
+        self._runtime_dir = runtime_dir
+        self._offer_window = offer_window
+        self._offer_policy = offer_policy
+        self._preferred_server_id = preferred_server_id
         self._slave_dhcp_client_proc = None
         self._slave_dhcp_client_pid = None
         self._ifname = ifname
@@ -341,6 +651,16 @@ class SlaveDhcpClientProcess:
         if self.isRunning():
             raise Exception('DhcpClientAlreadyStarted')
         cmd = ['sudo', self._slave_dhcp_client_path, '-i', self._ifname, '-A', '-S']
+        if not self._dbus_address is None:
+            cmd += ['--dbus-address', self._dbus_address]
+        if not self._control_socket is None:
+            cmd += ['--control-socket', self._control_socket]
+        if self._offer_window:
+            cmd += ['--offer-window', str(self._offer_window)]
+        if self._offer_policy != 'first':
+            cmd += ['--offer-policy', self._offer_policy]
+        if not self._preferred_server_id is None:
+            cmd += ['--preferred-server-id', self._preferred_server_id]
         if self._logger is not None:
             self._logger.debug('Running command ' + str(cmd))
         #self._slave_dhcp_client_proc = robot.libraries.Process.Process()
@@ -408,6 +728,9 @@ class SlaveDhcpClientProcess:
         
         self._slave_dhcp_client_pid = None    
         self._slave_dhcp_client_proc = None
+        
+        if not self._runtime_dir is None:
+            shutil.rmtree(self._runtime_dir, ignore_errors = True)
 
     def kill(self):
         """
@@ -478,6 +801,12 @@ class DhcpClientLibrary:
       </policy>
     </busconfig>
     
+    This is not needed when the library is imported with peer_to_peer (see
+    `Importing`): the slave then listens on a private unix socket and
+    the library connects to it directly, without going through the D-Bus
+    system bus daemon. Nor is it needed with transport=unix, that does not
+    use D-Bus at all.
+    
     - The pybot process must have permissions to run sudo on kill and on
     the slave DHCP python process (DBusControlledDhcpClient.py)  
     
@@ -522,16 +851,45 @@ class DhcpClientLibrary:
     ROBOT_LIBRARY_SCOPE = 'GLOBAL'
     ROBOT_LIBRARY_VERSION = '1.0'
 
-    def __init__(self, dhcp_client_daemon_exec_path, ifname = None):
+    def __init__(self, dhcp_client_daemon_exec_path, ifname = None, keep_slave_alive = False, peer_to_peer = False, transport = 'dbus', offer_window = 0, offer_policy = 'first', preferred_server_id = None):
         """Initialise the library
         dhcp_client_daemon_exec_path is a PATH to the executable program that run the D-Bus controlled DHCP client (will be run as root via sudo)
         ifname is the interface on which we will act as a DHCP client. If not provided, it will be mandatory to set it using Set Interface and before (or when) running Start
+        if keep_slave_alive is True, Stop will not terminate the slave process but only release its lease, and the next Start on the same interface will reuse this (warm) slave. Warm slaves are terminated by Terminate Warm Slaves or when this process exits. On the D-Bus system bus, they are also terminated by a Start on another interface (all slaves share the same bus name)
+        if peer_to_peer is True, each slave listens on a private unix socket (in a temporary directory) and we connect to it directly instead of going through the D-Bus system bus daemon
+        transport is 'dbus' (the default) or 'unix'. With 'unix', slaves are controlled over a private unix control socket with a compact protocol, without D-Bus (dbus-python is then not even needed in this process, and the slave does not need a system bus)
+        offer_window is the delay (in seconds) during which slaves collect OFFERs (after the first one) before requesting the one selected by offer_policy ('first', 'fastest', 'serverid' (the OFFER of server preferred_server_id) or 'leasetime'). By default, slaves request the first OFFER immediately
         """
         self._dhcp_client_daemon_exec_path = dhcp_client_daemon_exec_path
         self._ifname = ifname
+        if isinstance(keep_slave_alive, basestring):    # Arguments provided when importing the library in RobotFramework are strings
+            keep_slave_alive = (keep_slave_alive.lower() in ['true', 'yes', '1'])
+        self._keep_slave_alive = keep_slave_alive
+        if isinstance(peer_to_peer, basestring):
+            peer_to_peer = (peer_to_peer.lower() in ['true', 'yes', '1'])
+        self._peer_to_peer = peer_to_peer
+        if not transport in ['dbus', 'unix']:
+            raise Exception('UnknownTransport')
+        self._transport = transport
+        offer_window = float(offer_window)    # May be a string when provided in RobotFramework
+        if offer_window < 0:
+            raise Exception('InvalidOfferWindow')
+        if not offer_policy in DhcpOfferSelector.OFFER_SELECTION_POLICIES:
+            raise Exception('UnknownOfferSelectionPolicy')
+        if offer_policy == 'serverid' and preferred_server_id is None:
+            raise Exception('NoPreferredServerId')
+        self._offer_window = offer_window
+        self._offer_policy = offer_policy
+        self._preferred_server_id = preferred_server_id
+        self._warm_slaves = {}    # Slaves kept alive between Stop and Start, as (SlaveDhcpClientProcess, RemoteDhcpClientControl) tuples, indexed by interface name
+        if self._keep_slave_alive:
+            atexit.register(self.terminate_warm_slaves)    # Make sure we do not leave runaway slaves behind us
         self._slave_dhcp_process = None
         self._dhcp_client_ctrl = None    # Slave DHCP client process not started
         self._new_lease_event = threading.Event() # At initialisation, event is cleared
+        self._start_timings = None    # Duration of each phase of the last successful Start (see Get Start Timings)
+        self._event_cursor = 0    # Sequence number (in the DhcpEventJournal of the slave) of the last event recorded before the last Start (Wait For Dhcp Event ignores these events)
+        self._event_cursors = {}    # Sequence number of the last event matched by Wait For Dhcp Event, indexed by event name (each event name is matched independently)
         
     def set_interface(self, ifname):
         """Set the interface on which the DHCP client will act
@@ -575,40 +933,149 @@ class DhcpClientLibrary:
         if self._ifname is None:
             raise Exception('NoInterfaceProvided')
         
-        self._slave_dhcp_process = SlaveDhcpClientProcess(dhcp_client_daemon_exec_path=self._dhcp_client_daemon_exec_path, ifname=self._ifname, logger=logger)
+        start_timestamp = monotonic()
+        warm_slave = self._warm_slaves.pop(self._ifname, None)
+        if not warm_slave is None:
+            if warm_slave[1].isSlaveAlive():
+                (self._slave_dhcp_process, self._dhcp_client_ctrl) = warm_slave
+                logger.debug('Reusing warm DHCP client on ' + self._ifname)
+                self._new_lease_event.clear()
+                self._dhcp_client_ctrl.notifyNewLease(self._got_new_lease)
+                self._dhcp_client_ctrl.notifyLeaseExpired(self._lease_expired)
+                self._event_cursor = self._dhcp_client_ctrl.journal.getLastSequence()    # Events that occurred before this Start will be ignored by Wait For Dhcp Event
+                self._event_cursors = {}
+                self._dhcp_client_ctrl.sendDiscover()
+                discover_timestamp = monotonic()
+                self._start_timings = collections.OrderedDict([('discover', discover_timestamp - start_timestamp),
+                                                               ('total', discover_timestamp - start_timestamp)])
+                logger.debug('Start timings on ' + self._ifname + ' (warm slave): ' + ' '.join(['%s=%.3fs' % (phase, duration) for (phase, duration) in self._start_timings.iteritems()]))
+                return
+            else:
+                logger.warn('Warm DHCP client on ' + self._ifname + ' has terminated, starting a new one')
+                self._terminateSlave(*warm_slave)
+        
+        if self._transport == 'dbus' and not self._peer_to_peer and self._warm_slaves:
+            # All slaves on the system bus claim the same bus name: a new slave could not own it while a warm slave (running on another interface) holds it
+            logger.debug('Terminating warm DHCP clients on ' + ', '.join(sorted(self._warm_slaves.keys())) + ' to start a new one on ' + self._ifname)
+            self.terminate_warm_slaves()
+        
+        runtime_dir = None
+        dbus_address = None
+        control_socket = None
+        if self._transport == 'unix' or self._peer_to_peer:
+            runtime_dir = tempfile.mkdtemp(prefix='DhcpClientLibrary-')    # Private directory holding the socket of the slave
+            if self._transport == 'unix':
+                control_socket = os.path.join(runtime_dir, 'control.sock')
+            else:
+                dbus_address = 'unix:path=' + os.path.join(runtime_dir, 'slave.sock')
+        self._slave_dhcp_process = SlaveDhcpClientProcess(dhcp_client_daemon_exec_path=self._dhcp_client_daemon_exec_path, ifname=self._ifname, logger=logger, dbus_address=dbus_address, control_socket=control_socket, runtime_dir=runtime_dir, offer_window=self._offer_window, offer_policy=self._offer_policy, preferred_server_id=self._preferred_server_id)
         self._slave_dhcp_process.start()
+        spawned_timestamp = monotonic()
         self._new_lease_event.clear()
-        self._dhcp_client_ctrl = RemoteDhcpClientControl(ifname=self._ifname)    # Create a RemoteDhcpClientControl object that symbolizes the control on the remote process (over D-Bus)
-        self._dhcp_client_ctrl.notifyNewLease(self._got_new_lease)  # Ask underlying RemoteDhcpClientControl object to call self._new_lease_retrieved() as soon as we get a new lease 
-        logger.debug('DHCP client started on ' + self._ifname)
-        slave_pid = self._dhcp_client_ctrl.getRemotePid()
-        if slave_pid is None:
-            logger.warn('Could not get remote process PID')
-            raise('RemoteCommunicationError')
-        else:
-            logger.debug('Slave has PID ' + str(slave_pid))        
-            self._slave_dhcp_process.addSlavePid(slave_pid)
+        try:
+            if control_socket is None:
+                self._dhcp_client_ctrl = RemoteDhcpClientControl(ifname=self._ifname, dbus_address=dbus_address)    # Create a RemoteDhcpClientControl object that symbolizes the control on the remote process (over D-Bus)
+            else:
+                self._dhcp_client_ctrl = UnixSocketRemoteDhcpClientControl(ifname=self._ifname, control_socket_path=control_socket)
+            self._dhcp_client_ctrl.notifyNewLease(self._got_new_lease)  # Ask underlying RemoteDhcpClientControl object to call self._new_lease_retrieved() as soon as we get a new lease 
+            self._dhcp_client_ctrl.notifyLeaseExpired(self._lease_expired)    # ... and to call self._lease_expired() if this lease expires, so that Wait Ipv4 Lease waits for a new one
+            self._event_cursor = 0
+            self._event_cursors = {}
+            logger.debug('DHCP client started on ' + self._ifname)
+            connected_timestamp = monotonic()
+            slave_pid = self._dhcp_client_ctrl.getRemotePid()
+            if slave_pid is None:
+                logger.warn('Could not get remote process PID')
+                raise Exception('RemoteCommunicationError')
+            else:
+                logger.debug('Slave has PID ' + str(slave_pid))        
+                self._slave_dhcp_process.addSlavePid(slave_pid)
+            pid_timestamp = monotonic()
 
-        self._dhcp_client_ctrl.sendDiscover()
+            self._dhcp_client_ctrl.sendDiscover()
+            discover_timestamp = monotonic()
+        except:
+            logger.warn('Failed to start DHCP client on ' + self._ifname + ', terminating the slave')
+            (slave_dhcp_process, dhcp_client_ctrl) = (self._slave_dhcp_process, self._dhcp_client_ctrl)
+            self._slave_dhcp_process = None
+            self._dhcp_client_ctrl = None
+            try:
+                self._terminateSlave(slave_dhcp_process, dhcp_client_ctrl)
+            except Exception:
+                slave_dhcp_process.kill()    # The control object may not be usable, but do not leave a runaway slave behind us
+            raise
+        
+        connect_timestamps = self._dhcp_client_ctrl.connect_timestamps
+        self._start_timings = collections.OrderedDict([('spawn', spawned_timestamp - start_timestamp),
+                                                       ('bus_name_wait', connect_timestamps['bus_owner'] - spawned_timestamp),
+                                                       ('signal_subscription', connect_timestamps['signals_subscribed'] - connect_timestamps['bus_owner']),
+                                                       ('get_version', connect_timestamps['version_received'] - connect_timestamps['signals_subscribed']),
+                                                       ('get_pid', pid_timestamp - connected_timestamp),
+                                                       ('discover', discover_timestamp - pid_timestamp),
+                                                       ('total', discover_timestamp - start_timestamp)])
+        logger.debug('Start timings on ' + self._ifname + ': ' + ' '.join(['%s=%.3fs' % (phase, duration) for (phase, duration) in self._start_timings.iteritems()]))
         
     def stop(self):
         """ Stop the DHCP client
+        If the library was imported with keep_slave_alive, the slave process is not terminated: it only releases its lease and will be reused by the next Start on the same interface
 
         Example:
         | Stop |
         """
 
-        if not self._dhcp_client_ctrl is None:
-            self._dhcp_client_ctrl.exit()
-        if not self._slave_dhcp_process is None:
-            self._slave_dhcp_process.kill()
-            logger.debug('DHCP client stopped on ' + self._ifname)
+        if self._keep_slave_alive and not self._dhcp_client_ctrl is None and self._dhcp_client_ctrl.isSlaveAlive():
+            self._dhcp_client_ctrl.reset()    # Only release the lease, the slave will be reused by the next Start
+            self._warm_slaves[self._ifname] = (self._slave_dhcp_process, self._dhcp_client_ctrl)
+            logger.debug('DHCP client kept warm on ' + self._ifname)
+        else:
+            self._terminateSlave(self._slave_dhcp_process, self._dhcp_client_ctrl)
         
         self._new_lease_event.clear()
         self._dhcp_client_ctrl = None   # Destroy the control object
         self._slave_dhcp_process = None # Destroy the slave DHCP object
         
     
+    def _terminateSlave(self, slave_dhcp_process, dhcp_client_ctrl):
+        """
+        Terminate the D-Bus control over a slave and kill its process
+        """
+        if not dhcp_client_ctrl is None:
+            dhcp_client_ctrl.exit()
+        if not slave_dhcp_process is None:
+            slave_dhcp_process.kill()
+            logger.debug('DHCP client stopped on ' + slave_dhcp_process._ifname)
+    
+    def terminate_warm_slaves(self):
+        """ Terminate all slave processes kept alive by Stop (only used when the library is imported with keep_slave_alive)
+        
+        Example:
+        | Terminate Warm Slaves |
+        """
+        
+        warm_slaves = self._warm_slaves
+        self._warm_slaves = {}
+        for (slave_dhcp_process, dhcp_client_ctrl) in warm_slaves.values():
+            self._terminateSlave(slave_dhcp_process, dhcp_client_ctrl)
+    
+    def get_start_timings(self):
+        """ Get the duration (in seconds) of each phase of the last successful Start
+        
+        Return an ordered dictionary, whose keys are in the order in which the phases happened: 'spawn' (sudo launch of the slave), 'bus_name_wait' (until the slave owns its D-Bus name, or until we are connected to the slave with peer_to_peer), 'signal_subscription', 'get_version' (handshake with the slave), 'get_pid', 'discover' and 'total'
+        When Start reused a warm slave (see keep_slave_alive), only the 'discover' and 'total' keys are present
+        Durations are measured with a monotonic clock. ${None} is returned if Start has never succeeded
+        
+        Example:
+        | Start | eth1 |
+        | Get Start Timings |
+        =>
+        | ${timings} |
+        """
+        
+        if self._start_timings is None:
+            return None
+        else:
+            return collections.OrderedDict(self._start_timings)    # A copy, that still lists the phases in the order in which they happened
+    
     def restart(self):
         """ Restart the DHCP client
 
@@ -624,6 +1091,12 @@ class DhcpClientLibrary:
         Internal callback invoked when a new lease is allocated to the slave DHCP client
         """
         self._new_lease_event.set()
+    
+    def _lease_expired(self):
+        """
+        Internal callback invoked when the lease of the slave DHCP client expires without having been renewed
+        """
+        self._new_lease_event.clear()
         
         
     def wait_lease(self, timeout = None, raise_exceptions = True):
@@ -651,6 +1124,92 @@ class DhcpClientLibrary:
             return unicode(ipv4_address)
         
     
+    def wait_for_dhcp_event(self, event, timeout = None, raise_exceptions = True):
+        """ Wait (until timeout if specified) for the DHCP client to go through the DHCP transition event
+        event is one of the events of the slave's LeaseStateChanged D-Bus signal: DhcpDiscoverSent, DhcpOfferRecv, DhcpRequestSent, DhcpRenewSent, DhcpReleaseSent, DhcpAckRecv or DhcpNackRecv, or LeaseExpired (recorded by the library itself when the current lease reaches its expiry without having been renewed)
+        Events are recorded as soon as the DHCP client is started, so an event that occurred before this keyword is called is also matched, unless it was already matched by a previous call to this keyword
+        Each event name is matched independently: after waiting for DhcpAckRecv, waiting for DhcpOfferRecv still matches the OFFER that preceded this ACK. Waiting again for the same event name only matches an occurrence that was recorded after the one previously matched
+        
+        Return a dictionary describing the event (with keys 'event', 'lease_valid', 'timestamp' (from a monotonic clock, in seconds) and the lease details, if any, eg: 'ipv4_address'), or ${None} if timeout expired and raise_exceptions is False
+        
+        Example:
+        | Wait For Dhcp Event | DhcpRenewSent | 30 |
+        =>
+        | ${event} |
+        """
+        
+        if not timeout is None:
+            timeout = float(timeout)
+        event = str(event)
+        entry = self._dhcp_client_ctrl.journal.waitForEvent(event, timeout = timeout, after_sequence = max(self._event_cursor, self._event_cursors.get(event, 0)))
+        if entry is None:
+            if raise_exceptions:
+                raise Exception('DhcpEventTimeout')
+            else:
+                return None
+        self._event_cursors[event] = entry['sequence']
+        return entry
+    
+    def get_dhcp_timing_statistics(self):
+        """ Get the latency of the DHCP exchanges performed by the DHCP client since it was launched
+        Latencies are measured inside the slave (with a monotonic clock), between the time a packet is sent and the time its reply is received, so they do not include any D-Bus or RobotFramework overhead
+        
+        Return a dictionary indexed by exchange type: 'discover_offer' (DISCOVER->OFFER), 'request_ack' (REQUEST->ACK) and 'renew_ack' (renew REQUEST->ACK)
+        Each value is a dictionary with the number of exchanges ('count'), the number of retransmitted requests ('retransmissions') and, if there was at least one exchange, 'min', 'max', 'mean', 'p50', 'p90' and 'p99' durations (in seconds)
+        Durations are measured from the first transmission of the request, so they include the time spent waiting for retransmissions
+        
+        Example:
+        | Get Dhcp Timing Statistics |
+        =>
+        | ${stats} |
+        """
+        
+        return self._dhcp_client_ctrl.getTimingStatistics()
+    
+    def get_dhcp_offer_statistics(self):
+        """ Get the statistics of the OFFERs received from each DHCP server since the DHCP client was launched, to compare redundant DHCP servers
+        All OFFERs are accounted for, including the ones received after an OFFER was selected (see the offer_window and offer_policy library arguments)
+        
+        Return a dictionary indexed by server identifier (eg: '192.168.0.1')
+        Each value is a dictionary with the number of OFFERs received from this server ('count'), the number of these OFFERs that were selected ('selected') and, if there was at least one OFFER, 'min', 'max', 'mean', 'p50', 'p90' and 'p99' latencies (in seconds, measured by the slave from the first transmission of the DISCOVER)
+        
+        Example:
+        | ${stats}= | Get Dhcp Offer Statistics |
+        | Should Be True | ${stats['192.168.0.1']['p90']} < 0.5 |
+        """
+        
+        return self._dhcp_client_ctrl.getOfferStatistics()
+    
+    def get_ipv4_lease(self):
+        """ Get the whole current lease at once, so that all values are guaranteed to belong to the same lease (contrary to successive calls to Get Ipv4 Address, Get Ipv4 Netmask etc... if a renew occurs in between)
+        The lease is read from the slave in one single request
+        
+        Return a dictionary with the key 'lease_valid' and, if the lease is valid, 'ipv4_address', 'ipv4_netmask', 'ipv4_defaultgw', 'ipv4_dhcpserverid', 'ipv4_dnslist', 'ipv4_lease_duration' (in seconds), 'ip_config_applied' and 'ifname' (keys for options not provided by the DHCP server are absent)
+        
+        Example:
+        | ${lease}= | Get Ipv4 Lease |
+        | Should Be Equal | ${lease['ipv4_address']} | 192.168.0.10 |
+        """
+        
+        lease = self._dhcp_client_ctrl.getLease()
+        for (key, value) in lease.items():
+            if isinstance(value, basestring):
+                lease[key] = unicode(value)
+            elif isinstance(value, list):
+                lease[key] = map(unicode, value)
+        return lease
+    
+    def get_ipv4_lease_remaining(self):
+        """ Get the number of seconds left before the current lease expires, or ${None} if we have no currently valid lease
+        The expiry is computed locally from the lease duration and a monotonic clock (no request is sent to the slave), and the lease is invalidated as soon as it expires, even if the slave does not report it
+        
+        Example:
+        | ${remaining}= | Get Ipv4 Lease Remaining |
+        | Should Be True | ${remaining} > 1800 |
+        """
+        
+        return self._dhcp_client_ctrl.status.lease.remaining()
+    
     def get_address(self):
         """ Alias for Get Ipv4 Address
         """
@@ -783,7 +1342,8 @@ class DhcpClientLibrary:
         return self._dhcp_client_ctrl.isLeaseValid()
     
 
-dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)    # Use Glib's mainloop as the default loop for all subsequent code
+if not dbus is None:
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)    # Use Glib's mainloop as the default loop for all subsequent code
 
 if __name__ == '__main__':
     atexit.register(cleanupAtExit)
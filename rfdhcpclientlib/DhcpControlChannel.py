@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compact control protocol between DhcpClientLibrary and its slaves over a Unix domain (stream) socket, that can be used instead of D-Bus
+Each message is a JSON object (without any whitespace), preceded by its length as a 32-bit big-endian integer
+Messages sent by the library:
+- {"id": <int>, "ifname": <string>, "method": <one of CONTROL_METHODS>}: invoke a method on the DHCP client running on interface ifname
+Messages sent by the slave:
+- {"id": <int>, "result": <value>}: return value of the method invoked by the request with the same id (for GetLease, the lease is returned in the same form as in events, without 'event')
+- {"id": <int>, "error": <string>}: the method invoked by the request with the same id failed
+- {"event": <dictionary>}: a DHCP transition occurred, the dictionary has the same content as the one returned by DbusLeaseState.decodeLeaseState() (including 'ifname')
+Strings are received as str (not unicode), as with D-Bus
+"""
+
+import json
+import struct
+import socket
+import errno
+import threading
+
+CONTROL_METHODS = ['Discover', 'Renew', 'Release', 'Restart', 'Reset', 'FreezeRenew', 'GetPid', 'GetVersion', 'GetStats', 'GetOfferStats', 'GetLease']    # Methods of DBusControlledDhcpClient that can be invoked over a control socket
+
+MESSAGE_LENGTH_FORMAT = '!I'
+MESSAGE_LENGTH_SIZE = struct.calcsize(MESSAGE_LENGTH_FORMAT)
+MAX_MESSAGE_SIZE = 65536    # Bigger messages are considered as a protocol error
+MAX_SEND_BUFFER_SIZE = 1048576    # A peer that lets more unsent data accumulate on a non-blocking socket is considered as dead
+
+def encodeMessage(message):
+    """
+    Encode message (a dictionary) into a length-prefixed binary string, ready to be sent on a control socket
+    """
+    payload = json.dumps(message, separators = (',', ':'))
+    return struct.pack(MESSAGE_LENGTH_FORMAT, len(payload)) + payload
+
+def decodeStrings(value):
+    """
+    Convert the unicode strings found in value (as decoded by json.loads()) into UTF-8 encoded str, so that values received on a control socket have the same types as the ones received via D-Bus
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    elif isinstance(value, list):
+        return [decodeStrings(item) for item in value]
+    elif isinstance(value, dict):
+        return dict([(decodeStrings(key), decodeStrings(item)) for (key, item) in value.iteritems()])
+    return value
+
+class DhcpControlChannel:
+    """
+    Sends and receives length-prefixed messages on a connected stream socket
+    On a blocking socket, messages are sent with sendMessage(), that can be called from any thread. On a non-blocking socket, they are sent with queueMessage() and flush()
+    receiveMessages() should only be called when the socket is readable (if it is non-blocking), or from one single reader thread (if it is blocking)
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._send_mutex = threading.Lock()    # This mutex prevents messages sent concurrently from being interleaved, and protects the _send_buffer attribute
+        self._send_buffer = bytearray()    # Data queued by queueMessage() that could not be sent yet
+        self._receive_buffer = bytearray()
+
+    def sendMessage(self, message):
+        """
+        Send message (a dictionary) to the peer, blocking until it is entirely sent (the socket must be blocking)
+        """
+        data = encodeMessage(message)
+        with self._send_mutex:
+            self.sock.sendall(data)
+
+    def queueMessage(self, message):
+        """
+        Queue message (a dictionary) to be sent to the peer on a non-blocking socket, and send as much queued data as possible without blocking (see flush())
+        Returns True if all queued data has been sent. Will raise an exception if the peer lets too much data accumulate
+        """
+        with self._send_mutex:
+            self._send_buffer += encodeMessage(message)
+            if len(self._send_buffer) > MAX_SEND_BUFFER_SIZE:
+                raise Exception('ControlSendBufferFull')
+        return self.flush()
+
+    def flush(self):
+        """
+        Send as much data queued by queueMessage() as possible without blocking
+        Returns True if all queued data has been sent, or False if the rest should be sent once the socket is writable again
+        """
+        with self._send_mutex:
+            while self._send_buffer:
+                try:
+                    sent = self.sock.send(self._send_buffer)
+                except socket.error as ex:
+                    if ex.errno == errno.EINTR:
+                        continue
+                    elif ex.errno == errno.EAGAIN:
+                        return False
+                    raise
+                del self._send_buffer[:sent]
+            return True
+
+    def receiveMessages(self):
+        """
+        Read the data available on the socket (blocking until some data is received if the socket is blocking)
+        Returns the list of messages (dictionaries) completed by this data (it can be empty), or None if the peer closed the connection
+        """
+        try:
+            data = self.sock.recv(MAX_MESSAGE_SIZE)
+        except socket.error as ex:
+            if ex.errno in [errno.EAGAIN, errno.EINTR]:
+                return []
+            elif ex.errno == errno.ECONNRESET:
+                return None
+            raise
+        if not data:
+            return None
+        buffer = self._receive_buffer
+        buffer += data
+        messages = []
+        offset = 0
+        while len(buffer) - offset >= MESSAGE_LENGTH_SIZE:
+            length = struct.unpack_from(MESSAGE_LENGTH_FORMAT, buffer, offset)[0]
+            if length > MAX_MESSAGE_SIZE:
+                raise Exception('ControlMessageTooLong')
+            if len(buffer) - offset < MESSAGE_LENGTH_SIZE + length:
+                break    # Incomplete message, wait for more data
+            offset += MESSAGE_LENGTH_SIZE
+            messages.append(decodeStrings(json.loads(str(buffer[offset:offset + length]))))
+            offset += length
+        del buffer[:offset]
+        return messages
+
+    def close(self):
+        self.sock.close()
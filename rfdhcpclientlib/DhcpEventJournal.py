@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import collections
+
+from MonotonicClock import monotonic
+
+class DhcpEventJournal:
+    """
+    Fixed-size ring buffer recording the DHCP transitions of a DHCP client, with a monotonic timestamp
+    Each entry is a dictionary as returned by DbusLeaseState.decodeLeaseState(), with two additional keys: 'timestamp' (value of MonotonicClock.monotonic() when the event was recorded) and 'sequence' (a counter incremented for each recorded event)
+    When the journal is full, the oldest events are dropped
+    Entries are returned as copies, so that callers cannot modify the journal
+    """
+
+    def __init__(self, size = 256):
+        self._events = collections.deque(maxlen = size)
+        self._condition = threading.Condition()    # This condition protects writes to the _events and _last_sequence attributes, and is notified each time an event is recorded
+        self._last_sequence = 0    # Sequence number of the last recorded event (0 if no event has been recorded yet)
+
+    def record(self, event):
+        """
+        Record event (a dictionary, see DbusLeaseState.decodeLeaseState()) and wake up all threads waiting for an event
+        Returns a copy of the recorded entry
+        """
+        entry = dict(event)
+        entry['timestamp'] = monotonic()
+        with self._condition:
+            self._last_sequence += 1
+            entry['sequence'] = self._last_sequence
+            self._events.append(entry)
+            self._condition.notify_all()
+        return dict(entry)
+
+    def getLastSequence(self):
+        """
+        Get the sequence number of the last recorded event
+        It can be used as the after_sequence argument of getEvents() or waitForEvent() to only consider events that will be recorded from now on
+        """
+        with self._condition:
+            return self._last_sequence
+
+    def getEvents(self, after_sequence = 0):
+        """
+        Get the list of events still in the journal, whose sequence number is greater than after_sequence (oldest first)
+        """
+        with self._condition:
+            return [dict(entry) for entry in self._events if entry['sequence'] > after_sequence]
+
+    def _findEvent(self, event_name, after_sequence):
+        """
+        Get the oldest entry named event_name (or any entry if event_name is None), whose sequence number is greater than after_sequence (or None if there is no such entry)
+        Must be called with self._condition held
+        """
+        for entry in self._events:
+            if entry['sequence'] > after_sequence and (event_name is None or entry['event'] == event_name):
+                return entry
+        return None
+
+    def waitForEvent(self, event_name = None, timeout = None, after_sequence = 0):
+        """
+        Wait (up to timeout seconds if specified) for an event named event_name (eg: 'DhcpRenewSent'), or for any event if event_name is None
+        Only events whose sequence number is greater than after_sequence are considered (this includes events already in the journal)
+        Returns the matching entry, or None if timeout expired
+        """
+        if not timeout is None:
+            deadline = monotonic() + timeout
+        with self._condition:
+            while True:
+                entry = self._findEvent(event_name, after_sequence)
+                if not entry is None:
+                    return dict(entry)
+                if timeout is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return None
+                    self._condition.wait(remaining)
+
+    def clear(self):
+        """
+        Forget all recorded events (sequence numbers keep on increasing)
+        """
+        with self._condition:
+            self._events.clear()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import threading
+
+def _buildBucketBounds(lowest, highest, steps_per_octave):
+    """
+    Build the list of upper bounds (in seconds) of geometric histogram buckets, from lowest up to (at least) highest, with steps_per_octave buckets each time the value doubles
+    """
+    bounds = []
+    bound = lowest
+    factor = 2.0 ** (1.0 / steps_per_octave)
+    while bound < highest:
+        bounds.append(bound)
+        bound *= factor
+    bounds.append(bound)
+    return bounds
+
+DEFAULT_BUCKET_BOUNDS = _buildBucketBounds(0.0001, 60, 4)    # 100us to 60s, each bucket is ~19% wider than the previous one
+
+class DhcpLatencyHistogram:
+    """
+    Fixed-bucket histogram of the durations (in seconds) of DHCP exchanges (eg: DISCOVER->OFFER)
+    Recording a duration has a constant cost and memory usage does not depend on the number of recorded durations
+    Percentiles are thus approximated by the upper bound of the bucket they fall in (clamped to the maximum recorded duration)
+    """
+
+    def __init__(self, bucket_bounds = DEFAULT_BUCKET_BOUNDS):
+        """
+        bucket_bounds is the sorted list of the upper bounds of the buckets. An extra bucket holds durations above the last bound
+        """
+        self._bucket_bounds = bucket_bounds
+        self._histogram_mutex = threading.Lock()    # This mutex protects writes to all the attributes below
+        self._buckets = [0] * (len(bucket_bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._min = None
+        self._max = None
+
+    def record(self, duration):
+        """
+        Record one exchange that lasted duration seconds
+        """
+        with self._histogram_mutex:
+            self._buckets[bisect.bisect_left(self._bucket_bounds, duration)] += 1
+            self._count += 1
+            self._sum += duration
+            if self._min is None or duration < self._min:
+                self._min = duration
+            if self._max is None or duration > self._max:
+                self._max = duration
+
+    def _percentile(self, percent):
+        """
+        Get the (approximated) duration under which percent % of the recorded exchanges completed
+        Must be called with self._histogram_mutex held, and with at least one recorded duration
+        """
+        rank = max(1, int(round(self._count * percent / 100.0)))
+        cumulated = 0
+        for (index, bucket_count) in enumerate(self._buckets):
+            cumulated += bucket_count
+            if cumulated >= rank:
+                if index < len(self._bucket_bounds):
+                    return min(self._bucket_bounds[index], self._max)
+                else:
+                    return self._max    # Overflow bucket
+        return self._max
+
+    def getStats(self):
+        """
+        Get a dictionary with the number of recorded exchanges ('count') and, if there is at least one, 'min', 'max', 'mean', 'p50', 'p90' and 'p99' (in seconds)
+        """
+        with self._histogram_mutex:
+            stats = {'count': self._count}
+            if self._count:
+                stats['min'] = self._min
+                stats['max'] = self._max
+                stats['mean'] = self._sum / self._count
+                for percent in [50, 90, 99]:
+                    stats['p' + str(percent)] = self._percentile(percent)
+            return stats
+
+    def reset(self):
+        """
+        Forget all recorded durations
+        """
+        with self._histogram_mutex:
+            self._buckets = [0] * (len(self._bucket_bounds) + 1)
+            self._count = 0
+            self._sum = 0.0
+            self._min = None
+            self._max = None
@@ -1,26 +1,72 @@
 # -*- coding: utf-8 -*-
 
+import datetime
 import threading
 
-class DhcpLeaseStatus:
+from MonotonicClock import monotonic
+
+DHCP_LEASE_FIELDS = ('ipv4_address', 'ipv4_netmask', 'ipv4_defaultgw', 'ipv4_dnslist', 'ipv4_dhcpserverid', 'ipv4_lease_valid', 'ipv4_lease_duration', 'ipv4_lease_expiry', 'ipv4_lease_deadline')
+
+class DhcpLease(object):
     """
-    This object represents a DHCP lease status database
-    Note: all IPv4 address stored here should be done using type str
+    Immutable record of one DHCP lease (or of the absence of lease)
+    Note: all IPv4 address stored here are of type str
     Exceptions to this is:
+    - ipv4_dnslist is a tuple of such str
     - ipv4_lease_valid is of type boolean
     - ipv4_lease_duration is of type int (representing a duration in seconds)
-    - ipv4_lease_remaining is of type int (representing a duration in seconds)
-    - ipv4_lease_expiry is of type time.struct_time object
+    - ipv4_lease_expiry is a datetime.datetime object (local time, for display only)
+    - ipv4_lease_deadline is the value of MonotonicClock.monotonic() at which the lease expires
+    Any attempt to modify a DhcpLease raises an exception: a new DhcpLease must be built instead
     """
 
-    def __init__(self):
-        self._dhcp_status_mutex = threading.RLock()    # This re-intrant mutex protects writes to any of the variables of this object
-        self.reset()
+    __slots__ = DHCP_LEASE_FIELDS
+
+    def __init__(self, ipv4_address = None, ipv4_netmask = None, ipv4_defaultgw = None, ipv4_dnslist = (None,), ipv4_dhcpserverid = None, ipv4_lease_valid = False, ipv4_lease_duration = None, ipv4_lease_expiry = None, ipv4_lease_deadline = None):
+        set_field = super(DhcpLease, self).__setattr__
+        set_field('ipv4_address', ipv4_address)
+        set_field('ipv4_netmask', ipv4_netmask)
+        set_field('ipv4_defaultgw', ipv4_defaultgw)
+        set_field('ipv4_dnslist', tuple(ipv4_dnslist))
+        set_field('ipv4_dhcpserverid', ipv4_dhcpserverid)
+        set_field('ipv4_lease_valid', ipv4_lease_valid)    # Is the lease valid?
+        set_field('ipv4_lease_duration', ipv4_lease_duration)    # How long the lease lasts
+        set_field('ipv4_lease_expiry', ipv4_lease_expiry)    # When the lease will expire
+        set_field('ipv4_lease_deadline', ipv4_lease_deadline)    # When the lease will expire, on the monotonic clock
+
+    @classmethod
+    def fromLeaseState(cls, lease_state):
+        """
+        Build a valid DhcpLease from lease_state (a dictionary returned by DbusLeaseState.decodeLeaseState() for a DhcpAckRecv event), expiring ipv4_lease_duration seconds from now
+        """
+        return cls(ipv4_address = lease_state['ipv4_address'],
+                   ipv4_netmask = lease_state.get('ipv4_netmask'),
+                   ipv4_defaultgw = lease_state.get('ipv4_defaultgw'),
+                   ipv4_dnslist = lease_state.get('ipv4_dnslist', []),
+                   ipv4_dhcpserverid = lease_state.get('ipv4_dhcpserverid'),
+                   ipv4_lease_valid = True,
+                   ipv4_lease_duration = lease_state['ipv4_lease_duration'],
+                   ipv4_lease_expiry = datetime.datetime.now() + datetime.timedelta(seconds = lease_state['ipv4_lease_duration']),
+                   ipv4_lease_deadline = monotonic() + lease_state['ipv4_lease_duration'])
+
+    def remaining(self):
+        """
+        Get the number of seconds before this lease expires (0 if it has already expired), or None if this lease is not valid or has no deadline
+        """
+        if not self.ipv4_lease_valid or self.ipv4_lease_deadline is None:
+            return None
+        return max(0, self.ipv4_lease_deadline - monotonic())
+
+    def __setattr__(self, name, value):
+        raise Exception('ImmutableDhcpLease')
+
+    def __delattr__(self, name):
+        raise Exception('ImmutableDhcpLease')
 
     def __repr__(self):
         temp = ''
-        
-        if self.ipv4_lease_valid is None:
+
+        if not self.ipv4_lease_valid:
             temp += 'No valid lease'
         else:
             if not self.ipv4_address is None:
@@ -29,43 +75,52 @@ class DhcpLeaseStatus:
                 temp += 'IPv4 netmask: ' + str(self.ipv4_netmask) + '\n'
             if not self.ipv4_defaultgw is None:
                 temp += 'IPv4 default gw: ' + str(self.ipv4_defaultgw) + '\n'
-            if not self.ipv4_dnslist is None:
-                for dns in self.ipv4_dnslist:
-                    temp += 'IPv4 DNS:' + str(dns) + '\n'
+            for dns in self.ipv4_dnslist:
+                temp += 'IPv4 DNS:' + str(dns) + '\n'
             if not self.ipv4_dhcpserverid is None:
                 temp += 'IPv4 DHCP server: ' + str(self.ipv4_dhcpserverid) + '\n'
             if not self.ipv4_lease_duration is None:
                 temp += 'IPv4 lease last for: ' + str(self.ipv4_lease_duration) + 's\n'
         return temp
-    
+
+
+NO_DHCP_LEASE = DhcpLease()    # Shared by all DhcpLeaseStatus objects that have no lease
+
+class DhcpLeaseStatus:
+    """
+    This object represents a DHCP lease status database
+    The current lease is held in the lease attribute, as an immutable DhcpLease object. Writers build a new DhcpLease in full and publish it with publish() (a single reference assignment)
+    Readers take the lease attribute once and read all the values they need from this snapshot: no lock is needed, and all values always belong to the same lease
+    """
+
+    def __init__(self):
+        self._publish_mutex = threading.Lock()    # This mutex serializes writers only (so that expire() cannot drop a lease published concurrently), readers never take it
+        self.lease = NO_DHCP_LEASE
+
+    def __repr__(self):
+        return repr(self.lease)
+
+    def publish(self, lease):
+        """
+        Make lease (a DhcpLease object) the current lease
+        """
+        with self._publish_mutex:
+            self.lease = lease
+
     def reset(self):
         """
         Reset internal attribute to no lease state
         """
-        with self._dhcp_status_mutex:
-            self.ipv4_address = None
-            self.ipv4_netmask = None
-            self.ipv4_defaultgw = None
-            self.ipv4_dnslist = [None]
-            self.ipv4_dhcpserverid = None
-            self.ipv4_lease_valid = False   # Is the lease valid?
-            self.ipv4_lease_duration = None  # How long the lease lasts
-            #self.ipv4_lease_remaining   # For how long the lease is still valid?
-            self.ipv4_lease_expiry = None    # When the lease will expire (in UTC time), as a time.struct_time object
-
-
-
-    #===========================================================================
-    # @property
-    # def ipv4_lease_remaining(self):
-    #     return 0    # FIXME: we should perform some calculation here
-    # 
-    #  
-    # @flags.setter
-    # def ipv4_address(self, val):
-    #     self._dhcp_status_mutex.acquire()
-    #     try:
-    #         self.ipv4_address = val
-    #     finally:
-    #         self._dhcp_status_mutex.release()
-    #===========================================================================
+        with self._publish_mutex:
+            self.lease = NO_DHCP_LEASE
+
+    def expire(self, lease):
+        """
+        Reset to no lease state if lease (a DhcpLease object) is still the current lease
+        Returns True if lease was the current lease
+        """
+        with self._publish_mutex:
+            if not self.lease is lease:
+                return False    # A new lease has been published meanwhile
+            self.lease = NO_DHCP_LEASE
+            return True
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from DhcpLatencyHistogram import DhcpLatencyHistogram
+
+OFFER_SELECTION_POLICIES = ['first',    # The first OFFER received within the collection window
+    'fastest',    # The OFFER of the server that has the lowest median OFFER latency so far (see getStats())
+    'serverid',    # The OFFER of the preferred server (the window is closed as soon as it is received), or the first OFFER if the preferred server did not answer
+    'leasetime',    # The OFFER with the longest lease time
+]
+
+class DhcpOffer:
+    """
+    One OFFER received from a DHCP server, as recorded during the offer collection window
+    """
+
+    def __init__(self, server_id, proposed_ip, lease_time, latency):
+        self.server_id = server_id    # Server identifier option (dotted-decimal string), or None if the server did not provide it
+        self.proposed_ip = proposed_ip    # Proposed IPv4 address (yiaddr field, dotted-decimal string)
+        self.lease_time = lease_time    # Proposed lease time (in seconds), or None if the server did not provide it
+        self.latency = latency    # Duration (in seconds) between the first transmission of our DISCOVER and the reception of this OFFER
+
+
+class DhcpOfferSelector:
+    """
+    Selection policy applied to the OFFERs received from (possibly redundant) DHCP servers, and per-server statistics on these OFFERs
+    After sending a DISCOVER, a DHCP client collects OFFERs for window seconds, then requests the OFFER selected by policy (one of OFFER_SELECTION_POLICIES)
+    With a window of 0 (the default), the first OFFER is requested immediately, as soon as it is received
+    """
+
+    def __init__(self, window = 0, policy = 'first', preferred_server_id = None):
+        """
+        preferred_server_id is the server identifier (dotted-decimal string) of the preferred server, it is mandatory for the 'serverid' policy
+        """
+        if window < 0:
+            raise Exception('InvalidOfferWindow')
+        if not policy in OFFER_SELECTION_POLICIES:
+            raise Exception('UnknownOfferSelectionPolicy')
+        if policy == 'serverid' and preferred_server_id is None:
+            raise Exception('NoPreferredServerId')
+        self.window = window
+        self.policy = policy
+        self.preferred_server_id = preferred_server_id
+        self._latency_histograms = {}    # OFFER latency of each server, indexed by server identifier
+        self._selected = {}    # Number of OFFERs selected for each server, indexed by server identifier
+
+    def recordOffer(self, offer):
+        """
+        Record the latency of offer (a DhcpOffer object) in the statistics of its server
+        This should be done for all OFFERs, including the ones received after the collection window, so that the statistics show how fast each server answers
+        """
+        histogram = self._latency_histograms.get(offer.server_id)
+        if histogram is None:
+            histogram = DhcpLatencyHistogram()
+            self._latency_histograms[offer.server_id] = histogram
+            self._selected[offer.server_id] = 0
+        histogram.record(offer.latency)
+
+    def closesWindow(self, offer):
+        """
+        Should we select offer (a DhcpOffer object) right away, without waiting for the end of the collection window?
+        """
+        return self.window == 0 or (self.policy == 'serverid' and offer.server_id == self.preferred_server_id)
+
+    def selectOffer(self, offers):
+        """
+        Select one OFFER among offers (a non-empty list of DhcpOffer objects, in the order in which they were received, that have all been passed to recordOffer()) according to our policy
+        Returns the selected DhcpOffer
+        """
+        selected = offers[0]    # Also the choice for the 'first' policy, and the fallback if no OFFER matches the other policies
+        if self.policy == 'fastest':
+            median_latencies = {}
+            for offer in offers:
+                if not offer.server_id in median_latencies:
+                    median_latencies[offer.server_id] = self._latency_histograms[offer.server_id].getStats()['p50']    # All OFFERs have been recorded by recordOffer(), so each server has at least one latency
+            selected = min(offers, key = lambda offer: median_latencies[offer.server_id])    # min() keeps the first of equal OFFERs
+        elif self.policy == 'serverid':
+            for offer in offers:
+                if offer.server_id == self.preferred_server_id:
+                    selected = offer
+                    break
+        elif self.policy == 'leasetime':
+            selected = max(offers, key = lambda offer: offer.lease_time or 0)    # max() also keeps the first of equal OFFERs
+        if selected.server_id in self._selected:
+            self._selected[selected.server_id] += 1
+        return selected
+
+    def getStats(self):
+        """
+        Get a dictionary indexed by server identifier ('' if servers did not provide one), each value being a dictionary with the number of OFFERs received from this server ('count'), the number of its OFFERs that were selected ('selected') and, if there was at least one OFFER, 'min', 'max', 'mean', 'p50', 'p90' and 'p99' OFFER latencies (in seconds)
+        """
+        stats = {}
+        for (server_id, histogram) in self._latency_histograms.items():
+            server_stats = histogram.getStats()
+            server_stats['selected'] = self._selected[server_id]
+            stats[server_id or ''] = server_stats
+        return stats
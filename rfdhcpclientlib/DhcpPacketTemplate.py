@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from pydhcplib.dhcp_constants import DhcpFields, DhcpOptions
+
+DHCP_OPTIONS_OFFSET = 240    # Options start right after the BOOTP header (236 bytes) and the magic cookie (4 bytes)
+
+class DhcpPacketTemplate:
+    """
+    This object holds a pre-encoded DHCP packet buffer
+    Only a few fields (listed in patchable at construction time) can be modified when generating a new packet from this template, all other fields are frozen
+    Patchable fields can either be BOOTP header fields (eg: 'xid', 'ciaddr') or DHCP options (eg: 'request_ip_address'). Patchable options must be present in the packet used to build the template, with their final length
+    """
+
+    def __init__(self, dhcp_packet, patchable = ()):
+        """
+        Build a template from a DHCP packet object dhcp_packet (a pydhcplib DhcpPacket or a LazyDhcpPacket)
+        """
+        self._buffer = bytearray(dhcp_packet.EncodePacket())
+        self._offsets = {}    # Offset and length inside self._buffer for each patchable field, indexed by field name
+        for name in patchable:
+            if DhcpFields.has_key(name):
+                self._offsets[name] = (DhcpFields[name][0], DhcpFields[name][1])
+            elif DhcpOptions.has_key(name):
+                self._offsets[name] = self._findOption(DhcpOptions[name])
+            else:
+                raise Exception('UnknownDhcpField')
+
+    def _findOption(self, code):
+        """
+        Search for the option whose code is provided as argument in the encoded buffer
+        Returns a tuple (offset, length) of the option's value
+        """
+        iterator = DHCP_OPTIONS_OFFSET
+        end_iterator = len(self._buffer)
+        while iterator < end_iterator:
+            if self._buffer[iterator] == 0:    # Pad option
+                iterator += 1
+            elif self._buffer[iterator] == 255:    # End option
+                break
+            else:
+                opt_len = self._buffer[iterator + 1]
+                if self._buffer[iterator] == code:
+                    return (iterator + 2, opt_len)
+                iterator += opt_len + 2
+        raise Exception('OptionNotInTemplate')
+
+    def build(self, buffer = None, **values):
+        """
+        Generate a new packet from this template
+        Keyword arguments are patchable field names, their value is the binary string that will overwrite the field in the new packet
+        If buffer (a bytearray) is provided, the packet is written into it (replacing its previous content), so that the same buffer can be reused for each packet sent
+        Returns the bytearray holding the encoded packet, ready to be sent to the network
+        """
+        if buffer is None:
+            buffer = bytearray()
+        buffer[:] = self._buffer    # Copy the pre-encoded buffer, we only patch the copy
+        for name, value in values.iteritems():
+            (offset, length) = self._offsets[name]
+            if len(value) != length:
+                raise Exception('BadFieldLength')
+            buffer[offset:offset + length] = value
+        return buffer
+
+
+class DhcpPacketTemplateCache:
+    """
+    This object is a cache of DhcpPacketTemplate objects
+    Templates are indexed by a key that must contain all parameters that were used to build the template (message type, MAC address, parameter request list...)
+    """
+
+    def __init__(self):
+        self._cache_mutex = threading.Lock()    # This mutex protects writes to the _templates attribute
+        self._templates = {}
+
+    def get(self, key, builder):
+        """
+        Get the template for key
+        If this template is not in the cache yet, builder will be called (without argument) and must return the DhcpPacketTemplate to store for key
+        """
+        try:
+            return self._templates[key]
+        except KeyError:
+            pass
+        with self._cache_mutex:
+            if not key in self._templates:
+                self._templates[key] = builder()
+            return self._templates[key]
+
+    def clear(self):
+        """
+        Forget all templates
+        """
+        with self._cache_mutex:
+            self._templates = {}
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+Recording and reading of DHCP datagrams in pcap files (that can be opened with tcpdump or wireshark)
+Datagrams are written with LINKTYPE_IPV4 framing: IPv4 and UDP headers are synthesized around each DHCP payload
+Files captured by other tools with Ethernet, Linux cooked (SLL) or raw IPv4 framing can also be read
+"""
+
+import time
+import socket
+import struct
+import fcntl
+
+PCAP_MAGIC = 0xa1b2c3d4    # Microsecond-resolution timestamps
+PCAP_MAGIC_NSEC = 0xa1b23c4d    # Nanosecond-resolution timestamps
+PCAP_VERSION_MAJOR = 2
+PCAP_VERSION_MINOR = 4
+PCAP_SNAPLEN = 65535
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+
+PCAP_FILE_HEADER_FORMAT = 'IHHiIII'    # struct pcap_file_header: magic, major version, minor version, timezone offset, timestamp accuracy, snapshot length, link type
+PCAP_RECORD_HEADER_FORMAT = 'IIII'    # struct pcap_pkthdr: seconds, microseconds (or nanoseconds), captured length, original length
+IPV4_HEADER_FORMAT = '!BBHHHBBH4s4s'    # version and header length, TOS, total length, identification, fragment offset, TTL, protocol, checksum, source address, destination address
+UDP_HEADER_FORMAT = '!HHHH'    # source port, destination port, length, checksum
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+
+SIOCGSTAMP = 0x8906    # Get the kernel timestamp of the last packet received on a socket
+
+def getKernelTimestamp(sock):
+    """
+    Get the time (in seconds since the epoch) at which the kernel received the last datagram read from socket sock
+    Returns None if the kernel does not provide this timestamp
+    """
+    try:
+        timeval = fcntl.ioctl(sock.fileno(), SIOCGSTAMP, struct.pack('ll', 0, 0))
+    except IOError:
+        return None
+    (seconds, microseconds) = struct.unpack('ll', timeval)
+    return seconds + microseconds / 1000000.0
+
+def _ipv4Checksum(header):
+    """
+    Compute the checksum of an IPv4 header (whose checksum field is set to 0)
+    """
+    total = sum(struct.unpack('!%dH' % (len(header) // 2), header))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+class DhcpPcapWriter:
+    """
+    Writes DHCP datagrams (sent or received) to a pcap file
+    Writes are buffered: records only reach the disk when the buffer is full, or when flush() or close() are called
+    """
+
+    def __init__(self, path, buffer_size = 65536):
+        self._file = open(path, 'wb', buffer_size)
+        self._file.write(struct.pack(PCAP_FILE_HEADER_FORMAT, PCAP_MAGIC, PCAP_VERSION_MAJOR, PCAP_VERSION_MINOR, 0, 0, PCAP_SNAPLEN, LINKTYPE_IPV4))
+        self._ip_id = 0
+
+    def writeDatagram(self, data, source_address, destination_address, timestamp = None):
+        """
+        Record one UDP datagram with payload data (a binary string, a bytearray or a memoryview) sent from source_address to destination_address (both (IPv4 address, port) tuples)
+        timestamp is the time (in seconds since the epoch) at which the datagram was sent or received (if None, the current time is used)
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        udp_length = struct.calcsize(UDP_HEADER_FORMAT) + len(data)
+        ip_header_length = struct.calcsize(IPV4_HEADER_FORMAT)
+        self._ip_id = (self._ip_id + 1) & 0xffff
+        ip_header = struct.pack(IPV4_HEADER_FORMAT, 0x45, 0, ip_header_length + udp_length, self._ip_id, 0, 64, socket.IPPROTO_UDP, 0, socket.inet_aton(source_address[0]), socket.inet_aton(destination_address[0]))
+        ip_header = ip_header[:10] + struct.pack('!H', _ipv4Checksum(ip_header)) + ip_header[12:]
+        udp_header = struct.pack(UDP_HEADER_FORMAT, source_address[1], destination_address[1], udp_length, 0)    # A null UDP checksum means no checksum
+        record_length = ip_header_length + udp_length
+        seconds = int(timestamp)
+        self._file.write(struct.pack(PCAP_RECORD_HEADER_FORMAT, seconds, int((timestamp - seconds) * 1000000), record_length, record_length))
+        self._file.write(ip_header)
+        self._file.write(udp_header)
+        self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class DhcpPcapReader:
+    """
+    Reads the UDP datagrams recorded in a pcap file
+    Iterating over this object yields one (timestamp, source address, destination address, payload) tuple per IPv4 UDP datagram in the file, addresses being (IPv4 address, port) tuples and timestamp being in seconds since the epoch
+    Records that do not hold an (unfragmented) IPv4 UDP datagram are skipped
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        header = self._file.read(struct.calcsize(PCAP_FILE_HEADER_FORMAT))
+        for byte_order in ['<', '>']:
+            magic = struct.unpack(byte_order + 'I', header[:4])[0]
+            if magic in [PCAP_MAGIC, PCAP_MAGIC_NSEC]:
+                break
+        else:
+            raise Exception('NotAPcapFile')
+        self._byte_order = byte_order
+        self._timestamp_divisor = 1000000000.0 if magic == PCAP_MAGIC_NSEC else 1000000.0
+        self._link_type = struct.unpack(byte_order + PCAP_FILE_HEADER_FORMAT, header)[6] & 0xffff
+        if not self._link_type in [LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_LINUX_SLL, LINKTYPE_IPV4]:
+            raise Exception('UnsupportedPcapLinkType')
+
+    def _getIpv4Offset(self, frame):
+        """
+        Get the offset of the IPv4 header inside a captured frame, or None if the frame does not hold an IPv4 packet
+        """
+        if self._link_type in [LINKTYPE_RAW, LINKTYPE_IPV4]:
+            return 0
+        elif self._link_type == LINKTYPE_LINUX_SLL:
+            offset = 14
+        else:    # Ethernet
+            offset = 12
+            if len(frame) >= offset + 2 and struct.unpack_from('!H', frame, offset)[0] == ETHERTYPE_VLAN:
+                offset += 4
+        if len(frame) < offset + 2 or struct.unpack_from('!H', frame, offset)[0] != ETHERTYPE_IPV4:
+            return None
+        return offset + 2
+
+    def __iter__(self):
+        record_header_size = struct.calcsize(PCAP_RECORD_HEADER_FORMAT)
+        while True:
+            record_header = self._file.read(record_header_size)
+            if len(record_header) < record_header_size:
+                return
+            (seconds, fraction, captured_length, original_length) = struct.unpack(self._byte_order + PCAP_RECORD_HEADER_FORMAT, record_header)
+            frame = self._file.read(captured_length)
+            if len(frame) < captured_length:
+                return    # Truncated file
+            ip_offset = self._getIpv4Offset(frame)
+            if ip_offset is None or len(frame) < ip_offset + struct.calcsize(IPV4_HEADER_FORMAT):
+                continue
+            (version_ihl, tos, total_length, ip_id, fragment, ttl, protocol, checksum, source_ip, destination_ip) = struct.unpack_from(IPV4_HEADER_FORMAT, frame, ip_offset)
+            if version_ihl >> 4 != 4 or protocol != socket.IPPROTO_UDP or fragment & 0x3fff:
+                continue
+            udp_offset = ip_offset + (version_ihl & 0x0f) * 4
+            if len(frame) < udp_offset + struct.calcsize(UDP_HEADER_FORMAT):
+                continue
+            (source_port, destination_port, udp_length, udp_checksum) = struct.unpack_from(UDP_HEADER_FORMAT, frame, udp_offset)
+            payload = frame[udp_offset + struct.calcsize(UDP_HEADER_FORMAT):udp_offset + udp_length]
+            yield (seconds + fraction / self._timestamp_divisor,
+                   (socket.inet_ntoa(source_ip), source_port),
+                   (socket.inet_ntoa(destination_ip), destination_port),
+                   payload)
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+class DhcpRetransmitBackoff:
+    """
+    Retransmission policy for DHCP requests that did not get any reply (see RFC 2131 section 4.1)
+    The delay before the first retransmission is initial_interval, and it doubles for each subsequent retransmission (4s, 8s, 16s... with the default values), up to max_interval
+    Each delay is randomized by +/- jitter seconds, so that many clients do not retransmit in sync
+    """
+
+    def __init__(self, initial_interval = 4, max_interval = 64, max_retries = 4, jitter = 1):
+        """
+        max_retries is the number of retransmissions after which we give up waiting for a reply (None means retransmit forever)
+        """
+        if initial_interval <= 0 or max_interval < initial_interval:
+            raise Exception('InvalidRetransmitInterval')
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.max_retries = max_retries
+        self.jitter = jitter
+
+    def getInterval(self, attempt, random_generator = random):
+        """
+        Get the delay (in seconds) to wait for a reply after the transmission number attempt (0 for the initial transmission, 1 for the first retransmission...)
+        random_generator is the random.Random object used to compute the jitter
+        """
+        interval = min(self.initial_interval * (2 ** attempt), self.max_interval)
+        return max(0, interval + random_generator.uniform(-self.jitter, self.jitter))
+
+    def hasRetriesLeft(self, attempt):
+        """
+        Can we perform another retransmission after the transmission number attempt?
+        """
+        return self.max_retries is None or attempt < self.max_retries
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+import socket
+import struct
+
+from pydhcplib.dhcp_constants import DhcpFields, DhcpOptions, MagicCookie
+from pydhcplib.dhcp_packet import DhcpPacket
+
+from DhcpPacketTemplate import DHCP_OPTIONS_OFFSET
+
+BOOTP_HEADER_SIZE = 236    # Size of the fixed BOOTP header, the magic cookie follows
+DHCP_MAGIC_COOKIE = str(bytearray(MagicCookie))
+
+DHCP_MESSAGE_TYPES = {'DISCOVER': 1,
+                      'OFFER': 2,
+                      'REQUEST': 3,
+                      'DECLINE': 4,
+                      'ACK': 5,
+                      'NACK': 6,
+                      'RELEASE': 7,
+                      'INFORM': 8}
+
+class LazyDhcpPacket:
+    """
+    DHCP packet codec that can be used instead of pydhcplib's DhcpPacket, with the same GetOption()/SetOption() interface
+    A received datagram is not copied nor converted into lists of ints: it is kept as is and accessed through a memoryview. Options are only decoded (with struct) when they are accessed
+    The first option lookup scans the options once to build an index of their offsets, so that all subsequent lookups are done in constant time whatever the number of options in the packet
+    Options modified with SetOption() are stored aside, and merged with the received ones by EncodePacket(), which writes the packet into a (reusable) bytearray
+    """
+
+    def __init__(self):
+        """
+        Create an empty packet (all BOOTP header fields are set to 0 and there is no option)
+        """
+        self._data = memoryview(bytearray(BOOTP_HEADER_SIZE) + DHCP_MAGIC_COOKIE)
+        self._options_offset = DHCP_OPTIONS_OFFSET    # Offset of the first option in self._data
+        self._option_index = None    # (offset, length) of the value of each option present in self._data, indexed by option code (built by _getOptionIndex() on first use)
+        self._set_options = {}    # Options modified with SetOption() or DeleteOption(), as binary strings indexed by option code (None for deleted options)
+        self.source_address = False
+
+    def DecodePacket(self, data):
+        """
+        Use the datagram data (a binary string or a bytearray) as the content of this packet
+        data is referenced (not copied) by this object, so it must not be modified afterwards
+        Returns False if data is not a DHCP packet
+        """
+        self._set_options = {}
+        if len(data) < DHCP_OPTIONS_OFFSET:
+            return False
+        data = memoryview(data)
+        # Some servers or clients don't place the magic cookie immediately after the BOOTP header, so search for it (like pydhcplib does)
+        cookie_offset = BOOTP_HEADER_SIZE
+        while data[cookie_offset:cookie_offset + 4] != DHCP_MAGIC_COOKIE:
+            cookie_offset += 1
+            if cookie_offset + 4 > len(data):
+                return False
+        self._data = data
+        self._options_offset = cookie_offset + 4
+        self._option_index = None
+        return True
+
+    def _getOptionIndex(self):
+        """
+        Get the index of the options present in the received datagram (options modified by SetOption() are not considered)
+        The index is built the first time this method is called for a given datagram. It is a dictionary containing the tuple (offset, length) of the value of each option inside self._data, indexed by option code
+        If an option is present more than once, only its first occurrence is indexed
+        """
+        option_index = self._option_index
+        if option_index is None:
+            option_index = {}
+            for (opt_code, offset, length) in self._iterOptions():
+                if not opt_code in option_index:
+                    option_index[opt_code] = (offset + 2, length - 2)
+            self._option_index = option_index
+        return option_index
+
+    def _iterOptions(self):
+        """
+        Iterate over the options present in the received datagram
+        Yields (option code, offset of the option's code byte, total length of the option including its code and length bytes) tuples
+        """
+        data = self._data
+        iterator = self._options_offset
+        end_iterator = len(data)
+        while iterator < end_iterator:
+            opt_code = ord(data[iterator])
+            if opt_code == 0:    # Pad option
+                iterator += 1
+            elif opt_code == 255:    # End option
+                return
+            else:
+                if iterator + 1 >= end_iterator:
+                    return
+                opt_len = ord(data[iterator + 1])
+                if iterator + 2 + opt_len > end_iterator:
+                    return
+                yield (opt_code, iterator, opt_len + 2)
+                iterator += opt_len + 2
+
+    def GetOptionBytes(self, name):
+        """
+        Get the raw value of a BOOTP header field (eg: 'yiaddr') or of a DHCP option (eg: 'router') as a binary string
+        Returns None if the option is not present in this packet
+        """
+        if name in DhcpFields:
+            (offset, length) = DhcpFields[name]
+            return self._data[offset:offset + length].tobytes()
+        code = DhcpOptions.get(name)
+        if code is None:
+            return None
+        if code in self._set_options:
+            return self._set_options[code]
+        location = self._getOptionIndex().get(code)
+        if location is None:
+            return None
+        (offset, length) = location
+        return self._data[offset:offset + length].tobytes()
+
+    def GetOption(self, name):
+        """
+        Get the value of a BOOTP header field (eg: 'yiaddr') or of a DHCP option (eg: 'router') as a list of ints (one per byte), like pydhcplib does
+        Returns an empty list if the option is not present in this packet
+        """
+        value = self.GetOptionBytes(name)
+        if value is None:
+            return []
+        return list(bytearray(value))
+
+    def GetIpv4Option(self, name):
+        """
+        Get the value of an IPv4 field or option (eg: 'yiaddr', 'server_identifier') as a dotted-decimal string
+        For options that carry a list of IPv4 addresses (eg: 'router'), the first address is returned
+        Returns None if the option is not present in this packet (or is too short to hold an IPv4 address)
+        """
+        value = self.GetOptionBytes(name)
+        if value is None or len(value) < 4:
+            return None
+        return socket.inet_ntoa(value[:4])
+
+    def GetIpv4ListOption(self, name):
+        """
+        Get the value of an option carrying a list of IPv4 addresses (eg: 'domain_name_server') as a list of dotted-decimal strings
+        Returns an empty list if the option is not present in this packet
+        """
+        value = self.GetOptionBytes(name)
+        if value is None:
+            return []
+        return [socket.inet_ntoa(value[i:i + 4]) for i in xrange(0, len(value) - 3, 4)]
+
+    def GetUInt32Option(self, name):
+        """
+        Get the value of a 32-bit field or option (eg: 'xid', 'ip_address_lease_time') as an int
+        Returns None if the option is not present in this packet
+        """
+        value = self.GetOptionBytes(name)
+        if value is None or len(value) != 4:
+            return None
+        return struct.unpack('!I', value)[0]
+
+    def SetOption(self, name, value):
+        """
+        Set the value of a BOOTP header field (eg: 'xid') or of a DHCP option (eg: 'router'), value being a list of ints (one per byte) or a binary string
+        """
+        if name in DhcpFields:
+            (offset, length) = DhcpFields[name]
+            if len(value) != length:
+                raise Exception('BadFieldLength')
+            if self._data.readonly:    # The received datagram is immutable, we need our own copy before modifying it
+                self._data = memoryview(bytearray(self._data.tobytes()))
+            self._data[offset:offset + length] = str(bytearray(value))
+            return True
+        elif name in DhcpOptions:
+            if len(value) > 255:
+                raise Exception('BadFieldLength')
+            self._set_options[DhcpOptions[name]] = str(bytearray(value))
+            return True
+        raise Exception('UnknownDhcpField')
+
+    def DeleteOption(self, name):
+        """
+        Remove DHCP option name from this packet (BOOTP header fields are set to 0 instead)
+        """
+        if name in DhcpFields:
+            return self.SetOption(name, [0] * DhcpFields[name][1])
+        elif name in DhcpOptions:
+            self._set_options[DhcpOptions[name]] = None
+            return True
+        return False
+
+    def IsOption(self, name):
+        """
+        Is the BOOTP header field or DHCP option name present in this packet?
+        """
+        return name in DhcpFields or not self.GetOptionBytes(name) is None
+
+    def GetDhcpMessageType(self):
+        """
+        Get the DHCP message type of this packet (eg: 5 for ACK), or None if there is no dhcp_message_type option
+        """
+        value = self.GetOptionBytes('dhcp_message_type')
+        if not value:
+            return None
+        return ord(value[0])
+
+    def IsDhcpDiscoverPacket(self):
+        return self.GetDhcpMessageType() == DHCP_MESSAGE_TYPES['DISCOVER']
+
+    def IsDhcpOfferPacket(self):
+        return self.GetDhcpMessageType() == DHCP_MESSAGE_TYPES['OFFER']
+
+    def IsDhcpRequestPacket(self):
+        return self.GetDhcpMessageType() == DHCP_MESSAGE_TYPES['REQUEST']
+
+    def IsDhcpDeclinePacket(self):
+        return self.GetDhcpMessageType() == DHCP_MESSAGE_TYPES['DECLINE']
+
+    def IsDhcpAckPacket(self):
+        return self.GetDhcpMessageType() == DHCP_MESSAGE_TYPES['ACK']
+
+    def IsDhcpNackPacket(self):
+        return self.GetDhcpMessageType() == DHCP_MESSAGE_TYPES['NACK']
+
+    def IsDhcpReleasePacket(self):
+        return self.GetDhcpMessageType() == DHCP_MESSAGE_TYPES['RELEASE']
+
+    def IsDhcpInformPacket(self):
+        return self.GetDhcpMessageType() == DHCP_MESSAGE_TYPES['INFORM']
+
+    def EncodePacket(self, buffer = None):
+        """
+        Encode this packet, ready to be sent to the network
+        If buffer (a bytearray) is provided, the packet is written into it (replacing its previous content), so that the same buffer can be reused for each packet sent
+        Options present in the received datagram are kept in their original order, options set with SetOption() are appended in increasing code order (as pydhcplib does)
+        Returns the bytearray holding the encoded packet
+        """
+        if buffer is None:
+            buffer = bytearray()
+        buffer[:] = self._data[:BOOTP_HEADER_SIZE]
+        buffer += DHCP_MAGIC_COOKIE
+        set_options = self._set_options
+        for (opt_code, offset, length) in self._iterOptions():
+            if not opt_code in set_options:
+                buffer += self._data[offset:offset + length]
+        for opt_code in sorted(set_options.keys()):
+            value = set_options[opt_code]
+            if not value is None:
+                buffer.append(opt_code)
+                buffer.append(len(value))
+                buffer += value
+        buffer.append(255)    # End option
+        return buffer
+
+    def str(self):
+        """
+        Get a human-readable dump of this packet (this is only used for debugging, so it relies on pydhcplib's DhcpPacket)
+        """
+        dhcp_packet = DhcpPacket()
+        dhcp_packet.DecodePacket(str(self.EncodePacket()))
+        return dhcp_packet.str()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import sys
+import math
+import heapq
+import itertools
+import threading
+import traceback
+
+try:
+    import gobject
+except ImportError:
+    gobject = None    # GLib is not installed, only ThreadedLeaseTimerScheduler can be used
+
+from MonotonicClock import monotonic
+
+class LeaseTimer:
+    """
+    Handle on a timer scheduled in a LeaseTimerScheduler
+    It can be used to cancel the timer before it expires
+    """
+
+    def __init__(self, scheduler, deadline, callback, args):
+        self._scheduler = scheduler
+        self.deadline = deadline    # When this timer expires (as a value of MonotonicClock.monotonic())
+        self._callback = callback
+        self._args = args
+        self.cancelled = False
+        self._in_heap = True    # Is this timer still stored in the scheduler's heap?
+
+    def cancel(self):
+        """
+        Cancel this timer (this is a no-op if the timer already expired or was already cancelled)
+        """
+        self._scheduler.cancel(self)
+
+    def remaining(self):
+        """
+        Get the number of seconds before this timer expires
+        """
+        return max(0, self.deadline - monotonic())
+
+
+class LeaseTimerScheduler:
+    """
+    This object schedules all lease-related timeouts (renew, release...) of a process in one single min-heap
+    Only one GLib timeout is armed at any time (for the earliest deadline in the heap), whatever the number of timers, so callbacks are run from the thread running the GLib main loop
+    Cancelled timers are only flagged, and are purged from the heap when they reach its top (or when they represent more than half of the heap)
+    """
+
+    def __init__(self):
+        self._heap_mutex = threading.RLock()    # This mutex protects writes to the _heap attribute and to the armed GLib timeout
+        self._heap = []    # Heap of (deadline, sequence, LeaseTimer) tuples. sequence makes sure timers with the same deadline are run in the order in which they were scheduled
+        self._sequence = itertools.count()
+        self._nb_cancelled = 0    # Number of cancelled timers still in self._heap
+        self._glib_timeout_id = None
+        self._armed_deadline = None    # Deadline for which the GLib timeout self._glib_timeout_id was armed
+
+    def __len__(self):
+        """
+        Number of active (non-cancelled) timers
+        """
+        return len(self._heap) - self._nb_cancelled
+
+    def schedule(self, delay, callback, *args):
+        """
+        Run callback(*args) in delay seconds
+        Returns a LeaseTimer handle on this timer
+        """
+        timer = LeaseTimer(self, monotonic() + delay, callback, args)
+        with self._heap_mutex:
+            heapq.heappush(self._heap, (timer.deadline, next(self._sequence), timer))
+            self._rearm()
+        return timer
+
+    def cancel(self, timer):
+        """
+        Cancel timer (a LeaseTimer object returned by schedule())
+        """
+        with self._heap_mutex:
+            if timer.cancelled:
+                return
+            timer.cancelled = True
+            if not timer._in_heap:    # Already expired (and run or about to be run)
+                return
+            self._nb_cancelled += 1
+            if self._nb_cancelled > len(self._heap) / 2:    # Too many dead entries in the heap, compact it
+                for entry in self._heap:
+                    if entry[2].cancelled:
+                        entry[2]._in_heap = False
+                self._heap = [entry for entry in self._heap if entry[2]._in_heap]
+                heapq.heapify(self._heap)
+                self._nb_cancelled = 0
+            self._rearm()
+
+    def _rearm(self):
+        """
+        Make sure the GLib timeout is armed for the earliest deadline in the heap
+        """
+        while self._heap and self._heap[0][2].cancelled:    # Purge cancelled timers from the top of the heap
+            heapq.heappop(self._heap)[2]._in_heap = False
+            self._nb_cancelled -= 1
+        if self._heap:
+            deadline = self._heap[0][0]
+        else:
+            deadline = None
+        if deadline == self._armed_deadline:
+            return
+        self._disarm()
+        self._armed_deadline = deadline
+        if not deadline is None:
+            self._arm(deadline)
+
+    def _arm(self, deadline):
+        """
+        Arm the GLib timeout so that _onTimeout() is run at deadline
+        """
+        self._glib_timeout_id = gobject.timeout_add(int(math.ceil(max(0, deadline - monotonic()) * 1000)), self._onTimeout)
+
+    def _disarm(self):
+        """
+        Disarm the GLib timeout armed by _arm() (if any)
+        """
+        if not self._glib_timeout_id is None:
+            gobject.source_remove(self._glib_timeout_id)
+            self._glib_timeout_id = None
+
+    def _onTimeout(self):
+        """
+        GLib timeout callback invoked when the earliest timer in the heap expires
+        Runs all expired timers
+        """
+        with self._heap_mutex:
+            self._glib_timeout_id = None
+            self._armed_deadline = None
+            expired = []
+            now = monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                (deadline, sequence, timer) = heapq.heappop(self._heap)
+                timer._in_heap = False
+                if timer.cancelled:
+                    self._nb_cancelled -= 1
+                else:
+                    expired.append(timer)
+        for timer in expired:    # Callbacks are run without holding the mutex (they will probably schedule new timers)
+            if timer.cancelled:    # Cancelled by the callback of another timer that expired at the same time
+                continue
+            try:
+                timer._callback(*timer._args)
+            except Exception:
+                print('Exception in lease timer callback', file=sys.stderr)
+                traceback.print_exc()
+        with self._heap_mutex:
+            self._rearm()
+        return False    # One-shot GLib timeout, we re-armed a new one if needed
+
+
+class ThreadedLeaseTimerScheduler(LeaseTimerScheduler):
+    """
+    LeaseTimerScheduler that does not need a GLib main loop: timer callbacks are run from a background thread owned by this object
+    One single instance (see getShared()) can be shared by all objects of a process that need lease timers
+    """
+
+    _shared = None    # The shared ThreadedLeaseTimerScheduler instance
+    _shared_mutex = threading.Lock()    # This mutex protects writes to the _shared attribute
+
+    def __init__(self):
+        LeaseTimerScheduler.__init__(self)
+        self._wakeup = threading.Condition(self._heap_mutex)    # Notified when the earliest deadline changes
+        self._thread = threading.Thread(target = self._run)
+        self._thread.setDaemon(True)    # Pending timers should not prevent the main program from terminating
+        self._thread.start()
+
+    @classmethod
+    def getShared(cls):
+        """
+        Get the ThreadedLeaseTimerScheduler instance shared by the whole process (start it if needed)
+        """
+        with cls._shared_mutex:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def _arm(self, deadline):
+        self._wakeup.notify()    # Our thread will wait until the new deadline
+
+    def _disarm(self):
+        pass    # Our thread always waits for the current _armed_deadline
+
+    def _run(self):
+        """
+        Background thread waiting for the earliest deadline and running the expired timers
+        """
+        while True:
+            with self._heap_mutex:
+                while True:
+                    deadline = self._armed_deadline
+                    if deadline is None:
+                        self._wakeup.wait()
+                    else:
+                        delay = deadline - monotonic()
+                        if delay <= 0:
+                            break
+                        self._wakeup.wait(delay)
+            self._onTimeout()
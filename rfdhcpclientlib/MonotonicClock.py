@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import time
+import ctypes
+import ctypes.util
+import os
+
+CLOCK_MONOTONIC = 1    # Clock ID of the Linux monotonic clock (see clock_gettime(2))
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+def _getClockGettime():
+    """
+    Get the clock_gettime() function from the C library
+    Returns None if it is not available on this system
+    """
+    try:
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno = True)
+        return librt.clock_gettime
+    except (OSError, AttributeError):
+        return None
+
+_clock_gettime = _getClockGettime()
+
+def monotonic():
+    """
+    Returns the value (in seconds, as a float) of a monotonic clock
+    Only differences between two values returned by this function are meaningful. Contrary to time.time(), this clock is not affected by system clock updates
+    """
+    if hasattr(time, 'monotonic'):
+        return time.monotonic()
+    if _clock_gettime is None:
+        raise Exception('NoMonotonicClock')
+    t = _timespec()
+    if _clock_gettime(CLOCK_MONOTONIC, ctypes.pointer(t)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    return t.tv_sec + t.tv_nsec * 1e-9
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+import os
+import errno
+import socket
+import struct
+import fcntl
+import threading
+
+NETLINK_ROUTE = 0
+
+# Netlink message types (see linux/netlink.h and linux/rtnetlink.h)
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+
+# Netlink message flags
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_REPLACE = 0x100
+NLM_F_CREATE = 0x400
+NLM_F_DUMP = 0x300
+
+# Address attributes (see linux/if_addr.h)
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+IFA_BROADCAST = 4
+
+# Route attributes (see linux/rtnetlink.h)
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_PREFSRC = 7
+RTA_TABLE = 15
+
+RT_TABLE_MAIN = 254
+RTPROT_DHCP = 16    # Routes added by a DHCP client
+RT_SCOPE_UNIVERSE = 0
+RTN_UNICAST = 1
+
+SIOCGIFINDEX = 0x8933    # Get interface index
+
+NETLINK_REPLY_TIMEOUT = 2    # Delay (in seconds) after which we give up waiting for the kernel's reply to a request
+
+NLMSGHDR_FORMAT = '=IHHII'    # struct nlmsghdr: length, type, flags, sequence, port ID
+IFADDRMSG_FORMAT = '=BBBBI'    # struct ifaddrmsg: family, prefix length, flags, scope, interface index
+RTMSG_FORMAT = '=BBBBBBBBI'    # struct rtmsg: family, dst length, src length, tos, table, protocol, scope, type, flags
+RTATTR_FORMAT = '=HH'    # struct rtattr: length, type
+
+SAVED_ADDRESS_ATTRIBUTES = [IFA_ADDRESS, IFA_LOCAL, IFA_LABEL, IFA_BROADCAST]    # Attributes kept when saving an address, to restore it later
+SAVED_ROUTE_ATTRIBUTES = [RTA_DST, RTA_OIF, RTA_GATEWAY, RTA_PRIORITY, RTA_PREFSRC, RTA_TABLE]    # Attributes kept when saving a route, to restore it later
+
+def _align(length):
+    """
+    Round length up to the netlink alignment (4 bytes)
+    """
+    return (length + 3) & ~3
+
+def _packAttribute(attr_type, value):
+    """
+    Encode one netlink attribute (value being a binary string)
+    """
+    length = struct.calcsize(RTATTR_FORMAT) + len(value)
+    return struct.pack(RTATTR_FORMAT, length, attr_type) + value + '\0' * (_align(length) - length)
+
+def _unpackAttributes(data):
+    """
+    Decode a sequence of netlink attributes
+    Returns a list of (type, value) tuples
+    """
+    attributes = []
+    offset = 0
+    header_size = struct.calcsize(RTATTR_FORMAT)
+    while offset + header_size <= len(data):
+        (length, attr_type) = struct.unpack_from(RTATTR_FORMAT, data, offset)
+        if length < header_size:
+            break
+        attributes.append((attr_type, data[offset + header_size:offset + length]))
+        offset += _align(length)
+    return attributes
+
+def netmaskToPrefixLen(netmask):
+    """
+    Convert a dotted-decimal IPv4 netmask (eg: '255.255.255.0') into a prefix length (eg: 24)
+    """
+    return bin(struct.unpack('!I', socket.inet_aton(netmask))[0]).count('1')
+
+def getIfIndex(ifname):
+    """
+    Get the index of the network interface ifname
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        info = fcntl.ioctl(s.fileno(), SIOCGIFINDEX, struct.pack('256s', str(ifname)[:15]))
+    finally:
+        s.close()
+    return struct.unpack_from('I', info, 16)[0]
+
+class NetlinkIfaceConfig:
+    """
+    IPv4 configuration of network interfaces (addresses and routes) using rtnetlink
+    Each request is acknowledged by the kernel: methods return once the change is effective, and raise an OSError (with the errno sent back by the kernel) if it failed
+    If the kernel's reply is not received within reply_timeout seconds, methods raise socket.timeout
+    """
+
+    def __init__(self, reply_timeout = NETLINK_REPLY_TIMEOUT):
+        self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self._socket.bind((0, 0))
+        self._socket.settimeout(reply_timeout)    # Our callers run from a main loop, that must never be blocked forever by a lost reply
+        self._socket_mutex = threading.Lock()    # This mutex makes sure only one request is in flight on self._socket at any time
+        self._sequence = 0
+
+    def close(self):
+        self._socket.close()
+
+    def _request(self, msg_type, flags, payload):
+        """
+        Send one netlink request and wait for the kernel's reply
+        Returns the list of (type, payload) tuples of the messages received in reply (for dump requests), or an empty list for acknowledged requests
+        Will raise socket.timeout if no reply to this request is received in time
+        """
+        with self._socket_mutex:
+            self._sequence += 1
+            sequence = self._sequence
+            header_size = struct.calcsize(NLMSGHDR_FORMAT)
+            self._socket.send(struct.pack(NLMSGHDR_FORMAT, header_size + len(payload), msg_type, NLM_F_REQUEST | flags, sequence, 0) + payload)
+            messages = []
+            while True:
+                data = self._socket.recv(65536)
+                offset = 0
+                while offset + header_size <= len(data):
+                    (length, reply_type, reply_flags, reply_sequence, reply_pid) = struct.unpack_from(NLMSGHDR_FORMAT, data, offset)
+                    if length < header_size:
+                        raise Exception('MalformedNetlinkMessage')
+                    reply_payload = data[offset + header_size:offset + length]
+                    offset += _align(length)
+                    if reply_sequence != sequence:
+                        continue    # Not a reply to our request
+                    if reply_type == NLMSG_DONE:
+                        return messages
+                    elif reply_type == NLMSG_ERROR:
+                        error = struct.unpack_from('=i', reply_payload)[0]
+                        if error == 0:    # Acknowledgement
+                            return messages
+                        raise OSError(-error, os.strerror(-error))
+                    else:
+                        messages.append((reply_type, reply_payload))
+
+    def _dump(self, msg_type, header):
+        """
+        Dump kernel objects (eg: addresses with RTM_GETADDR)
+        Returns a list of (header payload, attributes) tuples, header payload being the fixed-size header (ifaddrmsg, rtmsg...) and attributes a list of (type, value) tuples
+        """
+        header_size = len(header)
+        return [(payload[:header_size], _unpackAttributes(payload[_align(header_size):])) for (reply_type, payload) in self._request(msg_type, NLM_F_DUMP, header)]
+
+    def getAddresses(self, ifindex):
+        """
+        Get the IPv4 addresses of interface ifindex
+        Returns a list of (ifaddrmsg header, attributes) tuples that can be provided to restoreAddress()
+        """
+        addresses = []
+        for (header, attributes) in self._dump(RTM_GETADDR, struct.pack(IFADDRMSG_FORMAT, socket.AF_INET, 0, 0, 0, 0)):
+            if struct.unpack(IFADDRMSG_FORMAT, header)[4] == ifindex:
+                addresses.append((header, [(attr_type, value) for (attr_type, value) in attributes if attr_type in SAVED_ADDRESS_ATTRIBUTES]))
+        return addresses
+
+    def getRoutes(self, ifindex):
+        """
+        Get the IPv4 routes of the main routing table going through interface ifindex
+        Returns a list of (rtmsg header, attributes) tuples that can be provided to restoreRoute()
+        """
+        routes = []
+        for (header, attributes) in self._dump(RTM_GETROUTE, struct.pack(RTMSG_FORMAT, socket.AF_INET, 0, 0, 0, 0, 0, 0, 0, 0)):
+            if struct.unpack(RTMSG_FORMAT, header)[4] != RT_TABLE_MAIN:
+                continue
+            if not (RTA_OIF, struct.pack('=I', ifindex)) in attributes:
+                continue
+            routes.append((header, [(attr_type, value) for (attr_type, value) in attributes if attr_type in SAVED_ROUTE_ATTRIBUTES]))
+        return routes
+
+    def restoreAddress(self, address):
+        """
+        Add an address previously returned by getAddresses() (this is a no-op if it already exists)
+        """
+        (header, attributes) = address
+        try:
+            self._request(RTM_NEWADDR, NLM_F_ACK | NLM_F_CREATE | NLM_F_REPLACE, header + ''.join([_packAttribute(attr_type, value) for (attr_type, value) in attributes]))
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+
+    def restoreRoute(self, route):
+        """
+        Add a route previously returned by getRoutes() (this is a no-op if it already exists)
+        """
+        (header, attributes) = route
+        try:
+            self._request(RTM_NEWROUTE, NLM_F_ACK | NLM_F_CREATE | NLM_F_REPLACE, header + ''.join([_packAttribute(attr_type, value) for (attr_type, value) in attributes]))
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+
+    def flushAddresses(self, ifindex):
+        """
+        Remove all IPv4 addresses of interface ifindex (routes going through these addresses are removed by the kernel)
+        """
+        for (header, attributes) in self.getAddresses(ifindex):
+            self._request(RTM_DELADDR, NLM_F_ACK, header + ''.join([_packAttribute(attr_type, value) for (attr_type, value) in attributes]))
+
+    def addAddress(self, ifindex, ipv4_address, ipv4_netmask):
+        """
+        Add IPv4 address ipv4_address with netmask ipv4_netmask (both as dotted-decimal strings) to interface ifindex
+        """
+        prefixlen = netmaskToPrefixLen(ipv4_netmask)
+        address = socket.inet_aton(ipv4_address)
+        broadcast = struct.pack('!I', struct.unpack('!I', address)[0] | (~struct.unpack('!I', socket.inet_aton(ipv4_netmask))[0] & 0xffffffff))
+        payload = struct.pack(IFADDRMSG_FORMAT, socket.AF_INET, prefixlen, 0, RT_SCOPE_UNIVERSE, ifindex)
+        payload += _packAttribute(IFA_LOCAL, address) + _packAttribute(IFA_ADDRESS, address) + _packAttribute(IFA_BROADCAST, broadcast)
+        self._request(RTM_NEWADDR, NLM_F_ACK | NLM_F_CREATE | NLM_F_REPLACE, payload)
+
+    def _defaultRoutePayload(self, ifindex, ipv4_gateway):
+        payload = struct.pack(RTMSG_FORMAT, socket.AF_INET, 0, 0, 0, RT_TABLE_MAIN, RTPROT_DHCP, RT_SCOPE_UNIVERSE, RTN_UNICAST, 0)
+        payload += _packAttribute(RTA_GATEWAY, socket.inet_aton(ipv4_gateway)) + _packAttribute(RTA_OIF, struct.pack('=I', ifindex))
+        return payload
+
+    def addDefaultRoute(self, ifindex, ipv4_gateway):
+        """
+        Add an IPv4 default route, via gateway ipv4_gateway (as a dotted-decimal string) on interface ifindex
+        Existing default routes (possibly on other interfaces) are left untouched, as with 'route add default gw'
+        Returns True if the route was added, or False if this exact route already existed
+        """
+        try:
+            self._request(RTM_NEWROUTE, NLM_F_ACK | NLM_F_CREATE, self._defaultRoutePayload(ifindex, ipv4_gateway))
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+            return False
+        return True
+
+    def deleteDefaultRoute(self, ifindex, ipv4_gateway):
+        """
+        Remove the IPv4 default route via gateway ipv4_gateway on interface ifindex (this is a no-op if it does not exist anymore)
+        """
+        try:
+            self._request(RTM_DELROUTE, NLM_F_ACK, self._defaultRoutePayload(ifindex, ipv4_gateway))
+        except OSError as ex:
+            if ex.errno != errno.ESRCH:
+                raise
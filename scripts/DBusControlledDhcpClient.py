@@ -10,6 +10,7 @@ import signal
 import gobject
 import dbus
 import dbus.service
+import dbus.server
 import dbus.mainloop.glib
 
 import argparse
@@ -17,11 +18,15 @@ import argparse
 import subprocess
 
 import random
+import socket
+import struct
+import urllib
 
 import MacAddr
 
 import threading
 import time
+import traceback
 
 import atexit
 import lockfile
@@ -30,15 +35,26 @@ from pydhcplib.dhcp_packet import *
 from pydhcplib.dhcp_network import *
 
 import rfdhcpclientlib.DhcpLeaseStatus
+import rfdhcpclientlib.DbusLeaseState
+import rfdhcpclientlib.DhcpPacketTemplate
+import rfdhcpclientlib.LazyDhcpPacket
+import rfdhcpclientlib.LeaseTimerScheduler
+import rfdhcpclientlib.DhcpLatencyHistogram
+import rfdhcpclientlib.DhcpRetransmitBackoff
+import rfdhcpclientlib.DhcpOfferSelector
+import rfdhcpclientlib.NetlinkIfaceConfig
+import rfdhcpclientlib.MonotonicClock
+import rfdhcpclientlib.DhcpPcapFile
+import rfdhcpclientlib.DhcpControlChannel
 
 #import pyiface	# Commented-out... for now we are using the system's userspace tools (ifconfig, route etc...)
 
 progname = os.path.basename(sys.argv[0])
 
-main_lock = None	# FileLock object used to force only one DHCP client instance on a given network interface
+main_lock = None	# FileLock object used to force only one DHCP client instance on a given network interface (in load generator mode, DhcpClientManager holds one lock per interface otherwise)
 client = None	# Global instance of DHCP client
 
-VERSION = '1.0.0'
+VERSION = '1.2.0'
 
 # DHCP types names array (index is the DHCP type)
 DHCP_TYPES = ['UNKNOWN',
@@ -56,7 +72,14 @@ DBUS_NAME = 'com.legrandelectric.RobotFrameworkIPC.DhcpClientLibrary'	# The name
 DBUS_OBJECT_ROOT = '/com/legrandelectric/RobotFrameworkIPC/DhcpClientLibrary'	# The root under which we will create a D-Bus object with the name of the network interface for D-Bus communication, eg: /com/legrandelectric/RobotFrameworkIPC/DhcpClientLibrary/eth0 for an instance running on eth0
 DBUS_SERVICE_INTERFACE = 'com.legrandelectric.RobotFrameworkIPC.DhcpClientLibrary'	# The name of the D-Bus service under which we will perform input/output on D-Bus
 
+DHCP_EXCHANGES = ['discover_offer',	# DISCOVER sent -> first OFFER received
+	'request_ack',	# REQUEST sent (after an OFFER) -> ACK received
+	'renew_ack',	# REQUEST sent (renewing a lease) -> ACK received
+]	# Types of DHCP exchanges whose latency is measured
+
 CLIENT_ID_HWTYPE_ETHER = 0x01	# HWTYPE byte as used in the client_identifier DHCP option
+MAX_DHCP_PACKET_SIZE = 2048	# Size of the buffer used to receive DHCP packets (as in pydhcplib)
+RENEW_MIN_RETRANSMIT_INTERVAL = 60	# Minimum delay (in seconds) before sending again a renew REQUEST that got no reply (RFC 2131 section 4.4.5)
 
 def dhcpNameToType(name, exception_on_unknown = True):
 	"""
@@ -88,6 +111,73 @@ def dhcpTypeToName(type, exception_on_unknown = True):
 		else:
 			return 'UNKNOWN'
 
+def getRenewalTimes(packet, lease_duration):
+	"""
+	Get the delays (in seconds, from the reception of the ACK packet granting a lease of lease_duration seconds) after which the lease should be renewed (T1) and rebound (T2), as a (t1, t2) tuple
+	T1 and T2 are taken from the renewal_time_value (58) and rebinding_time_value (59) options of packet if the server provided them, otherwise (or if they are inconsistent), the defaults of RFC 2131 section 4.4.5 are used: half the lease duration for T1, and 7/8 of the lease duration for T2
+	"""
+	t1 = packet.GetUInt32Option('renewal_time_value')
+	t2 = packet.GetUInt32Option('rebinding_time_value')
+	if t2 is None or t2 > lease_duration:
+		t2 = lease_duration * 7 / 8.0
+	if t1 is None or t1 > t2:
+		t1 = min(lease_duration / 2.0, t2)
+	return (t1, t2)
+
+def getRenewRetransmitInterval(remaining, lease_duration):
+	"""
+	Get the delay before sending again a renew REQUEST that got no reply, remaining being the time left (in seconds) before T2 when renewing, or before the lease expires when rebinding
+	As recommended by RFC 2131 section 4.4.5, we wait for half of the remaining time, but at least RENEW_MIN_RETRANSMIT_INTERVAL seconds (this minimum is scaled down for leases shorter than 16 times its value, such as the short leases used in tests)
+	Returns None if no other REQUEST should be sent before T2 (or before the lease expires)
+	"""
+	interval = max(remaining / 2.0, min(RENEW_MIN_RETRANSMIT_INTERVAL, lease_duration / 16.0))
+	if interval >= remaining:
+		return None
+	return interval
+
+
+def buildDhcpPacketTemplate(mac_addr, message_type, parameter_list = None, patchable_options = ()):
+	"""
+	Build a DhcpPacketTemplate for a DHCP packet of type message_type (eg: 'DISCOVER') sent by a client with MAC address mac_addr
+	xid and ciaddr are left empty in the template, options listed in patchable_options are set to 0.0.0.0. All of these will be patched when sending
+	"""
+	dhcp_packet = rfdhcpclientlib.LazyDhcpPacket.LazyDhcpPacket()
+	dhcp_packet.SetOption('op', [1])
+	dhcp_packet.SetOption('htype', [1])
+	dhcp_packet.SetOption('hlen', [6])
+	dhcp_packet.SetOption('hops', [0])
+	dhcp_packet.SetOption('xid', [0] * 4)
+	dhcp_packet.SetOption('giaddr', ipv4('0.0.0.0').list())
+	dhcp_packet.SetOption('chaddr', hwmac(mac_addr).list() + [0] * 10)
+	dhcp_packet.SetOption('ciaddr', ipv4('0.0.0.0').list())
+	dhcp_packet.SetOption('siaddr', ipv4('0.0.0.0').list())
+	dhcp_packet.SetOption('dhcp_message_type', [dhcpNameToType(message_type)])
+	dhcp_packet.SetOption('client_identifier', [CLIENT_ID_HWTYPE_ETHER] + hwmac(mac_addr).list())
+	for option in patchable_options:
+		dhcp_packet.SetOption(option, ipv4('0.0.0.0').list())
+	if not parameter_list is None:
+		dhcp_packet.SetOption('parameter_request_list', list(parameter_list))
+	dhcp_packet.SetOption('flags', [128, 0])
+	return rfdhcpclientlib.DhcpPacketTemplate.DhcpPacketTemplate(dhcp_packet, patchable = ('xid', 'ciaddr') + tuple(patchable_options))
+
+def encodeDhcpPacketFromTemplate(template_cache, mac_addr, message_type, xid, parameter_list = None, ciaddr = '0.0.0.0', buffer = None, **options):
+	"""
+	Encode a DHCP packet of type message_type (eg: 'DISCOVER') sent by a client with MAC address mac_addr, using transaction ID xid
+	The template for this packet is taken from template_cache (a DhcpPacketTemplateCache object) or built and stored in template_cache if it is not there yet
+	Only xid, ciaddr and the IPv4 options provided as keyword arguments (eg: server_identifier = '192.168.0.1') are patched
+	If buffer (a bytearray) is provided, the packet is encoded into it
+	Returns the bytearray holding the encoded packet
+	"""
+	patchable_options = tuple(sorted(options.keys()))
+	if not parameter_list is None:
+		parameter_list = tuple(parameter_list)
+	template = template_cache.get((message_type, mac_addr, parameter_list, patchable_options),
+		lambda: buildDhcpPacketTemplate(mac_addr, message_type, parameter_list = parameter_list, patchable_options = patchable_options))
+	values = {'xid': struct.pack('!I', xid),
+		'ciaddr': socket.inet_aton(str(ciaddr))}
+	for name, value in options.iteritems():
+		values[name] = socket.inet_aton(str(value))
+	return template.build(buffer = buffer, **values)
 
 def cleanupAtExit():
     """
@@ -118,23 +208,389 @@ def signalHandler(signum, frame):
 		#print(progname + ': Ignoring signal ' + str(signum), file=sys.stderr)
 		pass
 
-class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
-    def __init__(self, conn, dbus_loop, object_name=DBUS_OBJECT_ROOT, ifname = None, listen_address = '0.0.0.0', client_port = 68, server_port = 67, mac_addr = None, apply_ip = False, dump_packets = False, silent_mode = True, **kwargs):
+def restrictSocketAccess(path):
+	"""
+	Only let the user who ran us via sudo (and root) connect to the unix socket at path
+	"""
+	if 'SUDO_UID' in os.environ:
+		os.chown(path, int(os.environ['SUDO_UID']), int(os.environ.get('SUDO_GID', -1)))
+	os.chmod(path, 0600)
+
+class DbusPeerServer:
+    """
+    Private D-Bus server, that DhcpClientLibrary can connect to directly (peer-to-peer) instead of going through the system bus daemon
+    D-Bus objects registered with exportObject() are published on every peer connection, their signals are thus sent to all connected peers
+    Peers authenticate anonymously: access control relies on the permissions of the server's socket, that is only made accessible to the user who ran us via sudo (if any)
+    """
+    
+    def __init__(self, address):
+        """
+        Listen on D-Bus address (eg: 'unix:path=/tmp/dhcpclient.sock')
+        """
+        self._server = dbus.server.Server(address, auth_mechanisms = ['ANONYMOUS'])
+        self._server.on_connection_added.append(self._onConnectionAdded)
+        self._server.on_connection_removed.append(self._onConnectionRemoved)
+        self._connections = []    # All currently connected peers
+        self._objects = {}    # Exported D-Bus objects, indexed by object path
+        self.address = self._server.address    # Actual address of this server (eg: with the GUID added by libdbus)
+        (transport, params) = address.split(':', 1)
+        if transport == 'unix':
+            for param in params.split(','):
+                (key, value) = param.split('=', 1)
+                if key == 'path':
+                    restrictSocketAccess(urllib.unquote(value))
+    
+    def _onConnectionAdded(self, conn):
+        conn.set_allow_anonymous(True)
+        self._connections.append(conn)
+        for (object_path, dbus_object) in self._objects.iteritems():
+            dbus_object.add_to_connection(conn, object_path)
+    
+    def _onConnectionRemoved(self, conn):
+        if conn in self._connections:
+            self._connections.remove(conn)
+        for dbus_object in self._objects.values():
+            try:
+                dbus_object.remove_from_connection(conn)
+            except LookupError:
+                pass    # Already removed
+    
+    def exportObject(self, dbus_object, object_path):
+        """
+        Publish dbus_object (whose class must support multiple connections) at object_path on all current and future peer connections
+        """
+        self._objects[object_path] = dbus_object
+        for conn in self._connections:
+            dbus_object.add_to_connection(conn, object_path)
+    
+    def unexportObject(self, object_path):
+        """
+        Stop publishing the object at object_path
+        """
+        dbus_object = self._objects.pop(object_path, None)
+        if dbus_object is None:
+            return
+        for conn in self._connections:
+            try:
+                dbus_object.remove_from_connection(conn)
+            except LookupError:
+                pass    # Already removed (eg: by DBusControlledDhcpClient.close())
+    
+    def close(self):
+        """
+        Stop listening for new peers
+        """
+        self._server.disconnect()
+
+
+class UnixSocketControlServer:
+    """
+    Serves the control protocol of rfdhcpclientlib.DhcpControlChannel on a unix socket, alongside (or instead of) D-Bus
+    The DHCP clients registered with addClient() can be controlled by all connected peers, and their DHCP transitions are sent to all connected peers
+    Like for DbusPeerServer, access control relies on the permissions of the socket
+    """
+    
+    def __init__(self, path):
+        """
+        Listen on the unix socket path (an existing file at this path is replaced)
+        """
+        if os.path.exists(path):
+            os.unlink(path)
+        self.path = path
+        self._listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listen_socket.bind(path)
+        restrictSocketAccess(path)
+        self._listen_socket.listen(5)
+        self._listen_watch_id = gobject.io_add_watch(self._listen_socket, gobject.IO_IN, self._onListenSocketReadable)
+        self._channels = {}    # GLib IO watch ID on the socket of each connected peer, indexed by DhcpControlChannel
+        self._output_watches = {}    # GLib IO watch ID flushing the data queued for a peer (only while this peer is not reading fast enough), indexed by DhcpControlChannel
+        self._clients = {}    # DHCP clients that can be controlled, indexed by interface name
+    
+    def _onListenSocketReadable(self, source, condition):
+        (sock, peer_address) = self._listen_socket.accept()
+        sock.setblocking(False)
+        channel = rfdhcpclientlib.DhcpControlChannel.DhcpControlChannel(sock)
+        self._channels[channel] = gobject.io_add_watch(sock, gobject.IO_IN | gobject.IO_HUP | gobject.IO_ERR, self._onChannelReadable, channel)
+        return True
+    
+    def _onChannelReadable(self, source, condition, channel):
+        try:
+            messages = channel.receiveMessages()
+        except Exception:
+            messages = None    # Protocol error, drop this peer
+        if messages is None:
+            self._closeChannel(channel)
+            return False    # Remove the IO watch
+        for message in messages:
+            self._handleRequest(channel, message)
+        return True
+    
+    def _handleRequest(self, channel, message):
+        """
+        Invoke the method requested by message on the DHCP client of the requested interface, and send back the result (or the error) to the peer
+        """
+        reply = {'id': message.get('id')}
+        dhcp_client = self._clients.get(message.get('ifname'))
+        method = message.get('method')
+        if dhcp_client is None:
+            reply['error'] = 'UnknownInterface'
+        elif not method in rfdhcpclientlib.DhcpControlChannel.CONTROL_METHODS:
+            reply['error'] = 'UnknownMethod'
+        else:
+            try:
+                result = getattr(dhcp_client, method)()    # D-Bus methods of DBusControlledDhcpClient are plain methods when called from Python
+                if method == 'GetLease':
+                    result = rfdhcpclientlib.DbusLeaseState.decodeLeaseState(result)    # IPv4 addresses are binary D-Bus byte arrays, that cannot be serialized as is
+                reply['result'] = result
+            except Exception as ex:
+                reply['error'] = str(ex)
+        self._sendMessage(channel, reply)
+    
+    def _sendEvent(self, lease_state):
+        """
+        Send a DHCP transition (lease_state being the dictionary emitted in the LeaseStateChanged D-Bus signal) to all connected peers
+        """
+        message = {'event': rfdhcpclientlib.DbusLeaseState.decodeLeaseState(lease_state)}
+        for channel in self._channels.keys():
+            self._sendMessage(channel, message)
+    
+    def _sendMessage(self, channel, message):
+        """
+        Send message to the peer connected on channel without blocking the main loop: the data that the peer cannot receive yet is sent later, when its socket becomes writable
+        """
+        try:
+            if not channel.queueMessage(message) and not channel in self._output_watches:
+                self._output_watches[channel] = gobject.io_add_watch(channel.sock, gobject.IO_OUT, self._onChannelWritable, channel)
+        except Exception:
+            self._closeChannel(channel)    # The peer is gone, or has stopped reading
+    
+    def _onChannelWritable(self, source, condition, channel):
+        try:
+            flushed = channel.flush()
+        except socket.error:
+            flushed = None
+        if flushed is False:
+            return True    # Keep the IO watch until all queued data is sent
+        del self._output_watches[channel]    # The IO watch is removed when we return False
+        if flushed is None:
+            self._closeChannel(channel)
+        return False
+    
+    def _closeChannel(self, channel):
+        watch_id = self._channels.pop(channel, None)
+        if not watch_id is None:
+            gobject.source_remove(watch_id)
+        watch_id = self._output_watches.pop(channel, None)
+        if not watch_id is None:
+            gobject.source_remove(watch_id)
+        channel.close()
+    
+    def addClient(self, ifname, dhcp_client):
+        """
+        Let peers control dhcp_client (a DBusControlledDhcpClient) as interface ifname, and send them its DHCP transitions
+        """
+        self._clients[ifname] = dhcp_client
+        dhcp_client.addLeaseStateListener(self._sendEvent)
+    
+    def removeClient(self, ifname):
+        dhcp_client = self._clients.pop(ifname, None)
+        if not dhcp_client is None:
+            dhcp_client.removeLeaseStateListener(self._sendEvent)
+    
+    def close(self):
+        """
+        Disconnect all peers and stop listening
+        """
+        for channel in self._channels.keys():
+            self._closeChannel(channel)
+        gobject.source_remove(self._listen_watch_id)
+        self._listen_socket.close()
+        os.unlink(self.path)
+
+
+class MainLoopDhcpClient(DhcpClient):
+    """
+    pydhcplib DhcpClient whose incoming DHCP packets are handled from within a GLib main loop
+    The DHCP socket is registered as an IO watch on the default GLib context, so that DHCP packets, timeouts and D-Bus messages are all processed by the single thread running the main loop (see run())
+    """
+    
+    def __init__(self, main_loop, ifname = None, listen_address = '0.0.0.0', client_port = 68, server_port = 67, broadcast_address = '255.255.255.255', pcap_writer = None, replay = False):
+        """
+        Create the DHCP socket, bind it to ifname (if specified) or a specific interface address listen_address (if specified) and start watching it from main_loop
+        Packets that should be broadcast are sent to broadcast_address instead (eg: 127.0.0.1 to reach a mock DHCP server listening on the loopback interface)
+        If pcap_writer (a DhcpPcapWriter object) is provided, all DHCP packets sent and received are recorded into it
+        If replay is True, the socket is neither bound nor watched and no packet is actually sent to the network: incoming packets are fed by replayPcapFile() instead
+        """
+        DhcpClient.__init__(self, ifname = ifname, listen_address = listen_address, client_listen_port = client_port, server_listen_port = server_port)
+        
+        self._client_port = client_port
+        self._server_port = server_port
+        self._broadcast_address = broadcast_address
+        self._pcap_writer = pcap_writer
+        self._replay = replay
+        
+        if not self._replay:
+            if ifname:
+                self.BindToDevice()
+            if listen_address != '0.0.0.0' and listen_address != '::':    # 0.0.0.0 and :: are addresses any in IPv4 and IPv6 respectively
+                self.BindToAddress()
+        
+        self._main_loop = main_loop
+        self._receive_buffer = bytearray(MAX_DHCP_PACKET_SIZE)    # Reusable buffer into which incoming DHCP packets are read
+        self._send_buffer = bytearray()    # Reusable buffer into which outgoing DHCP packets are encoded
+        if self._replay:
+            self._socket_watch_id = None
+        else:
+            self._socket_watch_id = gobject.io_add_watch(self.dhcp_socket, gobject.IO_IN, self._onDhcpSocketReadable)
+    
+    def sendDhcpPacket(self, packet, dstipaddr):
+        """
+        Send an encoded DHCP packet to dstipaddr (on the server port), and record it if we have a pcap writer
+        """
+        if dstipaddr == '255.255.255.255':
+            dstipaddr = self._broadcast_address
+        if not self._pcap_writer is None:
+            self._pcap_writer.writeDatagram(packet, ('0.0.0.0', self._client_port), (dstipaddr, self._server_port))
+        if self._replay:
+            return    # Replayed sessions never reach the network
+        bytes_sent = self.dhcp_socket.sendto(packet, (dstipaddr, self._server_port))
+        if bytes_sent == 0:
+            raise Exception('FailedSendDhcpPacketTo')
+    
+    def readDhcpPacket(self):
+        """
+        Read one DHCP packet from our socket (and record it if we have a pcap writer)
+        The packet is read into our receive buffer, so it is only valid until the next packet is received: handlers must not keep a reference to it
+        Returns a (data, source_address) tuple
+        """
+        (nbytes, source_address) = self.dhcp_socket.recvfrom_into(self._receive_buffer)
+        data = memoryview(self._receive_buffer)[:nbytes]
+        if not self._pcap_writer is None:
+            self._pcap_writer.writeDatagram(data, source_address, ('255.255.255.255', self._client_port), timestamp = rfdhcpclientlib.DhcpPcapFile.getKernelTimestamp(self.dhcp_socket))    # The destination address of a received datagram is not known, so we record it as broadcast
+        return (data, source_address)
+    
+    def receiveDhcpPacket(self):
+        """
+        Read one DHCP packet from our socket and dispatch it (see readDhcpPacket() and dispatchDhcpPacket())
+        """
+        (data, source_address) = self.readDhcpPacket()
+        return self.dispatchDhcpPacket(data, source_address)
+    
+    def dispatchDhcpPacket(self, data, source_address):
+        """
+        Decode the DHCP packet data received from source_address and dispatch it to the HandleDhcpOffer(), HandleDhcpAck() or HandleDhcpNack() methods
+        The packet is decoded lazily by a LazyDhcpPacket, directly from data
+        Returns the LazyDhcpPacket object, or None if data is not a DHCP packet
+        """
+        packet = rfdhcpclientlib.LazyDhcpPacket.LazyDhcpPacket()
+        packet.source_address = source_address
+        if not packet.DecodePacket(data):
+            return None    # Not a DHCP packet
+        message_type = packet.GetDhcpMessageType()
+        if message_type == rfdhcpclientlib.LazyDhcpPacket.DHCP_MESSAGE_TYPES['OFFER']:
+            self.HandleDhcpOffer(packet)
+        elif message_type == rfdhcpclientlib.LazyDhcpPacket.DHCP_MESSAGE_TYPES['ACK']:
+            self.HandleDhcpAck(packet)
+        elif message_type == rfdhcpclientlib.LazyDhcpPacket.DHCP_MESSAGE_TYPES['NACK']:
+            self.HandleDhcpNack(packet)
+        else:
+            self.HandleDhcpUnknown(packet)
+        return packet
+    
+    def replayPcapFile(self, pcap_reader):
+        """
+        Feed the DHCP server replies recorded in pcap_reader (a DhcpPcapReader object) to dispatchDhcpPacket(), in the order in which they were recorded, as if they were received on our socket
+        The client requests recorded in between (datagrams sent from the DHCP client port to the DHCP server port) are passed to replayClientPacket(), so that our state follows the recorded session. Retransmissions of these requests (sent again with the same xid) and other datagrams are skipped
+        Returns the number of replayed server replies
+        """
+        nb_packets = 0
+        last_request = None    # (message type, xid) of the last recorded client request
+        for (timestamp, source_address, destination_address, data) in pcap_reader:
+            if source_address[1] == self._client_port and destination_address[1] == self._server_port:
+                packet = rfdhcpclientlib.LazyDhcpPacket.LazyDhcpPacket()
+                if packet.DecodePacket(data):
+                    request = (packet.GetDhcpMessageType(), packet.GetUInt32Option('xid'))
+                    if request != last_request:
+                        self.replayClientPacket(packet)
+                    last_request = request
+                continue
+            if source_address[1] != self._server_port:
+                continue
+            self.dispatchDhcpPacket(data, source_address)
+            nb_packets += 1
+        return nb_packets
+    
+    def replayClientPacket(self, packet):
+        """
+        Handle a new DHCP request (a LazyDhcpPacket object) sent by the recorded client, while replaying a pcap file (see replayPcapFile())
+        Timeouts do not expire while replaying, so subclasses should send the same request themselves when we would have sent it during the recorded session. The default implementation does nothing
+        """
+        pass
+    
+    def _onDhcpSocketReadable(self, source, condition):
+        """
+        GLib IO watch callback invoked when a DHCP packet is waiting on our socket
+        The packet is read and dispatched to the HandleDhcp*() methods
+        The main loop may be shared with DHCP clients running on other interfaces, so errors never stop it: if a handler raises an exception, the error is logged and the packet is dropped. If our socket cannot be read anymore, we only stop watching it
+        """
+        try:
+            (data, source_address) = self.readDhcpPacket()
+        except socket.error:
+            print('Exception while reading DHCP socket, no more DHCP packets will be received on it', file=sys.stderr)
+            traceback.print_exc()
+            self._socket_watch_id = None
+            return False    # Remove the IO watch
+        try:
+            self.dispatchDhcpPacket(data, source_address)
+        except Exception:
+            print('Exception while handling DHCP packet from ' + str(source_address[0]) + ', dropping it', file=sys.stderr)
+            traceback.print_exc()
+        return True
+    
+    def run(self):
+        """
+        Run the main loop (handling DHCP packets, timeouts and D-Bus messages) until stopMainLoop() is called
+        """
+        if not self._silent_mode: print('Starting mainloop')
+        self._main_loop.run()
+        if not self._silent_mode: print('Stopping mainloop')
+    
+    def stopWatchingSocket(self):
+        """
+        Stop handling incoming DHCP packets from the main loop (the main loop itself keeps running)
+        """
+        if not self._socket_watch_id is None:
+            gobject.source_remove(self._socket_watch_id)
+            self._socket_watch_id = None
+    
+    def stopMainLoop(self):
+        """
+        Stop watching our DHCP socket and make run() return
+        """
+        self.stopWatchingSocket()
+        self._main_loop.quit()
+
+
+class DBusControlledDhcpClient(MainLoopDhcpClient, dbus.service.Object):
+    SUPPORTS_MULTIPLE_CONNECTIONS = True    # When using a DbusPeerServer, we are published on each peer connection
+    
+    def __init__(self, conn, dbus_loop, object_name=DBUS_OBJECT_ROOT, ifname = None, listen_address = '0.0.0.0', client_port = 68, server_port = 67, mac_addr = None, apply_ip = False, dump_packets = False, silent_mode = True, scheduler = None, retransmit_backoff = None, iface_config = 'netlink', broadcast_address = '255.255.255.255', pcap_writer = None, replay = False, offer_window = 0, offer_policy = 'first', preferred_server_id = None, **kwargs):
         """
         Instanciate a new DBusControlledDhcpClient client bound to ifname (if specified) or a specific interface address listen_address (if specified)
         Client listening UDP port and server destination UDP port can also be overridden from their default values
+        D-Bus messages, DHCP packets and lease timeouts will all be handled when dbus_loop is run (see run())
+        Lease timeouts are scheduled in scheduler (a LeaseTimerScheduler object, that can be shared with other clients in this process). If not provided, a new scheduler is created
+        DISCOVER and REQUEST packets that get no reply are retransmitted according to retransmit_backoff (a DhcpRetransmitBackoff object). If not provided, RFC 2131 default values are used
+        OFFERs are collected for offer_window seconds after a DISCOVER, then the one selected by offer_policy (with preferred_server_id for the 'serverid' policy) is requested, see rfdhcpclientlib.DhcpOfferSelector. With the default offer_window of 0, the first OFFER is requested immediately
+        If apply_ip is True, the lease is applied to the interface using netlink if iface_config is 'netlink' (the default), or using the ifconfig/route/ifup userspace tools if iface_config is 'subprocess' (or if netlink is not available)
+        broadcast_address, pcap_writer and replay are described in MainLoopDhcpClient. In replay mode, conn and object_name can be None (the D-Bus object is then not published)
         """
         
         # Note: **kwargs is here to make this contructor more generic (it will however force args to be named, but this is anyway good practice) and is a step towards efficient mutliple-inheritance with Python new-style-classes
-        DhcpClient.__init__(self, ifname = ifname, listen_address = listen_address, client_listen_port = client_port, server_listen_port = server_port)
+        MainLoopDhcpClient.__init__(self, main_loop = dbus_loop, ifname = ifname, listen_address = listen_address, client_port = client_port, server_port = server_port, broadcast_address = broadcast_address, pcap_writer = pcap_writer, replay = replay)
         if not ifname is None:
             object_name += '/' + str(ifname)    # Add /eth0 to object PATH if ifname is 'eth0'
-        dbus.service.Object.__init__(self, conn, object_name)
-        
-        if ifname:
-            self.BindToDevice()
-        if listen_address != '0.0.0.0' and listen_address != '::':    # 0.0.0.0 and :: are addresses any in IPv4 and IPv6 respectively
-            self.BindToAddress()
+        dbus.service.Object.__init__(self, conn, object_name if not conn is None else None)    # dbus-python refuses an object path without a connection: without conn, we are published later by a DbusPeerServer (or never, eg: in replay mode)
         
         self._ifname = ifname
         self._listen_address = listen_address
@@ -145,22 +601,41 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         self._dhcp_status = rfdhcpclientlib.DhcpLeaseStatus.DhcpLeaseStatus()
         
         self._request_sent = False
+        self._discover_sent = False    # Have we started a DHCP exchange since startup or since the last Reset()? Offers and Acks received otherwise are ignored
+        
+        self._latency_histograms = dict([(exchange, rfdhcpclientlib.DhcpLatencyHistogram.DhcpLatencyHistogram()) for exchange in DHCP_EXCHANGES])    # Latency of each type of DHCP exchange
+        self._pending_exchange = None    # (exchange type, monotonic timestamp of the request) for the exchange we are waiting a reply for
         
         self._parameter_list = None    # DHCP Parameter request list (options requested from the DHCP server)
         
+        self._packet_templates = rfdhcpclientlib.DhcpPacketTemplate.DhcpPacketTemplateCache()    # Pre-encoded DHCP packets that we send, indexed by message type, MAC address and parameter request list
+        
         self._random = random.Random()
         self._random.seed()
 
-        self._renew_thread = None
-        self._release_thread = None
+        if scheduler is None:
+            scheduler = rfdhcpclientlib.LeaseTimerScheduler.LeaseTimerScheduler()
+        self._scheduler = scheduler
+        self._renew_timer = None    # LeaseTimer handle on the pending renew timeout
+        self._release_timer = None    # LeaseTimer handle on the pending release timeout
+        self._rebind_timer = None    # LeaseTimer handle on the pending rebind timeout (T2)
+        self._rebinding = False    # Are we in the REBINDING state (T2 passed without our lease being renewed)? If not, renews are unicast to the server that granted our lease (when our leased address is configured on our interface)
         
-        self._dbus_loop = dbus_loop
-
-        self._dbus_loop_thread = threading.Thread(target = self._loopHandleDbus)    # Start handling D-Bus messages in a background thread.
-        self._dbus_loop_thread.setDaemon(True)    # dbus loop should be forced to terminate when main program exits
-        self._dbus_loop_thread.start()
+        if retransmit_backoff is None:
+            retransmit_backoff = rfdhcpclientlib.DhcpRetransmitBackoff.DhcpRetransmitBackoff()
+        self._retransmit_backoff = retransmit_backoff
+        self._retransmit_timer = None    # LeaseTimer handle on the pending retransmission timeout
+        self._retransmit_request = None    # (exchange type, attempt, arguments of _sendDhcpPacketFromTemplate()) for the request that will be retransmitted if we get no reply
+        self._retransmissions = dict([(exchange, 0) for exchange in DHCP_EXCHANGES])    # Number of retransmissions for each type of DHCP exchange
+        
+        self._offer_selector = rfdhcpclientlib.DhcpOfferSelector.DhcpOfferSelector(window = offer_window, policy = offer_policy, preferred_server_id = preferred_server_id)    # Also holds the OFFER latency statistics of each server
+        self._discover_timestamp = None    # Monotonic timestamp of the first transmission of our last DISCOVER (OFFER latencies are measured from it)
+        self._collected_offers = []    # DhcpOffer objects received during the current offer collection window
+        self._offer_selected = False    # Have we already selected an OFFER (and sent a REQUEST for it) since our last DISCOVER?
+        self._offer_window_timer = None    # LeaseTimer handle on the end of the current offer collection window
         
         self._on_exit_callback = None
+        self._lease_state_listeners = []    # Functions called with each lease state we emit in the LeaseStateChanged D-Bus signal
         
         self._iface_modified = False
         
@@ -168,6 +643,15 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         if self._apply_ip and not self._ifname:
             raise Exception('NoIfaceProvidedWithApplyIP')
         
+        self._netlink = None    # NetlinkIfaceConfig object used to configure our interface (if None, we use the userspace tools)
+        self._saved_iface_config = None    # (addresses, routes) of our interface before we modified it (netlink only), restored by _unconfigure_iface()
+        self._applied_defaultgw = None    # Default gateway we have set on our interface (netlink only)
+        if self._apply_ip and iface_config == 'netlink':
+            try:
+                self._netlink = rfdhcpclientlib.NetlinkIfaceConfig.NetlinkIfaceConfig()
+            except (socket.error, AttributeError):    # AttributeError is raised if socket.AF_NETLINK does not exist on this platform
+                if not self._silent_mode: print('Netlink is not available, falling back to userspace tools to configure ' + str(self._ifname))
+        
         self._dump_packets = dump_packets
         
         if mac_addr is None:
@@ -177,6 +661,8 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
                 self._mac_addr = MacAddr.getHwAddrForIp(ip = self._listen_address)
             else:
                 raise Exception('NoInterfaceProvided')
+        else:
+            self._mac_addr = mac_addr
         
         self._current_xid = None
         self._xid_mutex = threading.Lock()      # This mutex protects writes to the _current_xid attribute
@@ -190,88 +676,59 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
             raise('NotAFunction')
         self._on_exit_callback = function
     
-    # D-Bus-related methods
-    def _loopHandleDbus(self):
-        """
-        This method should be run within a thread... This thread's aim is to run the Glib's main loop while the main thread does other actions in the meantime
-        This methods will loop infinitely to receive and send D-Bus messages and will only stop looping when the value of self._loopDbus is set to False (or when the Glib's main loop is stopped using .quit()) 
-        """
-        if not self._silent_mode: print('Starting dbus mainloop')
-        self._dbus_loop.run()
-        if not self._silent_mode: print('Stopping dbus mainloop')
-    
-    @dbus.service.signal(dbus_interface = DBUS_SERVICE_INTERFACE)
-    def DhcpDiscoverSent(self):
-        """
-        D-Bus decorated method to send the "DhcpDiscoverSent" signal
-        """
-        pass
-    
-    @dbus.service.signal(dbus_interface = DBUS_SERVICE_INTERFACE)
-    def DhcpOfferRecv(self, ip, server):
-        """
-        D-Bus decorated method to send the "DhcpOfferRecv" signal
-        """
-        pass
-    
-    @dbus.service.signal(dbus_interface = DBUS_SERVICE_INTERFACE)
-    def DhcpRequestSent(self):
-        """
-        D-Bus decorated method to send the "DhcpRequestSent" signal
-        """
-        pass
-    
-    @dbus.service.signal(dbus_interface = DBUS_SERVICE_INTERFACE)
-    def DhcpRenewSent(self):
-        """
-        D-Bus decorated method to send the "DhcpRenewSent" signal
-        """
-        pass
-        
-    @dbus.service.signal(dbus_interface = DBUS_SERVICE_INTERFACE)
-    def DhcpReleaseSent(self, ip):
+    def addLeaseStateListener(self, function):
         """
-        D-Bus decorated method to send the "DhcpReleaseSent" signal
+        Call function with the lease state dictionary (see rfdhcpclientlib.DbusLeaseState.encodeLeaseState()) of each DHCP transition, in addition to emitting it in the LeaseStateChanged D-Bus signal
         """
-        pass
+        self._lease_state_listeners.append(function)
     
-    @dbus.service.signal(dbus_interface = DBUS_SERVICE_INTERFACE)
-    def DhcpAckRecv(self, ip, netmask, defaultgw, dns, server, leasetime):
-        """
-        D-Bus decorated method to send the "DhcpAckRecv" signal
-        """
-        pass
-
-    @dbus.service.signal(dbus_interface = DBUS_SERVICE_INTERFACE)
-    def IpConfigApplied(self, interface, ip, netmask, defaultgw, leasetime, dns_space_sep, serverid):
-        """
-        D-Bus decorated method to send the "IpConfigApplied" signal
-        """
-        pass
+    def removeLeaseStateListener(self, function):
+        if function in self._lease_state_listeners:
+            self._lease_state_listeners.remove(function)
     
-    @dbus.service.signal(dbus_interface = DBUS_SERVICE_INTERFACE)
-    def IpDnsReceived(self, dns_space_sep_list):
+    # D-Bus-related methods
+    @dbus.service.signal(dbus_interface = DBUS_SERVICE_INTERFACE, signature = 'a{sv}')
+    def LeaseStateChanged(self, lease_state):
         """
-        D-Bus decorated method to send the "IpDnsReceived" signal
+        D-Bus decorated method to send the "LeaseStateChanged" signal
+        lease_state is a dictionary built by rfdhcpclientlib.DbusLeaseState.encodeLeaseState()
         """
         pass
     
-    @dbus.service.signal(dbus_interface = DBUS_SERVICE_INTERFACE)
-    def LeaseLost(self):
+    def _emitLeaseStateChanged(self, event, **kwargs):
         """
-        D-Bus decorated method to send the "LeaseLost" signal
+        Emit the LeaseStateChanged D-Bus signal for the DHCP transition event (eg: 'DhcpAckRecv')
+        Keyword arguments are the lease details to send along (see rfdhcpclientlib.DbusLeaseState.encodeLeaseState())
         """
-        pass
+        lease_state = rfdhcpclientlib.DbusLeaseState.encodeLeaseState(event, lease_valid = self._dhcp_status.lease.ipv4_lease_valid, ifname = self._ifname, **kwargs)
+        self.LeaseStateChanged(lease_state)
+        for listener in self._lease_state_listeners:
+            listener(lease_state)
 
     def exit(self):
         """
         Cleanup object and stop all threads
         """
-        self.sendDhcpRelease()    # Release our current lease if any (this will also clear all DHCP-lease-related threads)
-        self._dbus_loop.quit()    # Stop the D-Bus main loop
+        self.sendDhcpRelease()    # Release our current lease if any (this will also clear all DHCP-lease-related timeouts)
+        self.stopMainLoop()    # Stop the main loop
         if not self._on_exit_callback is None:
             self._on_exit_callback() 
 
+    def close(self):
+        """
+        Release our current lease (if any), close our DHCP socket and unpublish our D-Bus object, without stopping the main loop (that may be shared with DHCP clients running on other interfaces)
+        """
+        self.sendDhcpRelease()
+        self.stopWatchingSocket()
+        self.dhcp_socket.close()
+        if not self._netlink is None:
+            self._netlink.close()
+            self._netlink = None
+        try:
+            self.remove_from_connection()
+        except LookupError:
+            pass    # We were not published (replay mode, or no peer connected to our DbusPeerServer)
+
     @dbus.service.method(dbus_interface = DBUS_SERVICE_INTERFACE, in_signature='', out_signature='i')
     def GetPid(self):
         """
@@ -312,6 +769,61 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         """
         self.sendDhcpDiscover(release = True)    # Restart the DHCP discovery (and release our current lease if any (this will also clear all DHCP-lease-related threads))
 
+    @dbus.service.method(dbus_interface = DBUS_SERVICE_INTERFACE, in_signature='', out_signature='')
+    def Reset(self):
+        """
+        D-Bus decorated method executed when receiving the D-Bus "Reset" message call
+        This method releases our current lease (if any) and brings this DHCP client back to its startup state, so that the same process can be reused for a new test (a new DHCP exchange will only start on the next Discover())
+        """
+        if not self._silent_mode: print("Received Reset() command from D-Bus")
+        self.sendDhcpRelease()
+        self._discover_sent = False
+        self._request_sent = False
+        self._pending_exchange = None
+        self._cancelRetransmit()
+        self._discover_timestamp = None
+        self.genNewXid()
+    
+    @dbus.service.method(dbus_interface = DBUS_SERVICE_INTERFACE, in_signature='', out_signature='a{sa{sv}}')
+    def GetStats(self):
+        """
+        D-Bus method to get the latency statistics of each type of DHCP exchange (see DHCP_EXCHANGES)
+        For each type of exchange, we return the number of exchanges ('count'), the number of retransmitted requests ('retransmissions') and, if there was at least one exchange, 'min', 'max', 'mean', 'p50', 'p90' and 'p99' durations (in seconds)
+        """
+        stats = {}
+        for (exchange, histogram) in self._latency_histograms.iteritems():
+            stats[exchange] = histogram.getStats()
+            stats[exchange]['retransmissions'] = self._retransmissions[exchange]
+        return dict([(exchange, dbus.Dictionary(exchange_stats, signature = 'sv')) for (exchange, exchange_stats) in stats.iteritems()])
+    
+    @dbus.service.method(dbus_interface = DBUS_SERVICE_INTERFACE, in_signature='', out_signature='a{sa{sv}}')
+    def GetOfferStats(self):
+        """
+        D-Bus method to get the statistics of the OFFERs received from each DHCP server (indexed by server identifier)
+        For each server, we return the number of OFFERs received ('count'), the number of these OFFERs that we selected ('selected') and, if there was at least one OFFER, 'min', 'max', 'mean', 'p50', 'p90' and 'p99' latencies (in seconds, from the first transmission of the DISCOVER)
+        """
+        return dict([(server_id, dbus.Dictionary(server_stats, signature = 'sv')) for (server_id, server_stats) in self._offer_selector.getStats().iteritems()])
+    
+    @dbus.service.method(dbus_interface = DBUS_SERVICE_INTERFACE, in_signature='', out_signature='a{sv}')
+    def GetLease(self):
+        """
+        D-Bus method to get our whole current lease at once, as the same dictionary as in the LeaseStateChanged signal (see rfdhcpclientlib.DbusLeaseState), without the 'event' key
+        All values are read from one single lease snapshot, so they always belong to the same lease
+        """
+        lease = self._dhcp_status.lease
+        if not lease.ipv4_lease_valid:
+            return rfdhcpclientlib.DbusLeaseState.encodeLeaseState(None, lease_valid = False, ifname = self._ifname)
+        return rfdhcpclientlib.DbusLeaseState.encodeLeaseState(None,
+                                                               lease_valid = True,
+                                                               ifname = self._ifname,
+                                                               ip = lease.ipv4_address,
+                                                               netmask = lease.ipv4_netmask,
+                                                               defaultgw = lease.ipv4_defaultgw,
+                                                               serverid = lease.ipv4_dhcpserverid,
+                                                               dns = lease.ipv4_dnslist,
+                                                               leasetime = lease.ipv4_lease_duration,
+                                                               ip_config_applied = self._iface_modified)
+    
     @dbus.service.method(dbus_interface = DBUS_SERVICE_INTERFACE, in_signature='', out_signature='')
     def FreezeRenew(self):
         """
@@ -319,8 +831,11 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         This method will stop any renew from being sent (even after the lease will expire)
         It will also stop any release from being sent out... basically, we will mute the DHCP client messaging to the server
         """
-        if not self._renew_thread is None: self._renew_thread.cancel()    # Cancel the renew timeout
-        if not self._release_thread is None: self._release_thread.cancel()    # Cancel the release timeout
+        self._cancelRenewTimeout()
+        self._cancelReleaseTimeout()
+        self._cancelRebindTimeout()
+        self._cancelRetransmit()
+        self._cancelOfferWindow()
     
     @dbus.service.method(dbus_interface = DBUS_SERVICE_INTERFACE, in_signature='', out_signature='s')
     def GetVersion(self):
@@ -354,12 +869,25 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         Apply the IP address and netmask that we currently have in out self._dhcp_status (got from last lease)
         Warning : we won't check if the lease is still valid now, this is up to the caller
         """ 
+        lease = self._dhcp_status.lease
+        if not self._netlink is None:
+            try:
+                ifindex = rfdhcpclientlib.NetlinkIfaceConfig.getIfIndex(self._ifname)
+                self._saveIfaceConfig(ifindex)
+                self._iface_modified = True
+                self._netlink.flushAddresses(ifindex)
+                if lease.ipv4_address:
+                    if not self._silent_mode: print('Netlink: setting address ' + str(lease.ipv4_address) + '/' + str(lease.ipv4_netmask) + ' on ' + str(self._ifname))
+                    self._netlink.addAddress(ifindex, str(lease.ipv4_address), str(lease.ipv4_netmask))
+                return
+            except socket.timeout:
+                self._disableNetlink()
         self._iface_modified = True
         cmdline = ['ifconfig', str(self._ifname), '0.0.0.0']
         if not self._silent_mode: print(cmdline)
         subprocess.call(cmdline)
-        if self._dhcp_status.ipv4_address:
-            cmdline = ['ifconfig', str(self._ifname), str(self._dhcp_status.ipv4_address), 'netmask', str(self._dhcp_status.ipv4_netmask)]
+        if lease.ipv4_address:
+            cmdline = ['ifconfig', str(self._ifname), str(lease.ipv4_address), 'netmask', str(lease.ipv4_netmask)]
             if not self._silent_mode: print(cmdline)
             subprocess.call(cmdline)
     
@@ -368,12 +896,46 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         Apply the default gateway that we currently have in out self._dhcp_status (got from last lease)
         Warning : we won't check if the lease is still valid now, this is up to the caller
         """ 
+        lease = self._dhcp_status.lease
+        if not self._netlink is None:
+            try:
+                ifindex = rfdhcpclientlib.NetlinkIfaceConfig.getIfIndex(self._ifname)
+                self._saveIfaceConfig(ifindex)
+                self._iface_modified = True
+                if lease.ipv4_defaultgw:
+                    defaultgw = str(lease.ipv4_defaultgw)
+                    if not self._applied_defaultgw is None and self._applied_defaultgw != defaultgw:    # The gateway changed since the previous lease
+                        self._netlink.deleteDefaultRoute(ifindex, self._applied_defaultgw)
+                        self._applied_defaultgw = None
+                    if not self._silent_mode: print('Netlink: adding default gateway ' + defaultgw + ' on ' + str(self._ifname))
+                    if self._netlink.addDefaultRoute(ifindex, defaultgw):
+                        self._applied_defaultgw = defaultgw    # Only remove this route on release if we added it (an identical route may have existed before us)
+                return
+            except socket.timeout:
+                self._disableNetlink()
         self._iface_modified = True
-        if self._dhcp_status.ipv4_defaultgw:
-            cmdline = ['route', 'add', 'default', 'gw', str(self._dhcp_status.ipv4_defaultgw)]
+        if lease.ipv4_defaultgw:
+            cmdline = ['route', 'add', 'default', 'gw', str(lease.ipv4_defaultgw)]
             if not self._silent_mode: print(cmdline)
             subprocess.call(cmdline)
 
+    def _saveIfaceConfig(self, ifindex):
+        """
+        Record the addresses and routes of our interface (index ifindex) before we modify it for the first time, so that _unconfigure_iface() can restore them (netlink only)
+        """
+        if not self._iface_modified:
+            self._saved_iface_config = (self._netlink.getAddresses(ifindex), self._netlink.getRoutes(ifindex))
+    
+    def _disableNetlink(self):
+        """
+        Stop using netlink to configure our interface (the kernel did not answer a request in time), and use the userspace tools from now on
+        """
+        if not self._silent_mode: print('Netlink did not answer in time, falling back to userspace tools to configure ' + str(self._ifname))
+        self._netlink.close()
+        self._netlink = None
+        self._saved_iface_config = None
+        self._applied_defaultgw = None
+    
     # DHCP-related methods
     def genNewXid(self):
         """
@@ -412,12 +974,158 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         """
         return self._current_xid
     
+    def _onRenewTimeout(self):
+        """
+        Callback invoked by our scheduler when the lease should be renewed
+        """
+        self._renew_timer = None
+        self.sendDhcpRenew()
+    
+    def _onReleaseTimeout(self):
+        """
+        Callback invoked by our scheduler when the lease expires
+        """
+        self._release_timer = None
+        self.sendDhcpRelease()
+    
+    def _onRebindTimeout(self):
+        """
+        Callback invoked by our scheduler at T2, when the server that granted our lease did not renew it: enter the REBINDING state, where renews are broadcast to any server
+        """
+        self._rebind_timer = None
+        self._rebinding = True
+        self.sendDhcpRenew()
+    
+    def _startExchange(self, exchange):
+        """
+        Record that we have just sent the request of an exchange of type exchange (see DHCP_EXCHANGES), and are now waiting for its reply
+        """
+        self._pending_exchange = (exchange, rfdhcpclientlib.MonotonicClock.monotonic())
+    
+    def _completeExchange(self, exchanges):
+        """
+        Record the latency of the pending exchange if we just got its reply (if its type is in the list exchanges)
+        """
+        if not self._pending_exchange is None and self._pending_exchange[0] in exchanges:
+            (exchange, start) = self._pending_exchange
+            self._latency_histograms[exchange].record(rfdhcpclientlib.MonotonicClock.monotonic() - start)
+            self._pending_exchange = None
+    
+    def _sendDhcpRequestPacket(self, exchange, message_type, dstipaddr, **send_args):
+        """
+        Send a DHCP packet that expects a reply (see _sendDhcpPacketFromTemplate() for arguments), and arm its retransmission in case we get no reply
+        exchange is the type of exchange this packet starts (see DHCP_EXCHANGES)
+        """
+        self._cancelRetransmit()
+        self._sendDhcpPacketFromTemplate(message_type, dstipaddr, **send_args)
+        self._retransmit_request = (exchange, 0, (message_type, dstipaddr), send_args)
+        self._retransmit_timer = self._scheduler.schedule(self._retransmit_backoff.getInterval(0, self._random), self._onRetransmitTimeout)
+    
+    def _onRetransmitTimeout(self):
+        """
+        Callback invoked by our scheduler when the last request we sent got no reply
+        The request is sent again (with the same xid) unless we reached the maximum number of retransmissions
+        """
+        self._retransmit_timer = None
+        if self._retransmit_request is None:
+            return
+        (exchange, attempt, send_args, send_kwargs) = self._retransmit_request
+        if not self._retransmit_backoff.hasRetriesLeft(attempt):
+            self._retransmit_request = None
+            if not self._silent_mode: print("No reply after " + str(attempt) + " retransmissions, giving up")
+            if exchange == 'request_ack':    # The REQUEST following an OFFER was never acknowledged, go back to the discovery stage (RFC 2131 section 4.4.1)
+                self.sendDhcpDiscover(release = False)
+            return
+        attempt += 1
+        if not self._silent_mode: print("==>Retransmitting " + send_args[0] + " (attempt " + str(attempt) + ")")
+        self._retransmissions[exchange] += 1
+        self._sendDhcpPacketFromTemplate(*send_args, **send_kwargs)
+        self._retransmit_request = (exchange, attempt, send_args, send_kwargs)
+        self._retransmit_timer = self._scheduler.schedule(self._retransmit_backoff.getInterval(attempt, self._random), self._onRetransmitTimeout)
+    
+    def _cancelRetransmit(self):
+        """
+        Cancel the pending retransmission (if any), because we got a reply or because we do not expect one anymore
+        """
+        self._retransmit_request = None
+        if not self._retransmit_timer is None:
+            self._retransmit_timer.cancel()
+            self._retransmit_timer = None
+    
+    def _onOfferWindowTimeout(self):
+        """
+        Callback invoked by our scheduler at the end of the offer collection window
+        """
+        self._offer_window_timer = None
+        self._requestSelectedOffer()
+    
+    def _cancelOfferWindow(self):
+        """
+        Cancel the current offer collection window (if any), and forget about the OFFERs collected so far
+        """
+        self._collected_offers = []
+        if not self._offer_window_timer is None:
+            self._offer_window_timer.cancel()
+            self._offer_window_timer = None
+    
+    def _requestSelectedOffer(self):
+        """
+        Select one of the OFFERs collected so far (according to our selection policy), and send a REQUEST for it
+        """
+        offer = self._offer_selector.selectOffer(self._collected_offers)
+        self._cancelOfferWindow()
+        self._offer_selected = True
+        if not self._silent_mode: print("Selected OFFER from server " + str(offer.server_id) + " (policy " + self._offer_selector.policy + ")")
+        self.sendDhcpRequest(requested_ip = offer.proposed_ip, server_id = offer.server_id)
+    
+    def _cancelRenewTimeout(self):
+        """
+        Cancel the pending renew timeout (if any)
+        """
+        if not self._renew_timer is None:
+            self._renew_timer.cancel()
+            self._renew_timer = None
+    
+    def _cancelReleaseTimeout(self):
+        """
+        Cancel the pending release timeout (if any)
+        """
+        if not self._release_timer is None:
+            self._release_timer.cancel()
+            self._release_timer = None
+    
+    def _cancelRebindTimeout(self):
+        """
+        Cancel the pending rebind timeout (if any), and leave the REBINDING state
+        """
+        self._rebinding = False
+        if not self._rebind_timer is None:
+            self._rebind_timer.cancel()
+            self._rebind_timer = None
+    
     def _unconfigure_iface(self):
         """
         Unconfigure our interface (fall back to its default system config)
         Warning, we will not modify the current lease information stored in this object however
         """
-        if self._iface_modified:    # Clean up our ip configuration (revert to standard config for this interface)
+        if self._iface_modified and self._ifname and not self._netlink is None:    # Revert to the addresses and routes we saved before modifying the interface, no need to run ifdown/ifup
+            try:
+                ifindex = rfdhcpclientlib.NetlinkIfaceConfig.getIfIndex(self._ifname)
+                if not self._applied_defaultgw is None:
+                    self._netlink.deleteDefaultRoute(ifindex, self._applied_defaultgw)
+                    self._applied_defaultgw = None
+                self._netlink.flushAddresses(ifindex)
+                if not self._saved_iface_config is None:
+                    (addresses, routes) = self._saved_iface_config
+                    for address in addresses:
+                        self._netlink.restoreAddress(address)
+                    for route in routes:
+                        self._netlink.restoreRoute(route)
+                    self._saved_iface_config = None
+                self._iface_modified = False
+            except socket.timeout:
+                self._disableNetlink()
+        if self._iface_modified:    # Clean up our ip configuration (revert to standard config for this interface) without netlink, or if netlink stopped answering
             if self._ifname:
                 cmdline = ['ifdown', str(self._ifname)]
                 if not self._silent_mode: print(cmdline)
@@ -431,6 +1139,14 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
                 subprocess.call(cmdline, stdout=open(os.devnull, 'wb'), stderr=subprocess.STDOUT)
                 self._iface_modified = False
 
+    def _sendDhcpPacketFromTemplate(self, message_type, dstipaddr, parameter_list = None, ciaddr = '0.0.0.0', **options):
+        """
+        Send a DHCP packet of type message_type (eg: 'DISCOVER') to dstipaddr
+        The packet is generated from a cached template, only the current xid, ciaddr and the IPv4 options provided as keyword arguments (eg: server_identifier = '192.168.0.1') are patched
+        """
+        packet = encodeDhcpPacketFromTemplate(self._packet_templates, self._mac_addr, message_type, self._current_xid, parameter_list = parameter_list, ciaddr = ciaddr, buffer = self._send_buffer, **options)
+        self.sendDhcpPacket(packet, dstipaddr)
+    
     def sendDhcpDiscover(self, parameter_list = None, release = True):
         """
         Send a DHCP DISCOVER packet to the network
@@ -439,18 +1155,6 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         if release:
             self.sendDhcpRelease()    # Release our current lease if any (this will also clear all DHCP-lease-related threads)
         
-        dhcp_discover = DhcpPacket()
-        dhcp_discover.SetOption('op', [1])
-        dhcp_discover.SetOption('htype', [1])
-        dhcp_discover.SetOption('hlen', [6])
-        dhcp_discover.SetOption('hops', [0])
-        dhcp_discover.SetOption('xid', self._getXitAsDhcpOption())
-        dhcp_discover.SetOption('giaddr',ipv4('0.0.0.0').list())
-        dhcp_discover.SetOption('chaddr',hwmac(self._mac_addr).list() + [0] * 10)
-        dhcp_discover.SetOption('ciaddr',ipv4('0.0.0.0').list())
-        dhcp_discover.SetOption('siaddr',ipv4('0.0.0.0').list())
-        dhcp_discover.SetOption('dhcp_message_type', [dhcpNameToType('DISCOVER')])
-        dhcp_discover.SetOption('client_identifier', [CLIENT_ID_HWTYPE_ETHER] + hwmac(self._mac_addr).list())
         if parameter_list is None:
             parameter_list =[1,    # Subnet mask
                 3,    # Router
@@ -459,16 +1163,16 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
                 42,    # NTP servers
                 ]
         self._parameter_list = parameter_list
-        dhcp_discover.SetOption('parameter_request_list', self._parameter_list)
         #client.dhcp_socket.settimeout(timeout)
-        dhcp_discover.SetOption('flags',[128, 0])
-        dhcp_discover_type = dhcp_discover.GetOption('dhcp_message_type')[0]
         if not self._silent_mode: print("==>Sending DISCOVER")
         self._request_sent = False
-        bytes_sent = self.SendDhcpPacketTo(dhcp_discover, '255.255.255.255', self._server_port)
-        if bytes_sent == 0:
-            raise Exception('FailedSendDhcpPacketTo')
-        self.DhcpDiscoverSent()    # Emit DBUS signal
+        self._discover_sent = True
+        self._cancelOfferWindow()
+        self._offer_selected = False
+        self._startExchange('discover_offer')
+        self._discover_timestamp = self._pending_exchange[1]
+        self._sendDhcpRequestPacket('discover_offer', 'DISCOVER', '255.255.255.255', parameter_list = self._parameter_list)
+        self._emitLeaseStateChanged('DhcpDiscoverSent')    # Emit DBUS signal
     
     def handleDhcpOffer(self, res):
         """
@@ -483,10 +1187,26 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         if self._dump_packets:
             print(dhcp_offer.str())
         
-        proposed_ip = ipv4(dhcp_offer.GetOption('yiaddr'))
-        server_id = ipv4(dhcp_offer.GetOption('server_identifier'))
-        self.DhcpOfferRecv('IP ' + str(proposed_ip), 'SERVER ' + str(server_id))    # Emit DBUS signal with proposed IP address
-        self.sendDhcpRequest(requested_ip = proposed_ip, server_id = server_id)
+        if not self._discover_sent or self._discover_timestamp is None:
+            if not self._silent_mode: print("Ignoring OFFER received while idle")
+            return
+        offer = rfdhcpclientlib.DhcpOfferSelector.DhcpOffer(server_id = dhcp_offer.GetIpv4Option('server_identifier'),
+                                                            proposed_ip = dhcp_offer.GetIpv4Option('yiaddr'),
+                                                            lease_time = dhcp_offer.GetUInt32Option('ip_address_lease_time'),
+                                                            latency = rfdhcpclientlib.MonotonicClock.monotonic() - self._discover_timestamp)
+        self._offer_selector.recordOffer(offer)    # Late OFFERs are also accounted for in the statistics of their server
+        if self._offer_selected:
+            if not self._silent_mode: print("Ignoring OFFER from server " + str(offer.server_id) + ", a REQUEST was already sent")
+            return
+        self._completeExchange(['discover_offer'])
+        self._cancelRetransmit()
+        
+        self._emitLeaseStateChanged('DhcpOfferRecv', ip = offer.proposed_ip, serverid = offer.server_id)    # Emit DBUS signal with proposed IP address
+        self._collected_offers.append(offer)
+        if self._offer_selector.closesWindow(offer):
+            self._requestSelectedOffer()
+        elif self._offer_window_timer is None:    # First OFFER, open the collection window
+            self._offer_window_timer = self._scheduler.schedule(self._offer_selector.window, self._onOfferWindowTimeout)
     
     def HandleDhcpOffer(self, res):
         """
@@ -494,132 +1214,104 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         """
         self.handleDhcpOffer(res)
     
+    def replayClientPacket(self, packet):
+        """
+        Move our state forward when the recorded client sent packet (see MainLoopDhcpClient.replayPcapFile())
+        A recorded DISCOVER restarts a discovery, a recorded RELEASE releases our lease, and a recorded REQUEST either renews our lease (if it carries a client IP address) or requests the OFFER we selected (if our offer collection window is still open, otherwise we already sent this REQUEST when handling the OFFER)
+        """
+        message_type = packet.GetDhcpMessageType()
+        if message_type == rfdhcpclientlib.LazyDhcpPacket.DHCP_MESSAGE_TYPES['DISCOVER']:
+            self.sendDhcpDiscover()
+        elif message_type == rfdhcpclientlib.LazyDhcpPacket.DHCP_MESSAGE_TYPES['REQUEST']:
+            if packet.GetIpv4Option('ciaddr') != '0.0.0.0':
+                if self._dhcp_status.lease.ipv4_lease_valid:
+                    self.sendDhcpRenew()
+            elif self._collected_offers and not self._offer_selected:
+                self._requestSelectedOffer()
+        elif message_type == rfdhcpclientlib.LazyDhcpPacket.DHCP_MESSAGE_TYPES['RELEASE']:
+            self.sendDhcpRelease()
+    
     def sendDhcpRequest(self, requested_ip = '0.0.0.0', server_id = '0.0.0.0', dstipaddr = '255.255.255.255'):
         """
         Send a DHCP REQUEST packet to the network
         """
-        dhcp_request = DhcpPacket()
-        dhcp_request.SetOption('op', [1])
-        dhcp_request.SetOption('htype', [1])
-        dhcp_request.SetOption('hlen', [6])
-        dhcp_request.SetOption('hops', [0])
-        dhcp_request.SetOption('xid', self._getXitAsDhcpOption())
-        dhcp_request.SetOption('giaddr', ipv4('0.0.0.0').list())
-        dhcp_request.SetOption('chaddr', hwmac(self._mac_addr).list() + [0] * 10)
-        dhcp_request.SetOption('ciaddr', ipv4('0.0.0.0').list())
-        dhcp_request.SetOption('siaddr', ipv4('0.0.0.0').list())
-        if isinstance(requested_ip, basestring):    # In python 3, this would be isinstance(x, str)
-            requested_ip = ipv4(requested_ip)
-        if isinstance(server_id, basestring):
-            server_id = ipv4(server_id)
-        dhcp_request.SetOption('dhcp_message_type', [dhcpNameToType('REQUEST')])
-        dhcp_request.SetOption('client_identifier', [CLIENT_ID_HWTYPE_ETHER] + hwmac(self._mac_addr).list())
-        dhcp_request.SetOption('request_ip_address', requested_ip.list())
-        dhcp_request.SetOption('server_identifier', server_id.list())
-        if not self._parameter_list is None:
-            dhcp_request.SetOption('parameter_request_list', self._parameter_list)    # Resend the same parameter list as for DISCOVER
         #self.dhcp_socket.settimeout(timeout)
-        dhcp_request.SetOption('flags', [128, 0])
-        dhcp_request_type = dhcp_request.GetOption('dhcp_message_type')[0]
         if not self._silent_mode: print("==>Sending REQUEST")
-        bytes_sent = self.SendDhcpPacketTo(dhcp_request, dstipaddr, self._server_port)
-        if bytes_sent == 0:
-            raise Exception('FailedSendDhcpPacketTo')
+        self._startExchange('request_ack')
+        self._sendDhcpRequestPacket('request_ack', 'REQUEST', dstipaddr, parameter_list = self._parameter_list, request_ip_address = requested_ip, server_identifier = server_id)    # Resend the same parameter list as for DISCOVER
         self._request_sent = True
-        self.DhcpRequestSent()    # Emit DBUS signal
+        self._emitLeaseStateChanged('DhcpRequestSent', ip = requested_ip, serverid = server_id)    # Emit DBUS signal
         
-    def sendDhcpRenew(self, ciaddr = None, dstipaddr = '255.255.255.255'):
+    def sendDhcpRenew(self, ciaddr = None, dstipaddr = None):
         """
         Send a DHCP REQUEST to renew the current lease
         This is almost the same as the REQUEST following a DISCOVER, but we provide our client IP address here
+        If dstipaddr is not provided, the REQUEST is unicast to the server that granted our lease (RENEWING state), or broadcast if we are in the REBINDING state (or if the server did not provide its identifier)
+        A unicast REQUEST must be sent from our leased address, so we also broadcast it if we did not configure this address on our interface (see apply_ip): our socket is only bound to 0.0.0.0
+        If we get no reply, a new renew is sent by our renew timeout (RFC 2131 section 4.4.5), not by the retransmission backoff used for other requests
         """
-        if not self._renew_thread is None:    # If there was a lease currently obtained
-            self._renew_thread.cancel()
-            self._renew_thread = None
+        self._cancelRenewTimeout()
+        retransmission = not self._pending_exchange is None and self._pending_exchange[0] == 'renew_ack'    # Our previous renew got no reply
         
         self.genNewXid()    # Generate a new transaction
-        dhcp_request = DhcpPacket()
-        dhcp_request.SetOption('op', [1])
-        dhcp_request.SetOption('htype', [1])
-        dhcp_request.SetOption('hlen', [6])
-        dhcp_request.SetOption('hops', [0])
-        dhcp_request.SetOption('xid', self._getXitAsDhcpOption())
-        dhcp_request.SetOption('giaddr', ipv4('0.0.0.0').list())
-        dhcp_request.SetOption('chaddr', hwmac(self._mac_addr).list() + [0] * 10)
+        lease = self._dhcp_status.lease    # Use one single snapshot so that ipv4_lease_valid and ipv4_address remain coherent for the whole operation
         if ciaddr is None:
-            with self._dhcp_status._dhcp_status_mutex:    # Hold the mutex so that ipv4_lease_valid and ipv4_address remain coherent for the whole operation
-                if self._dhcp_status.ipv4_lease_valid:
-                    ciaddr = ipv4(self._dhcp_status.ipv4_address)
-                else:
-                    raise Exception('RenewOnInvalidLease')
-        dhcp_request.SetOption('ciaddr', ciaddr.list())
-        dhcp_request.SetOption('siaddr', ipv4('0.0.0.0').list())
-        dhcp_request.SetOption('dhcp_message_type', [dhcpNameToType('REQUEST')])
-        dhcp_request.SetOption('client_identifier', [CLIENT_ID_HWTYPE_ETHER] + hwmac(self._mac_addr).list())
-        if not self._parameter_list is None:
-            dhcp_request.SetOption('parameter_request_list', self._parameter_list)    # Resend the same parameter list as for DISCOVER
-        dhcp_request.SetOption('flags', [128, 0])
-        dhcp_request_type = dhcp_request.GetOption('dhcp_message_type')[0]
-        if not self._silent_mode: print("==>Sending REQUEST (renewing lease)")
-        self.DhcpRenewSent()    # Emit DBUS signal
+            if lease.ipv4_lease_valid:
+                ciaddr = lease.ipv4_address
+            else:
+                raise Exception('RenewOnInvalidLease')
+        if dstipaddr is None:
+            if self._rebinding or not lease.ipv4_dhcpserverid or not self._iface_modified:
+                dstipaddr = '255.255.255.255'
+            else:
+                dstipaddr = lease.ipv4_dhcpserverid
+        if not self._silent_mode: print("==>Sending REQUEST (" + ("rebinding" if self._rebinding else "renewing") + " lease) to " + dstipaddr)
+        self._emitLeaseStateChanged('DhcpRenewSent', ip = ciaddr)    # Emit DBUS signal
         self._request_sent = True
-        bytes_sent = self.SendDhcpPacketTo(dhcp_request, dstipaddr, self._server_port)
-        if bytes_sent == 0:
-            raise Exception('FailedSendDhcpPacketTo')
-        # After the first renew is sent, increase the frequency of the next renew packets (send 5 more renew during the second half of the lease)
-        self._renew_thread = threading.Timer(self._dhcp_status.ipv4_lease_duration / 5 / 2, self.sendDhcpRenew, [])
-        
-        self._renew_thread.setDaemon(True)
-        self._renew_thread.start()
-
+        if retransmission:
+            self._retransmissions['renew_ack'] += 1    # The latency of this exchange is still measured from our first renew
+        else:
+            self._startExchange('renew_ack')
+        self._cancelRetransmit()
+        # If we get no reply, send another renew after half of the time left before T2 (or before the lease expires if we are already rebinding)
+        # This is armed before sending, so that an error while sending does not stop our renewals
+        deadline_timer = self._release_timer if self._rebinding else self._rebind_timer
+        if not deadline_timer is None:
+            interval = getRenewRetransmitInterval(deadline_timer.remaining(), lease.ipv4_lease_duration)
+            if not interval is None:
+                self._renew_timer = self._scheduler.schedule(interval, self._onRenewTimeout)
+        self._sendDhcpPacketFromTemplate('REQUEST', dstipaddr, parameter_list = self._parameter_list, ciaddr = ciaddr)    # Resend the same parameter list as for DISCOVER
     
     def sendDhcpRelease(self, ciaddr = None, unconfigure_iface = True):
         """
         Send a DHCP RELEASE to release the current lease
         """
-        if not self._renew_thread is None: self._renew_thread.cancel()    # Cancel the renew timeout
-        if not self._release_thread is None: self._release_thread.cancel()    # Cancel the release timeout
-        self._release_thread = None    # Delete pointer to our own thread handle now that we have been called
-        if not self._renew_thread is None:    # If there was a lease currently obtained
-            self._renew_thread = None    # Delete pointer to the renew (we have lost our lease)
+        self._cancelRenewTimeout()
+        self._cancelReleaseTimeout()
+        self._cancelRebindTimeout()
+        self._cancelRetransmit()
+        self._cancelOfferWindow()
+        
+        lease = self._dhcp_status.lease    # Copy locally the values used in the next part so that they are coherent (even if obsolete)
+        ipv4_lease_valid = lease.ipv4_lease_valid
+        ipv4_address = lease.ipv4_address
+        ipv4_dhcpserverid = lease.ipv4_dhcpserverid
+        
+        if ipv4_lease_valid and ipv4_address:    # Do we have a lease and a valid IPv4 address?
+            self.genNewXid()
+            release_options = {}
+            if ipv4_dhcpserverid:
+                release_options['server_identifier'] = ipv4_dhcpserverid
+            #self.dhcp_socket.settimeout(timeout)
+            if not self._silent_mode: print("==>Sending RELEASE")
+            self._request_sent = False
+            self._dhcp_status.reset()
             
-            with self._dhcp_status._dhcp_status_mutex:    # Copy locally the values used in the next part so that they are coherent (even if obsolete)
-                ipv4_lease_valid = self._dhcp_status.ipv4_lease_valid
-                ipv4_address = self._dhcp_status.ipv4_address
-                ipv4_dhcpserverid = self._dhcp_status.ipv4_dhcpserverid
+            self._sendDhcpPacketFromTemplate('RELEASE', '255.255.255.255', ciaddr = ipv4_address, **release_options)
+            self._emitLeaseStateChanged('DhcpReleaseSent', ip = ipv4_address)    # Notify that the lease has been released (and is thus invalid) via a D-Bus signal
             
-            if ipv4_lease_valid and ipv4_address:    # Do we have a lease and a valid IPv4 address?
-                self.genNewXid()
-                dhcp_release = DhcpPacket()
-                dhcp_release.SetOption('op', [1])
-                dhcp_release.SetOption('htype', [1])
-                dhcp_release.SetOption('hlen', [6])
-                dhcp_release.SetOption('hops', [0])
-                dhcp_release.SetOption('xid', self._getXitAsDhcpOption())
-                dhcp_release.SetOption('giaddr', ipv4('0.0.0.0').list())
-                dhcp_release.SetOption('chaddr', hwmac(self._mac_addr).list() + [0] * 10)
-                dhcp_release.SetOption('ciaddr', ipv4(ipv4_address).list())
-                dhcp_release.SetOption('siaddr', ipv4('0.0.0.0').list())
-                dhcp_release.SetOption('dhcp_message_type', [dhcpNameToType('RELEASE')])
-                dhcp_release.SetOption('client_identifier', [CLIENT_ID_HWTYPE_ETHER] + hwmac(self._mac_addr).list())
-                if ipv4_dhcpserverid:
-                    dhcp_release.SetOption('server_identifier', ipv4(ipv4_dhcpserverid).list())
-                #self.dhcp_socket.settimeout(timeout)
-                dhcp_release.SetOption('flags', [128, 0])
-                dhcp_release_type = dhcp_release.GetOption('dhcp_message_type')[0]
-                if not self._silent_mode: print("==>Sending RELEASE")
-                release_sent_message = 'IP ' + str(ipv4_address)    # Build a string for the D-Bus signal now before erasing _last_ipaddress
-                self._request_sent = False
-                self._dhcp_status.reset()
-                self.LeaseLost()    # Notify that the lease becomes invalid via a D-Bus signal
-                
-                bytes_sent = self.SendDhcpPacketTo(dhcp_release, '255.255.255.255', self._server_port) 
-                if bytes_sent == 0:
-                    raise Exception('FailedSendDhcpPacketTo')
-                self.DhcpReleaseSent(release_sent_message)    # Emit D-Bus signal
-                
-            if unconfigure_iface:
-                self._unconfigure_iface()    # Clean up our IP configuration (revert to standard config for this interface)
+        if unconfigure_iface:
+            self._unconfigure_iface()    # Clean up our IP configuration (revert to standard config for this interface) if we modified it
     
     def handleDhcpAck(self, packet):
         """
@@ -632,59 +1324,63 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         if self._dump_packets:
             print(packet.str())
         
+        if not self._discover_sent:
+            if not self._silent_mode: print("Ignoring ACK received while idle")
+            return
+        ipv4_lease_duration = packet.GetUInt32Option('ip_address_lease_time')
+        if ipv4_lease_duration is None:    # Mandatory in an ACK answering a REQUEST (RFC 2131 section 4.3.1), we keep retransmitting our REQUEST
+            if not self._silent_mode: print("Ignoring ACK without lease time")
+            return
+        self._completeExchange(['request_ack', 'renew_ack'])
+        self._cancelRetransmit()
+        
         if self._request_sent:
             self._request_sent = False
         else:
             if not self._silent_mode: print("Received an ACK without having sent a REQUEST")
             #raise Exception('UnexpectedAck')
         
-        ipv4_address = str(ipv4(packet.GetOption('yiaddr')))
-        ipv4_netmask = str(ipv4(packet.GetOption('subnet_mask')))
-        ipv4_defaultgw = str(ipv4(packet.GetOption('router')))
-        ipv4_dnslist = []
-        dnsip_array = packet.GetOption('domain_name_server')    # DNS is of type ipv4+ so we could get more than one router IPv4 address... handle all DNS entries in a list
-        for i in range(0, len(dnsip_array), 4):
-            if len(dnsip_array[i:i+4]) == 4:
-                ipv4_dnslist += [str(ipv4(dnsip_array[i:i+4]))]
-        ipv4_dhcpserverid = str(ipv4(packet.GetOption('server_identifier')))
-        ipv4_lease_duration = ipv4(packet.GetOption('ip_address_lease_time')).int()
-
-        
-        with self._dhcp_status._dhcp_status_mutex:
-            self._dhcp_status.ipv4_address = ipv4_address
-            self._dhcp_status.ipv4_netmask = ipv4_netmask
-            self._dhcp_status.ipv4_defaultgw = ipv4_defaultgw    # router is of type ipv4+ so we could get more than one router IPv4 address... but we only pick up the first one here
-            self._dhcp_status.ipv4_dnslist = ipv4_dnslist
-            self._dhcp_status.ipv4_dhcpserverid = ipv4_dhcpserverid
-            self._dhcp_status.ipv4_lease_duration = ipv4_lease_duration
-            self._dhcp_status.ipv4_lease_valid = True
+        ipv4_address = packet.GetIpv4Option('yiaddr')
+        ipv4_netmask = packet.GetIpv4Option('subnet_mask')
+        ipv4_defaultgw = packet.GetIpv4Option('router')
+        ipv4_dnslist = packet.GetIpv4ListOption('domain_name_server')    # DNS is of type ipv4+ so we could get more than one router IPv4 address... handle all DNS entries in a list
+        ipv4_dhcpserverid = packet.GetIpv4Option('server_identifier')
+        
+        self._dhcp_status.publish(rfdhcpclientlib.DhcpLeaseStatus.DhcpLease(ipv4_address = ipv4_address,
+                                                                            ipv4_netmask = ipv4_netmask,
+                                                                            ipv4_defaultgw = ipv4_defaultgw,    # router is of type ipv4+ so we could get more than one router IPv4 address... but we only pick up the first one here
+                                                                            ipv4_dnslist = ipv4_dnslist,
+                                                                            ipv4_dhcpserverid = ipv4_dhcpserverid,
+                                                                            ipv4_lease_duration = ipv4_lease_duration,
+                                                                            ipv4_lease_deadline = rfdhcpclientlib.MonotonicClock.monotonic() + ipv4_lease_duration,
+                                                                            ipv4_lease_valid = True))
             
-        dns_space_sep = ' '.join(ipv4_dnslist)
-        
-        self.DhcpAckRecv('IP ' + str(ipv4_address),
-            'NETMASK ' + str(ipv4_netmask),
-            'DEFAULTGW ' + str(ipv4_defaultgw),
-            'DNS ' + dns_space_sep,
-            'SERVER ' + str(ipv4_dhcpserverid),
-            'LEASEDURATION ' + str(ipv4_lease_duration))
-        
-        if not self._silent_mode: print('Starting renew thread')
-        if not self._renew_thread is None: self._renew_thread.cancel()    # Cancel the renew timeout
-        if not self._release_thread is None: self._release_thread.cancel()    # Cancel the release timeout
-        
-        self._renew_thread = threading.Timer(ipv4_lease_duration / 2, self.sendDhcpRenew, [])
-        self._renew_thread.setDaemon(True)
-        self._renew_thread.start()
-        self._release_thread = threading.Timer(ipv4_lease_duration, self.sendDhcpRelease, [])    # Restart the release timeout
-        self._release_thread.setDaemon(True)
-        self._release_thread.start()
         
+        if not self._silent_mode: print('Starting renew timeout')
+        self._cancelRenewTimeout()
+        self._cancelReleaseTimeout()
+        self._cancelRebindTimeout()    # Our lease was renewed (or is a new one), we are back in the BOUND state
+        
+        (renewal_time, rebinding_time) = getRenewalTimes(packet, ipv4_lease_duration)
+        self._renew_timer = self._scheduler.schedule(renewal_time, self._onRenewTimeout)
+        self._rebind_timer = self._scheduler.schedule(rebinding_time, self._onRebindTimeout)
+        self._release_timer = self._scheduler.schedule(ipv4_lease_duration, self._onReleaseTimeout)    # Restart the release timeout
+        
+        ip_config_applied = False
         if self._apply_ip and self._ifname:
-            if not self._silent_mode: print('Applying IP config and Sending D-Bus Signal IpConfigApplied')
+            if not self._silent_mode: print('Applying IP config')
             self.applyIpAddressFromDhcpLease()
             self.applyDefaultGwFromDhcpLease()
-            self.IpConfigApplied(str(self._ifname), str(ipv4_address), str(ipv4_netmask), str(ipv4_defaultgw), str(ipv4_lease_duration), dns_space_sep, str(ipv4_dhcpserverid))
-            self.IpDnsReceived(dns_space_sep)
+            ip_config_applied = True
+        
+        self._emitLeaseStateChanged('DhcpAckRecv',
+                                    ip = ipv4_address,
+                                    netmask = ipv4_netmask,
+                                    defaultgw = ipv4_defaultgw,
+                                    serverid = ipv4_dhcpserverid,
+                                    dns = ipv4_dnslist,
+                                    leasetime = ipv4_lease_duration,
+                                    ip_config_applied = ip_config_applied)    # One single signal carries the whole lease
     
     def HandleDhcpAck(self, packet):
         """
@@ -695,7 +1391,7 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
     def handleDhcpNack(self, packet):
         """
         Handle a DHCP NACK packet coming from the network
-        Today, this will raise an exception. No processing will be done on such packets
+        Our lease (if any) is dropped, and we restart a discovery (RFC 2131 section 4.4.1)
         """
         
         message = "==>Received NACK"
@@ -704,13 +1400,22 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         if not self._silent_mode: print(message)
         if self._dump_packets:
             print(packet.str())
-
-        self._dhcp_status.reset()
+        
+        if not self._discover_sent:
+            if not self._silent_mode: print("Ignoring NACK received while idle")
+            return
+        self._cancelRenewTimeout()
+        self._cancelReleaseTimeout()
+        self._cancelRebindTimeout()
+        self._cancelRetransmit()
+        self._dhcp_status.reset()    # The server refused our lease, there is nothing to release
         self._request_sent = False
+        self._unconfigure_iface()
             
-        self.LeaseLost()
+        self._emitLeaseStateChanged('DhcpNackRecv')    # Notify that the lease becomes invalid via a D-Bus signal
         
-        raise Exception('DhcpNack')
+        if not self._silent_mode: print("Restarting discovery after NACK")
+        self.sendDhcpDiscover(release = False)
     
     def HandleDhcpNack(self, packet):
         """
@@ -719,6 +1424,522 @@ class DBusControlledDhcpClient(DhcpClient, dbus.service.Object):
         self.handleDhcpNack(packet)
 
 
+class DhcpClientManager(dbus.service.Object):
+    """
+    D-Bus object (published at DBUS_OBJECT_ROOT) hosting one DBusControlledDhcpClient per network interface within this process
+    All DHCP clients share the same D-Bus connection, the same main loop and the same lease timer scheduler
+    Interfaces can be added or removed at runtime via the AddInterface() and RemoveInterface() D-Bus methods
+    """
+    
+    SUPPORTS_MULTIPLE_CONNECTIONS = True    # When using a DbusPeerServer, we are published on each peer connection
+    
+    def __init__(self, conn, dbus_loop, scheduler = None, apply_ip = False, dump_packets = False, silent_mode = True, start_on_dbus = False, retransmit_backoff = None, iface_config = 'netlink', pcap_writer = None, dbus_server = None, control_server = None, offer_window = 0, offer_policy = 'first', preferred_server_id = None):
+        """
+        Instanciate a new DhcpClientManager that does not serve any interface yet (see addInterface())
+        apply_ip, dump_packets, silent_mode, retransmit_backoff, iface_config, pcap_writer, offer_window, offer_policy and preferred_server_id are used for all DBusControlledDhcpClient objects created by this manager
+        If start_on_dbus is False, a DHCP DISCOVER is sent as soon as an interface is added, otherwise we wait for the Discover() D-Bus method
+        If dbus_server (a DbusPeerServer object) is provided, conn should be None: this manager and its DHCP clients are then published to the peers connected to dbus_server instead of on a bus
+        If control_server (a UnixSocketControlServer object) is provided, our DHCP clients can also be controlled through it. conn can then be None if D-Bus is not used at all
+        """
+        dbus.service.Object.__init__(self, conn, DBUS_OBJECT_ROOT if not conn is None else None)    # See DBusControlledDhcpClient.__init__()
+        
+        self._conn = conn
+        self._dbus_server = dbus_server
+        self._control_server = control_server
+        if not self._dbus_server is None:
+            self._dbus_server.exportObject(self, DBUS_OBJECT_ROOT)
+        self._main_loop = dbus_loop
+        if scheduler is None:
+            scheduler = rfdhcpclientlib.LeaseTimerScheduler.LeaseTimerScheduler()
+        self._scheduler = scheduler
+        self._apply_ip = apply_ip
+        self._dump_packets = dump_packets
+        self._silent_mode = silent_mode
+        self._start_on_dbus = start_on_dbus
+        self._retransmit_backoff = retransmit_backoff
+        self._iface_config = iface_config
+        self._pcap_writer = pcap_writer
+        self._offer_window = offer_window
+        self._offer_policy = offer_policy
+        self._preferred_server_id = preferred_server_id
+        
+        self._clients = {}    # (DBusControlledDhcpClient, FileLock) tuples, indexed by interface name
+    
+    def addInterface(self, ifname):
+        """
+        Start serving interface ifname (lock this interface, create its DHCP socket and publish its D-Bus object)
+        Will raise lockfile.AlreadyLocked if another process is already running a DHCP client on this interface
+        """
+        if ifname in self._clients:
+            raise Exception('InterfaceAlreadyAdded')
+        iface_lock = lockfile.FileLock('/var/lock/' + progname + '.' + ifname)    # Force only one DHCP client instance on a given network interface
+        iface_lock.acquire(timeout = 0)
+        try:
+            dhcp_client = DBusControlledDhcpClient(ifname = ifname, conn = self._conn, dbus_loop = self._main_loop, scheduler = self._scheduler, apply_ip = self._apply_ip, dump_packets = self._dump_packets, silent_mode = self._silent_mode, retransmit_backoff = self._retransmit_backoff, iface_config = self._iface_config, pcap_writer = self._pcap_writer, offer_window = self._offer_window, offer_policy = self._offer_policy, preferred_server_id = self._preferred_server_id)	# Instanciate a dhcpClient (incoming packets will start getting processing starting from now...)
+        except:
+            iface_lock.release()
+            raise
+        self._clients[ifname] = (dhcp_client, iface_lock)
+        if not self._dbus_server is None:
+            self._dbus_server.exportObject(dhcp_client, DBUS_OBJECT_ROOT + '/' + ifname)
+        if not self._control_server is None:
+            self._control_server.addClient(ifname, dhcp_client)
+        if not self._start_on_dbus:
+            dhcp_client.sendDhcpDiscover()	# Send a DHCP DISCOVER on the network
+    
+    def removeInterface(self, ifname):
+        """
+        Stop serving interface ifname (release its lease, close its DHCP socket, unpublish its D-Bus object and unlock the interface)
+        """
+        try:
+            (dhcp_client, iface_lock) = self._clients.pop(ifname)
+        except KeyError:
+            raise Exception('UnknownInterface')
+        try:
+            dhcp_client.close()
+        finally:
+            if not self._dbus_server is None:
+                self._dbus_server.unexportObject(DBUS_OBJECT_ROOT + '/' + ifname)
+            if not self._control_server is None:
+                self._control_server.removeClient(ifname)
+            iface_lock.release()
+    
+    @dbus.service.method(dbus_interface = DBUS_SERVICE_INTERFACE, in_signature='s', out_signature='')
+    def AddInterface(self, ifname):
+        """
+        D-Bus method to start a new DHCP client on interface ifname
+        """
+        if not self._silent_mode: print('Received AddInterface(' + str(ifname) + ') command from D-Bus')
+        try:
+            self.addInterface(str(ifname))
+        except lockfile.AlreadyLocked:
+            raise Exception('InterfaceAlreadyLocked')
+    
+    @dbus.service.method(dbus_interface = DBUS_SERVICE_INTERFACE, in_signature='s', out_signature='')
+    def RemoveInterface(self, ifname):
+        """
+        D-Bus method to terminate the DHCP client running on interface ifname
+        """
+        if not self._silent_mode: print('Received RemoveInterface(' + str(ifname) + ') command from D-Bus')
+        self.removeInterface(str(ifname))
+    
+    @dbus.service.method(dbus_interface = DBUS_SERVICE_INTERFACE, in_signature='', out_signature='as')
+    def GetInterfaces(self):
+        """
+        D-Bus method to get the list of interfaces served by this process
+        """
+        return sorted(self._clients.keys())
+    
+    @dbus.service.method(dbus_interface = DBUS_SERVICE_INTERFACE, in_signature='', out_signature='i')
+    def GetPid(self):
+        """
+        D-Bus method to output the PID of this process
+        """
+        return (int(os.getpid()))
+    
+    @dbus.service.method(dbus_interface = DBUS_SERVICE_INTERFACE, in_signature='', out_signature='s')
+    def GetVersion(self):
+        """
+        D-Bus method to get the version of this slave
+        """
+        global VERSION
+        return VERSION
+    
+    def run(self):
+        """
+        Run the main loop (handling DHCP packets, timeouts and D-Bus messages for all interfaces) until exit() is called
+        """
+        if not self._silent_mode: print('Starting mainloop')
+        self._main_loop.run()
+        if not self._silent_mode: print('Stopping mainloop')
+    
+    def exit(self):
+        """
+        Terminate the DHCP clients on all interfaces and stop the main loop
+        """
+        for ifname in self._clients.keys():
+            self.removeInterface(ifname)
+        self._main_loop.quit()
+
+
+class VirtualDhcpClient:
+    """
+    State of one of the virtual DHCP clients simulated by a DhcpLoadGenerator
+    """
+    
+    def __init__(self, mac_addr, xid):
+        self.mac_addr = mac_addr    # MAC address of this client, as a colon-separated string
+        self.chaddr = str(bytearray(hwmac(mac_addr).list()))    # MAC address of this client, as a binary string (as found in the chaddr field of DHCP packets)
+        self.xid = xid    # Transaction ID currently used by this client
+        self.dhcp_status = rfdhcpclientlib.DhcpLeaseStatus.DhcpLeaseStatus()
+        self.request_sent = False
+        self.renew_timer = None    # LeaseTimer handle on the pending renew timeout
+        self.release_timer = None    # LeaseTimer handle on the pending release timeout
+        self.rebind_timer = None    # LeaseTimer handle on the pending rebind timeout (T2)
+        self.rebinding = False    # Is this client in the REBINDING state (T2 passed without its lease being renewed)? Renews are always broadcast, but are counted separately in both states
+        self.pending_exchange = None    # (exchange type, monotonic timestamp of the request) for the exchange this client is waiting a reply for
+        self.retransmit_timer = None    # LeaseTimer handle on the pending retransmission timeout
+        self.retransmit_request = None    # (exchange type, attempt, arguments of DhcpLoadGenerator._sendDhcpPacketFromTemplate()) for the request that will be retransmitted if we get no reply
+    
+    def cancelRetransmit(self):
+        """
+        Cancel the pending retransmission (if any)
+        """
+        self.retransmit_request = None
+        if not self.retransmit_timer is None:
+            self.retransmit_timer.cancel()
+            self.retransmit_timer = None
+    
+    def cancelLeaseTimeouts(self):
+        """
+        Cancel the pending renew, rebind and release timeouts (if any), and leave the REBINDING state
+        """
+        if not self.renew_timer is None:
+            self.renew_timer.cancel()
+            self.renew_timer = None
+        if not self.release_timer is None:
+            self.release_timer.cancel()
+            self.release_timer = None
+        if not self.rebind_timer is None:
+            self.rebind_timer.cancel()
+            self.rebind_timer = None
+        self.rebinding = False
+
+
+class DhcpLoadGenerator(MainLoopDhcpClient):
+    """
+    DHCP client simulating many virtual DHCP clients (each with its own MAC address) over one single socket
+    Replies from the DHCP server are dispatched to the virtual client they belong to using their xid and chaddr fields
+    This is used to load-test DHCP servers. It is not controlled via D-Bus
+    """
+    
+    def __init__(self, main_loop, ifname = None, listen_address = '0.0.0.0', client_port = 68, server_port = 67, nb_clients = 1, mac_base = '02:00:00:00:00:00', parameter_list = None, dump_packets = False, silent_mode = True, scheduler = None, retransmit_backoff = None, broadcast_address = '255.255.255.255', pcap_writer = None, **kwargs):
+        """
+        Instanciate a new DhcpLoadGenerator bound to ifname (if specified) or a specific interface address listen_address (if specified)
+        nb_clients virtual clients will be simulated, using consecutive MAC addresses starting from mac_base
+        DHCP packets and lease timeouts will be handled when main_loop is run (see run())
+        Lease timeouts of all virtual clients are scheduled in scheduler (a LeaseTimerScheduler object). If not provided, a new scheduler is created
+        Requests that get no reply are retransmitted according to retransmit_backoff (a DhcpRetransmitBackoff object). If not provided, RFC 2131 default values are used
+        broadcast_address and pcap_writer are described in MainLoopDhcpClient
+        """
+        MainLoopDhcpClient.__init__(self, main_loop = main_loop, ifname = ifname, listen_address = listen_address, client_port = client_port, server_port = server_port, broadcast_address = broadcast_address, pcap_writer = pcap_writer)
+        
+        self._silent_mode = silent_mode
+        self._dump_packets = dump_packets
+        
+        if parameter_list is None:
+            parameter_list = [1, 3, 6, 15, 42]    # Subnet mask, router, DNS, domain, NTP servers
+        self._parameter_list = parameter_list
+        
+        self._packet_templates = rfdhcpclientlib.DhcpPacketTemplate.DhcpPacketTemplateCache()
+        
+        if scheduler is None:
+            scheduler = rfdhcpclientlib.LeaseTimerScheduler.LeaseTimerScheduler()
+        self._scheduler = scheduler
+        
+        if retransmit_backoff is None:
+            retransmit_backoff = rfdhcpclientlib.DhcpRetransmitBackoff.DhcpRetransmitBackoff()
+        self._retransmit_backoff = retransmit_backoff
+        
+        self._random = random.Random()
+        self._random.seed()
+        
+        self._clients_by_xid = {}    # All our virtual clients (VirtualDhcpClient objects), indexed by their current xid (only accessed from the thread running main_loop, so no mutex is needed)
+        self._clients = []
+        mac_base = MacAddr.macAddrToInt(mac_base)
+        for index in xrange(nb_clients):
+            client = VirtualDhcpClient(mac_addr = MacAddr.intToMacAddr(mac_base + index), xid = self._genUniqueXid())
+            self._clients.append(client)
+            self._clients_by_xid[client.xid] = client
+        
+        self.stats = {'discover': 0, 'offer': 0, 'request': 0, 'renew': 0, 'rebind': 0, 'ack': 0, 'nack': 0, 'release': 0, 'unmatched': 0, 'retransmit': 0}
+        self._latency_histograms = dict([(exchange, rfdhcpclientlib.DhcpLatencyHistogram.DhcpLatencyHistogram()) for exchange in DHCP_EXCHANGES])    # Latency of each type of DHCP exchange, for all virtual clients
+        self._start_time = None
+    
+    def _genUniqueXid(self):
+        """
+        Generate a random transaction ID that is not currently used by any of our virtual clients
+        """
+        while True:
+            xid = self._random.randint(0,0xffffffff)
+            if not xid in self._clients_by_xid:
+                return xid
+    
+    def _startNewTransaction(self, client):
+        """
+        Allocate a new transaction ID to the virtual client client
+        """
+        del self._clients_by_xid[client.xid]
+        client.xid = self._genUniqueXid()
+        self._clients_by_xid[client.xid] = client
+    
+    def _sendDhcpPacketFromTemplate(self, client, message_type, dstipaddr, parameter_list = None, ciaddr = '0.0.0.0', **options):
+        """
+        Send a DHCP packet of type message_type (eg: 'DISCOVER') on behalf of the virtual client client
+        """
+        packet = encodeDhcpPacketFromTemplate(self._packet_templates, client.mac_addr, message_type, client.xid, parameter_list = parameter_list, ciaddr = ciaddr, buffer = self._send_buffer, **options)
+        self.sendDhcpPacket(packet, dstipaddr)
+    
+    def _startExchange(self, client, exchange):
+        """
+        Record that the virtual client client has just sent the request of an exchange of type exchange (see DHCP_EXCHANGES)
+        """
+        client.pending_exchange = (exchange, rfdhcpclientlib.MonotonicClock.monotonic())
+    
+    def _completeExchange(self, client, exchanges):
+        """
+        Record the latency of the pending exchange of the virtual client client if it just got its reply (if its type is in the list exchanges)
+        """
+        if not client.pending_exchange is None and client.pending_exchange[0] in exchanges:
+            (exchange, start) = client.pending_exchange
+            self._latency_histograms[exchange].record(rfdhcpclientlib.MonotonicClock.monotonic() - start)
+            client.pending_exchange = None
+    
+    def _sendDhcpRequestPacket(self, client, exchange, message_type, dstipaddr, **send_args):
+        """
+        Send a DHCP packet that expects a reply on behalf of the virtual client client, and arm its retransmission in case we get no reply
+        """
+        client.cancelRetransmit()
+        self._sendDhcpPacketFromTemplate(client, message_type, dstipaddr, **send_args)
+        client.retransmit_request = (exchange, 0, (message_type, dstipaddr), send_args)
+        client.retransmit_timer = self._scheduler.schedule(self._retransmit_backoff.getInterval(0, self._random), self._onRetransmitTimeout, client)
+    
+    def _onRetransmitTimeout(self, client):
+        """
+        Callback invoked by our scheduler when the last request sent by the virtual client client got no reply
+        """
+        client.retransmit_timer = None
+        if client.retransmit_request is None:
+            return
+        (exchange, attempt, send_args, send_kwargs) = client.retransmit_request
+        if not self._retransmit_backoff.hasRetriesLeft(attempt):
+            client.retransmit_request = None
+            if exchange == 'request_ack':    # Go back to the discovery stage (RFC 2131 section 4.4.1)
+                self._startNewTransaction(client)
+                self.sendDhcpDiscover(client)
+            return
+        attempt += 1
+        self.stats['retransmit'] += 1
+        self._sendDhcpPacketFromTemplate(client, *send_args, **send_kwargs)
+        client.retransmit_request = (exchange, attempt, send_args, send_kwargs)
+        client.retransmit_timer = self._scheduler.schedule(self._retransmit_backoff.getInterval(attempt, self._random), self._onRetransmitTimeout, client)
+    
+    def _getClientForPacket(self, packet):
+        """
+        Find the virtual client a DHCP packet received from the network is destined to
+        Returns None if no virtual client matches both the xid and the chaddr of this packet
+        """
+        client = self._clients_by_xid.get(packet.GetUInt32Option('xid'))
+        if client is None or packet.GetOptionBytes('chaddr')[:6] != client.chaddr:
+            self.stats['unmatched'] += 1
+            if not self._silent_mode: print("Received a packet that does not match any of our virtual clients")
+            return None
+        return client
+    
+    def _dumpPacket(self, message, packet):
+        """
+        Display message (and the content of packet if we have been asked to dump packets)
+        """
+        if self._dump_packets:
+            message += ' with content:'
+        if not self._silent_mode: print(message)
+        if self._dump_packets:
+            print(packet.str())
+    
+    def start(self):
+        """
+        Send a DHCP DISCOVER for each of our virtual clients
+        """
+        self._start_time = time.time()
+        for client in self._clients:
+            self.sendDhcpDiscover(client)
+    
+    def sendDhcpDiscover(self, client):
+        """
+        Send a DHCP DISCOVER packet to the network on behalf of the virtual client client
+        """
+        client.request_sent = False
+        self._startExchange(client, 'discover_offer')
+        self._sendDhcpRequestPacket(client, 'discover_offer', 'DISCOVER', '255.255.255.255', parameter_list = self._parameter_list)
+        self.stats['discover'] += 1
+    
+    def sendDhcpRequest(self, client, requested_ip, server_id):
+        """
+        Send a DHCP REQUEST packet to the network on behalf of the virtual client client
+        """
+        self._startExchange(client, 'request_ack')
+        self._sendDhcpRequestPacket(client, 'request_ack', 'REQUEST', '255.255.255.255', parameter_list = self._parameter_list, request_ip_address = requested_ip, server_identifier = server_id)
+        client.request_sent = True
+        self.stats['request'] += 1
+    
+    def sendDhcpRenew(self, client):
+        """
+        Send a DHCP REQUEST packet to the network to renew the lease of the virtual client client
+        The REQUEST is broadcast even in the RENEWING state: leased addresses are never configured for virtual clients, so a REQUEST unicast to the server could not be sent from the leased address
+        If no reply is received, the renew is sent again by the renew timeout of the client (RFC 2131 section 4.4.5), not by the retransmission backoff used for other requests
+        """
+        client.renew_timer = None
+        lease = client.dhcp_status.lease
+        if not lease.ipv4_lease_valid:
+            return
+        ciaddr = lease.ipv4_address
+        if client.rebinding:
+            self.stats['rebind'] += 1
+        else:
+            self.stats['renew'] += 1
+        if not client.pending_exchange is None and client.pending_exchange[0] == 'renew_ack':    # The previous renew of this client got no reply
+            self.stats['retransmit'] += 1
+        else:
+            self._startExchange(client, 'renew_ack')
+        self._startNewTransaction(client)
+        client.cancelRetransmit()
+        client.request_sent = True
+        # If we get no reply, send another renew after half of the time left before T2 (or before the lease expires if we are already rebinding)
+        deadline_timer = client.release_timer if client.rebinding else client.rebind_timer
+        if not deadline_timer is None:
+            interval = getRenewRetransmitInterval(deadline_timer.remaining(), lease.ipv4_lease_duration)
+            if not interval is None:
+                client.renew_timer = self._scheduler.schedule(interval, self.sendDhcpRenew, client)
+        self._sendDhcpPacketFromTemplate(client, 'REQUEST', '255.255.255.255', parameter_list = self._parameter_list, ciaddr = ciaddr)
+    
+    def _onRebindTimeout(self, client):
+        """
+        Callback invoked by our scheduler at T2, when the server that granted the lease of the virtual client client did not renew it: renews are now broadcast to any server
+        """
+        client.rebind_timer = None
+        client.rebinding = True
+        if not client.renew_timer is None:
+            client.renew_timer.cancel()
+        self.sendDhcpRenew(client)
+    
+    def sendDhcpRelease(self, client):
+        """
+        Send a DHCP RELEASE packet to the network on behalf of the virtual client client, if it currently has a lease
+        """
+        client.cancelLeaseTimeouts()
+        client.cancelRetransmit()
+        lease = client.dhcp_status.lease
+        client.dhcp_status.reset()
+        ipv4_lease_valid = lease.ipv4_lease_valid
+        ipv4_address = lease.ipv4_address
+        ipv4_dhcpserverid = lease.ipv4_dhcpserverid
+        if ipv4_lease_valid and ipv4_address:
+            release_options = {}
+            if ipv4_dhcpserverid:
+                release_options['server_identifier'] = ipv4_dhcpserverid
+            self._sendDhcpPacketFromTemplate(client, 'RELEASE', '255.255.255.255', ciaddr = ipv4_address, **release_options)
+            self.stats['release'] += 1
+    
+    def _onLeaseExpired(self, client):
+        """
+        Callback invoked by our scheduler when the lease of the virtual client client expires
+        The lease is dropped locally (the server considers it expired too, so no RELEASE is sent), and a new discovery is started for this client
+        """
+        client.release_timer = None
+        client.cancelLeaseTimeouts()
+        client.cancelRetransmit()
+        client.dhcp_status.reset()
+        self._startNewTransaction(client)
+        self.sendDhcpDiscover(client)
+    
+    def HandleDhcpOffer(self, packet):
+        """
+        Handle a DHCP OFFER packet coming from the network, and answer with a DHCP REQUEST on behalf of the virtual client it is destined to
+        """
+        client = self._getClientForPacket(packet)
+        if client is None:
+            return
+        self._dumpPacket('==>Received OFFER for ' + client.mac_addr, packet)
+        self.stats['offer'] += 1
+        self._completeExchange(client, ['discover_offer'])
+        if client.request_sent:
+            return    # We already answered another OFFER for this transaction
+        self.sendDhcpRequest(client, requested_ip = packet.GetIpv4Option('yiaddr'), server_id = packet.GetIpv4Option('server_identifier'))
+    
+    def HandleDhcpAck(self, packet):
+        """
+        Handle a DHCP ACK packet coming from the network, and record the lease in the virtual client it is destined to
+        """
+        client = self._getClientForPacket(packet)
+        if client is None:
+            return
+        self._dumpPacket('==>Received ACK for ' + client.mac_addr, packet)
+        if not client.request_sent:
+            if not self._silent_mode: print("Received an ACK without having sent a REQUEST")
+            return
+        lease_duration = packet.GetUInt32Option('ip_address_lease_time')
+        if lease_duration is None:
+            if not self._silent_mode: print("Ignoring ACK without lease time")
+            return
+        client.request_sent = False
+        self._completeExchange(client, ['request_ack', 'renew_ack'])
+        client.cancelRetransmit()
+        
+        client.dhcp_status.publish(rfdhcpclientlib.DhcpLeaseStatus.DhcpLease(ipv4_address = packet.GetIpv4Option('yiaddr'),
+                                                                             ipv4_netmask = packet.GetIpv4Option('subnet_mask'),
+                                                                             ipv4_defaultgw = packet.GetIpv4Option('router'),
+                                                                             ipv4_dnslist = packet.GetIpv4ListOption('domain_name_server'),
+                                                                             ipv4_dhcpserverid = packet.GetIpv4Option('server_identifier'),
+                                                                             ipv4_lease_duration = lease_duration,
+                                                                             ipv4_lease_valid = True))
+        
+        client.cancelLeaseTimeouts()
+        (renewal_time, rebinding_time) = getRenewalTimes(packet, lease_duration)
+        client.renew_timer = self._scheduler.schedule(renewal_time, self.sendDhcpRenew, client)
+        client.rebind_timer = self._scheduler.schedule(rebinding_time, self._onRebindTimeout, client)
+        client.release_timer = self._scheduler.schedule(lease_duration, self._onLeaseExpired, client)
+        
+        self.stats['ack'] += 1
+        if self.stats['ack'] == len(self._clients):
+            self.printStats()
+    
+    def HandleDhcpNack(self, packet):
+        """
+        Handle a DHCP NACK packet coming from the network, and restart the discovery for the virtual client it is destined to
+        """
+        client = self._getClientForPacket(packet)
+        if client is None:
+            return
+        self._dumpPacket('==>Received NACK for ' + client.mac_addr, packet)
+        self.stats['nack'] += 1
+        client.cancelLeaseTimeouts()
+        client.cancelRetransmit()
+        client.dhcp_status.reset()
+        self._startNewTransaction(client)
+        self.sendDhcpDiscover(client)
+    
+    def getNbLeases(self):
+        """
+        Get the number of virtual clients that currently have a valid lease
+        """
+        return len([client for client in self._clients if client.dhcp_status.lease.ipv4_lease_valid])
+    
+    def printStats(self):
+        """
+        Display the packet counters and the lease rate since start() was called
+        """
+        elapsed = time.time() - self._start_time
+        message = str(self.getNbLeases()) + '/' + str(len(self._clients)) + ' leases obtained in ' + '%.3f' % elapsed + 's'
+        if elapsed > 0:
+            message += ' (' + '%.1f' % (self.stats['ack'] / elapsed) + ' leases/s)'
+        print(message)
+        print('Packet counters: ' + ', '.join([name + '=' + str(self.stats[name]) for name in sorted(self.stats.keys())]))
+        for exchange in DHCP_EXCHANGES:
+            stats = self._latency_histograms[exchange].getStats()
+            if stats['count']:
+                print('Latency ' + exchange + ': count=' + str(stats['count']) + ', ' + ', '.join([key + '=' + '%.1f' % (stats[key] * 1000) + 'ms' for key in ['min', 'p50', 'p90', 'p99', 'max']]))
+    
+    def exit(self):
+        """
+        Release the leases of all our virtual clients
+        """
+        for client in self._clients:
+            self.sendDhcpRelease(client)
+        if not self._start_time is None:
+            self.printStats()
+        self.stopMainLoop()
+
+
 dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)	# Use Glib's mainloop as the default loop for all subsequent code
 
 if __name__ == '__main__':
@@ -727,45 +1948,101 @@ if __name__ == '__main__':
 	parser = argparse.ArgumentParser(description="This program launches a DHCP client daemon. \
 It will report every DHCP client state change via D-Bus signal. \
 It will also accept D-Bus method calls to change its behaviour (see Discover(), Renew(), Restart(), Release() etc... methods.", prog=progname)
-	parser.add_argument('-i', '--ifname', type=str, help='network interface on which to send/receive DHCP packets', required=True)
+	parser.add_argument('-i', '--ifname', type=str, action='append', help='network interface on which to send/receive DHCP packets (can be repeated to serve several interfaces from this process, more can be added later via the AddInterface() D-Bus method)', default=[])
 	parser.add_argument('-A', '--applyconfig', action='store_true', help='apply the IP config (ip address, netmask and default gateway) to the interface when lease is obtained')
+	parser.add_argument('--iface-config', choices=['netlink', 'subprocess'], help='how to apply the IP config to the interface (with -A): directly via netlink (default), or by running ifconfig/route/ifup', default='netlink')
 	parser.add_argument('-D', '--dumppackets', action='store_true', help='dump received packets content', default=False)
 	parser.add_argument('-S', '--startondbus', action='store_true', help='only start the DHCP client when receiving a D-Bus Discover() method (also suppresses all stdout output)', default=False)
 	parser.add_argument('-d', '--debug', action='store_true', help='display debug info', default=False)
+	parser.add_argument('--retransmit-initial', type=float, help='delay (in seconds) before retransmitting a DISCOVER or REQUEST that got no reply (doubled for each subsequent retransmission)', default=4)
+	parser.add_argument('--retransmit-max', type=float, help='maximum delay (in seconds) between two retransmissions', default=64)
+	parser.add_argument('--retransmit-retries', type=int, help='maximum number of retransmissions of a request (-1 to retransmit forever)', default=4)
+	parser.add_argument('--offer-window', type=float, metavar='SECONDS', help='collect the OFFERs received during this delay after the first one, then request the one selected by --offer-policy (by default, the first OFFER is requested immediately)', default=0)
+	parser.add_argument('--offer-policy', choices=rfdhcpclientlib.DhcpOfferSelector.OFFER_SELECTION_POLICIES, help='how to select an OFFER among the ones collected during --offer-window: first received (default), from the server with the lowest median OFFER latency, from the server given by --preferred-server-id, or with the longest lease time', default='first')
+	parser.add_argument('--preferred-server-id', type=str, metavar='IP', help='server identifier of the preferred DHCP server (for --offer-policy serverid)', default=None)
+	parser.add_argument('-n', '--clients', type=int, help='load generator mode: simulate this number of DHCP clients (no D-Bus control in this mode)', default=None)
+	parser.add_argument('-m', '--mac-base', type=str, help='load generator mode: MAC address of the first simulated DHCP client (next clients use consecutive MAC addresses). Replay mode: MAC address of the replayed client', default='02:00:00:00:00:00')
+	parser.add_argument('--dbus-address', type=str, metavar='ADDRESS', help='listen for peer-to-peer D-Bus connections on this address (eg: unix:path=/tmp/dhcpclient.sock) instead of using the D-Bus system bus', default=None)
+	parser.add_argument('--control-socket', type=str, metavar='PATH', help='also accept control commands on this unix socket (with the compact protocol of rfdhcpclientlib.DhcpControlChannel). If the D-Bus system bus is not available, only this socket is used', default=None)
+	parser.add_argument('--pcap', type=str, metavar='FILE', help='record all DHCP packets sent and received to this pcap file', default=None)
+	parser.add_argument('--replay', type=str, metavar='FILE', help='replay mode: feed the DHCP server replies recorded in this pcap file to a DHCP client, without using the network nor D-Bus, then exit', default=None)
 	args = parser.parse_args()
 	
-	system_bus = dbus.SystemBus(private=True)
-	gobject.threads_init()	# Allow the mainloop to run as an independent thread
-	dbus.mainloop.glib.threads_init()
-	
-	name = dbus.service.BusName(DBUS_NAME, system_bus)      # Publish the name to the D-Bus so that clients can see us
-	
-	lockfilename = '/var/lock/' + progname + '.' + args.ifname
+	dbus_server = None
+	control_server = None
+	if not args.replay is None:
+		if not args.clients is None:
+			parser.error('replay mode cannot be combined with load generator mode')
+	elif args.clients is None:
+		if args.dbus_address is None:
+			try:
+				system_bus = dbus.SystemBus(private=True)
+				name = dbus.service.BusName(DBUS_NAME, system_bus)      # Publish the name to the D-Bus so that clients can see us
+			except dbus.exceptions.DBusException as ex:
+				if args.control_socket is None:
+					raise
+				system_bus = None	# Minimal environments may have no system bus, we can still be controlled via our control socket
+				if not args.startondbus:
+					print(progname + ': D-Bus system bus is not available (' + str(ex) + '), only using control socket ' + args.control_socket, file=sys.stderr)
+		else:
+			system_bus = None
+			dbus_server = DbusPeerServer(args.dbus_address)	# Peers connect directly to us, there is no bus name to publish
+			if not args.startondbus:
+				print('DBUS_ADDRESS=' + dbus_server.address)
+				sys.stdout.flush()
+	elif len(args.ifname) != 1:
+		parser.error('load generator mode requires exactly one --ifname')
+	if args.offer_policy == 'serverid' and args.preferred_server_id is None:
+		parser.error('--offer-policy serverid requires --preferred-server-id')
 	
 	signal.signal(signal.SIGINT, signalHandler)	# Install a cleanup handler on SIGINT and SIGTERM
 	signal.signal(signal.SIGTERM, signalHandler)
 	
-	main_lock = lockfile.FileLock(lockfilename)
+	pcap_writer = None
 	try:
-		main_lock.acquire(timeout = 0)
+		lease_scheduler = rfdhcpclientlib.LeaseTimerScheduler.LeaseTimerScheduler()	# All lease timeouts of this process are handled by this single scheduler
+		retransmit_backoff = rfdhcpclientlib.DhcpRetransmitBackoff.DhcpRetransmitBackoff(initial_interval = args.retransmit_initial, max_interval = args.retransmit_max, max_retries = (None if args.retransmit_retries < 0 else args.retransmit_retries))
+		if not args.pcap is None:
+			pcap_writer = rfdhcpclientlib.DhcpPcapFile.DhcpPcapWriter(args.pcap)
 		
-		client = DBusControlledDhcpClient(ifname = args.ifname, conn = system_bus, dbus_loop = gobject.MainLoop(), apply_ip = args.applyconfig, dump_packets = args.dumppackets, silent_mode = (not args.debug))	# Instanciate a dhcpClient (incoming packets will start getting processing starting from now...)
-		#client.setOnExit(exit)
-		
-		if not args.startondbus:
-			client.sendDhcpDiscover()	# Send a DHCP DISCOVER on the network
+		if not args.replay is None:
+			client = DBusControlledDhcpClient(conn = None, object_name = None, dbus_loop = gobject.MainLoop(), mac_addr = args.mac_base, scheduler = lease_scheduler, dump_packets = args.dumppackets, silent_mode = (not args.debug), retransmit_backoff = retransmit_backoff, pcap_writer = pcap_writer, replay = True)	# This client is not published on D-Bus and does not use the network
+		elif args.clients is None:
+			if not args.control_socket is None:
+				control_server = UnixSocketControlServer(args.control_socket)
+			client = DhcpClientManager(conn = system_bus, dbus_loop = gobject.MainLoop(), scheduler = lease_scheduler, apply_ip = args.applyconfig, dump_packets = args.dumppackets, silent_mode = (not args.debug), start_on_dbus = args.startondbus, retransmit_backoff = retransmit_backoff, iface_config = args.iface_config, pcap_writer = pcap_writer, dbus_server = dbus_server, control_server = control_server, offer_window = args.offer_window, offer_policy = args.offer_policy, preferred_server_id = args.preferred_server_id)	# One D-Bus object and one DHCP socket per interface, all served from this process
+		else:
+			main_lock = lockfile.FileLock('/var/lock/' + progname + '.' + args.ifname[0])
+			main_lock.acquire(timeout = 0)
+			client = DhcpLoadGenerator(main_loop = gobject.MainLoop(), scheduler = lease_scheduler, ifname = args.ifname[0], nb_clients = args.clients, mac_base = args.mac_base, dump_packets = args.dumppackets, silent_mode = (not args.debug), retransmit_backoff = retransmit_backoff, pcap_writer = pcap_writer)	# Instanciate all virtual DHCP clients
+			client.start()	# Send a DHCP DISCOVER on the network for each virtual client
 		
 		try:
-			while True:	client.GetNextDhcpPacket()	# Handle incoming DHCP packets
-		except select.error as ex:	# Catch select error 4 (interrupted system call)
-			if ex[0] == 4:
-				#print(progname + ': Terminating', file=sys.stderr)
-				pass
+			if not args.replay is None:
+				pcap_reader = rfdhcpclientlib.DhcpPcapFile.DhcpPcapReader(args.replay)
+				try:
+					start_time = time.time()
+					nb_packets = client.replayPcapFile(pcap_reader)	# The recorded DISCOVERs and REQUESTs drive our client, nothing is sent to the network
+					elapsed = time.time() - start_time
+					stats = client.GetStats()
+					nb_leases = int(stats['request_ack']['count']) + int(stats['renew_ack']['count'])	# ACKs that answered one of our REQUESTs with a lease
+					print(progname + ': Replayed ' + str(nb_packets) + ' DHCP packets in ' + '%.6f' % elapsed + 's, ' + str(nb_leases) + ' leases obtained')
+				finally:
+					pcap_reader.close()
 			else:
-				raise  
+				if args.clients is None:
+					for ifname in args.ifname:
+						client.addInterface(ifname)
+				client.run()	# Handle incoming DHCP packets, lease timeouts and D-Bus messages until we are terminated
 		finally:
 			if not client is None:
 				client.exit()
 			client = None
-	except lockfile.AlreadyLocked:
-		print(progname + ': Error: Could not get lock on file ' + lockfilename + '.lock', file=sys.stderr)
+			if not pcap_writer is None:
+				pcap_writer.close()
+			if not dbus_server is None:
+				dbus_server.close()
+			if not control_server is None:
+				control_server.close()
+	except lockfile.AlreadyLocked as ex:
+		print(progname + ': Error: Could not get lock: ' + str(ex), file=sys.stderr)
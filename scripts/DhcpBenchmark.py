@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import sys
+import os
+import subprocess
+
+import argparse
+
+import time
+
+import gobject
+
+import DBusControlledDhcpClient
+
+import rfdhcpclientlib.DhcpRetransmitBackoff
+import rfdhcpclientlib.DhcpPcapFile
+
+progname = os.path.basename(sys.argv[0])
+
+class BenchmarkDhcpClient(DBusControlledDhcpClient.DBusControlledDhcpClient):
+    """
+    DBusControlledDhcpClient that chains full DHCP cycles (RELEASE of the previous lease, DISCOVER, OFFER, REQUEST, ACK) as fast as possible
+    It is not published on D-Bus: the whole benchmark runs within this process, against a MockDhcpServer
+    """
+
+    def __init__(self, nb_cycles, **kwargs):
+        DBusControlledDhcpClient.DBusControlledDhcpClient.__init__(self, conn = None, object_name = None, **kwargs)    # Without a connection, our D-Bus object must not have a path either
+        self.nb_cycles = nb_cycles
+        self.completed_cycles = 0
+        self.nacks = 0
+
+    def startCycle(self):
+        """
+        Start a new DHCP cycle (this is also used as a GLib idle callback, so that cycles are not chained recursively from packet handlers)
+        """
+        self.sendDhcpDiscover()    # Release our previous lease (if any) and restart a discovery
+        return False    # Do not call us again
+
+    def handleDhcpAck(self, packet):
+        DBusControlledDhcpClient.DBusControlledDhcpClient.handleDhcpAck(self, packet)
+        if not self._dhcp_status.lease.ipv4_lease_valid:
+            return    # This ACK was ignored (our previous lease was released when the cycle started)
+        self.completed_cycles += 1
+        if self.completed_cycles >= self.nb_cycles:
+            self.stopMainLoop()
+        else:
+            gobject.idle_add(self.startCycle)
+
+    def handleDhcpNack(self, packet):
+        DBusControlledDhcpClient.DBusControlledDhcpClient.handleDhcpNack(self, packet)    # A NACK does not end the benchmark, the client restarts the cycle from the discovery
+        self.nacks += 1
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="This program measures the number of full DHCP cycles (DISCOVER, OFFER, REQUEST, ACK) per second that DBusControlledDhcpClient can perform, against a local mock DHCP server on the loopback interface (no lab network nor root access rights are needed).", prog=progname)
+	parser.add_argument('-c', '--cycles', type=int, help='number of DHCP cycles to perform', default=1000)
+	parser.add_argument('--client-port', type=int, help='UDP port used by the client', default=6868)
+	parser.add_argument('--server-port', type=int, help='UDP port used by the mock server', default=6767)
+	parser.add_argument('--delay', type=float, help='delay (in seconds) before the mock server sends each reply', default=0)
+	parser.add_argument('--drop-rate', type=float, help='ratio (between 0 and 1) of requests ignored by the mock server', default=0)
+	parser.add_argument('--nack-rate', type=float, help='ratio (between 0 and 1) of REQUESTs answered with a NACK by the mock server', default=0)
+	parser.add_argument('--lease-time', type=int, help='lease duration (in seconds) sent by the mock server', default=3600)
+	parser.add_argument('--seed', type=int, help='seed of the mock server fault injection random generator', default=0)
+	parser.add_argument('--pcap', type=str, metavar='FILE', help='record all DHCP packets sent and received by the client to this pcap file (it can then be replayed with DBusControlledDhcpClient.py --replay)', default=None)
+	parser.add_argument('--retransmit-initial', type=float, help='delay (in seconds) before the client retransmits a request that got no reply (useful with --drop-rate)', default=0.1)
+	args = parser.parse_args()
+
+	mock_server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'MockDhcpServer.py'),
+		'--listen-address', '127.0.0.1',
+		'--reply-address', '127.0.0.1',
+		'--server-port', str(args.server_port),
+		'--client-port', str(args.client_port),
+		'--delay', str(args.delay),
+		'--drop-rate', str(args.drop_rate),
+		'--nack-rate', str(args.nack_rate),
+		'--lease-time', str(args.lease_time),
+		'--seed', str(args.seed)],
+		stdout = subprocess.PIPE)
+	pcap_writer = None
+	try:
+		mock_server.stdout.readline()	# Wait for the mock server to listen
+		if not args.pcap is None:
+			pcap_writer = rfdhcpclientlib.DhcpPcapFile.DhcpPcapWriter(args.pcap)
+		retransmit_backoff = rfdhcpclientlib.DhcpRetransmitBackoff.DhcpRetransmitBackoff(initial_interval = args.retransmit_initial, max_interval = args.retransmit_initial * 16, max_retries = None, jitter = 0)
+		client = BenchmarkDhcpClient(nb_cycles = args.cycles, dbus_loop = gobject.MainLoop(), listen_address = '127.0.0.1', client_port = args.client_port, server_port = args.server_port, broadcast_address = '127.0.0.1', mac_addr = '02:00:00:00:00:01', retransmit_backoff = retransmit_backoff, pcap_writer = pcap_writer)
+		start_time = time.time()
+		gobject.idle_add(client.startCycle)
+		try:
+			client.run()
+		finally:
+			elapsed = time.time() - start_time
+			client.sendDhcpRelease()
+			client.dhcp_socket.close()
+		print(progname + ': ' + str(client.completed_cycles) + ' DHCP cycles in ' + '%.3f' % elapsed + 's (' + '%.1f' % (client.completed_cycles / elapsed) + ' cycles/s, ' + str(client.nacks) + ' NACKs)')
+		stats = client.GetStats()
+		for exchange in DBusControlledDhcpClient.DHCP_EXCHANGES:
+			exchange_stats = stats[exchange]
+			if int(exchange_stats['count']):
+				print(progname + ': ' + exchange + ': ' + ', '.join([key + '=' + '%.6f' % float(exchange_stats[key]) + 's' for key in ['mean', 'p50', 'p90', 'p99']]) + ', retransmissions=' + str(int(exchange_stats['retransmissions'])))
+	finally:
+		if not pcap_writer is None:
+			pcap_writer.close()
+		mock_server.terminate()
+		print(mock_server.communicate()[0], end='')
@@ -0,0 +1,160 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import sys
+import os
+import subprocess
+import signal
+import tempfile
+import shutil
+import time
+import socket
+import re
+
+import argparse
+
+import dbus
+import dbus.connection
+
+import rfdhcpclientlib.DhcpControlChannel
+
+progname = os.path.basename(sys.argv[0])
+
+SLAVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'DBusControlledDhcpClient.py')
+BENCHMARK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'DhcpBenchmark.py')
+
+DBUS_OBJECT_ROOT = '/com/legrandelectric/RobotFrameworkIPC/DhcpClientLibrary'	# Same values as in DBusControlledDhcpClient.py
+DBUS_SERVICE_INTERFACE = 'com.legrandelectric.RobotFrameworkIPC.DhcpClientLibrary'
+
+CONNECT_TIMEOUT = 5	# How long (in seconds) we wait for a slave to listen
+
+def startSlave(slave_args, env = None):
+	"""
+	Start DBusControlledDhcpClient.py with the command line arguments slave_args
+	Returns the subprocess.Popen object of the slave
+	"""
+	return subprocess.Popen([sys.executable, SLAVE_PATH] + slave_args, env = env)
+
+def stopSlave(slave):
+	"""
+	Terminate slave (a subprocess.Popen object) the same way DhcpClientLibrary does, and check that it exits cleanly
+	"""
+	if not slave.poll() is None:
+		raise Exception('SlaveDied')
+	slave.send_signal(signal.SIGTERM)
+	if slave.wait() != 0:
+		raise Exception('SlaveExitedWithError')
+
+def retryUntilSlaveListens(slave, function):
+	"""
+	Call function until it stops raising an exception (the slave may not listen yet), for up to CONNECT_TIMEOUT seconds
+	Returns the value returned by function
+	"""
+	deadline = time.time() + CONNECT_TIMEOUT
+	while True:
+		try:
+			return function()
+		except Exception:
+			if not slave.poll() is None:
+				raise Exception('SlaveDied')
+			if time.time() >= deadline:
+				raise
+			time.sleep(0.05)
+
+def checkPeerToPeer(ifname, runtime_dir):
+	"""
+	Start a slave with --dbus-address, connect to it directly and invoke methods on its D-Bus objects
+	"""
+	address = 'unix:path=' + os.path.join(runtime_dir, 'dbus.sock')
+	slave = startSlave(['-i', ifname, '-S', '--dbus-address', address])
+	try:
+		conn = retryUntilSlaveListens(slave, lambda: dbus.connection.Connection(address))
+		try:
+			manager = dbus.Interface(conn.get_object(None, DBUS_OBJECT_ROOT), DBUS_SERVICE_INTERFACE)
+			if not ifname in manager.GetInterfaces():
+				raise Exception('InterfaceNotServed')
+			dhcp_client = dbus.Interface(conn.get_object(None, DBUS_OBJECT_ROOT + '/' + ifname), DBUS_SERVICE_INTERFACE)
+			if dhcp_client.GetInterface() != ifname:
+				raise Exception('WrongInterface')
+			if dhcp_client.GetLease()['lease_valid']:
+				raise Exception('UnexpectedLease')	# Started with -S, the slave did not send any DISCOVER
+			print(progname + ': peer-to-peer D-Bus: OK (slave version ' + str(manager.GetVersion()) + ')')
+		finally:
+			conn.close()
+	finally:
+		stopSlave(slave)
+
+def checkControlSocketWithoutSystemBus(ifname, runtime_dir):
+	"""
+	Start a slave with --control-socket in an environment where the D-Bus system bus is not available, and invoke methods over its control socket
+	"""
+	path = os.path.join(runtime_dir, 'control.sock')
+	env = dict(os.environ)
+	env['DBUS_SYSTEM_BUS_ADDRESS'] = 'unix:path=' + os.path.join(runtime_dir, 'no-system-bus')	# Nobody listens there
+	slave = startSlave(['-i', ifname, '-S', '--control-socket', path], env = env)
+	try:
+		def connect():
+			sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try:
+				sock.connect(path)
+			except socket.error:
+				sock.close()
+				raise
+			return sock
+		channel = rfdhcpclientlib.DhcpControlChannel.DhcpControlChannel(retryUntilSlaveListens(slave, connect))
+		try:
+			def call(method):
+				channel.sendMessage({'id': 1, 'ifname': ifname, 'method': method})
+				messages = []
+				while not messages:
+					messages = channel.receiveMessages()
+					if messages is None:
+						raise Exception('SlaveDied')
+					messages = [message for message in messages if not 'event' in message]
+				if 'error' in messages[0]:
+					raise Exception(messages[0]['error'])
+				return messages[0]['result']
+			version = call('GetVersion')
+			if not isinstance(version, str):
+				raise Exception('ControlSocketReturnedUnicode')	# Values must have the same types as with D-Bus
+			lease = call('GetLease')
+			if lease['lease_valid'] or lease['ifname'] != ifname:
+				raise Exception('UnexpectedLease')
+			print(progname + ': control socket without system bus: OK (slave version ' + version + ')')
+		finally:
+			channel.close()
+	finally:
+		stopSlave(slave)
+
+def checkReplay(runtime_dir):
+	"""
+	Record a few DHCP cycles against a mock DHCP server with DhcpBenchmark.py, then replay them with the slave's --replay mode
+	The DHCP ports (67 and 68) are used on the loopback interface, as the replay mode only replays packets exchanged between these ports
+	"""
+	nb_cycles = 3
+	pcap_path = os.path.join(runtime_dir, 'dhcp.pcap')
+	subprocess.check_call([sys.executable, BENCHMARK_PATH, '--cycles', str(nb_cycles), '--client-port', '68', '--server-port', '67', '--pcap', pcap_path])
+	slave = subprocess.Popen([sys.executable, SLAVE_PATH, '--replay', pcap_path, '--mac-base', '02:00:00:00:00:01'], stdout = subprocess.PIPE)
+	output = slave.communicate()[0]
+	if slave.returncode != 0:
+		raise Exception('SlaveExitedWithError')
+	match = re.search(r'Replayed \d+ DHCP packets in [0-9.]+s, (\d+) leases obtained', output)
+	if match is None or int(match.group(1)) != nb_cycles:	# Each recorded cycle must have been handled up to its ACK, not only fed to the client
+		raise Exception('UnexpectedReplay: ' + output.strip())
+	print(progname + ': replay: OK (' + output.strip() + ')')
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="This program starts DBusControlledDhcpClient.py in its various control modes and checks that it can be controlled in each of them (it must be run as root, like the slave itself). No DHCP server is needed.", prog=progname)
+	parser.add_argument('-i', '--ifname', type=str, help='network interface on which the slaves run (they do not send any DHCP packet on it)', default='lo')
+	args = parser.parse_args()
+
+	runtime_dir = tempfile.mkdtemp(prefix = 'dhcpclient-')
+	try:
+		checkPeerToPeer(args.ifname, runtime_dir)
+		checkControlSocketWithoutSystemBus(args.ifname, runtime_dir)
+		checkReplay(runtime_dir)
+	finally:
+		shutil.rmtree(runtime_dir, ignore_errors = True)
@@ -33,3 +33,17 @@ def getHwAddrForIp(ip):
 		if if_ip == ip:
 			return if_mac
 	return None
+
+def macAddrToInt(mac_addr):
+	"""
+	Returns the integer value of the MAC address provided as argument (as a colon-separated string)
+	"""
+	return int(mac_addr.replace(':', ''), 16)
+
+def intToMacAddr(value):
+	"""
+	Returns the colon-separated string representation of the MAC address whose integer value is provided as argument
+	"""
+	if value < 0 or value > 0xffffffffffff:
+		raise Exception('MacAddrOutOfRange')
+	return ':'.join(['%02x' % ((value >> shift) & 0xff) for shift in range(40, -8, -8)])
@@ -0,0 +1,287 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function
+
+import sys
+import os
+import signal
+import errno
+
+import argparse
+
+import random
+import socket
+import struct
+import select
+import heapq
+import itertools
+
+import IN
+
+import rfdhcpclientlib.LazyDhcpPacket
+import rfdhcpclientlib.MonotonicClock
+
+progname = os.path.basename(sys.argv[0])
+
+server = None	# Global instance of the mock DHCP server
+
+MOCK_SERVER_STATS = ['discover', 'offer', 'request', 'ack', 'nack', 'release', 'dropped', 'ignored']	# Counters displayed by MockDhcpServer.printStats()
+
+def ipv4ToInt(ipv4_address):
+	"""
+	Convert a dotted-decimal IPv4 address into an int
+	"""
+	return struct.unpack('!I', socket.inet_aton(ipv4_address))[0]
+
+def intToIpv4(value):
+	"""
+	Convert an int into a dotted-decimal IPv4 address
+	"""
+	return socket.inet_ntoa(struct.pack('!I', value))
+
+def signalHandler(signum, frame):
+	"""
+	Called when receiving SIGINT or SIGTERM, stops the server
+	"""
+	if not server is None:
+		server.stop()
+
+class MockDhcpServer:
+    """
+    Minimal DHCP server, used to run the DHCP client (or its load generator) without a lab network, eg: on the loopback interface or on a veth pair
+    It answers DISCOVER, REQUEST (including renewals) and RELEASE packets, allocating addresses from one single network
+    Faults can be injected to exercise the client: replies can be delayed, requests can be dropped, and REQUESTs can be answered with a NACK
+    """
+
+    def __init__(self, ifname = None, listen_address = '0.0.0.0', client_port = 68, server_port = 67, reply_address = '255.255.255.255', server_id = None, network = '10.200.0.0', netmask = '255.255.0.0', router = None, dns_list = None, lease_time = 3600, response_delay = 0, drop_rate = 0, nack_rate = 0, random_seed = None):
+        """
+        Bind the server to ifname (if specified) and to listen_address, on UDP port server_port
+        Replies are sent to reply_address (broadcast by default, eg: 127.0.0.1 on the loopback interface), on UDP port client_port
+        Addresses are allocated from network/netmask. server_id, router and dns_list default to the first address of this network
+        Replies are sent response_delay seconds after the request is received. A ratio drop_rate (between 0 and 1) of the received requests are ignored, and a ratio nack_rate of the REQUESTs are answered with a NACK
+        random_seed allows reproducing the same sequence of injected faults
+        """
+        self._client_port = client_port
+        self._reply_address = reply_address
+        self._netmask = netmask
+        self._network = ipv4ToInt(network) & ipv4ToInt(netmask)
+        self._pool_size = (~ipv4ToInt(netmask) & 0xffffffff) - 1    # Usable addresses of the network (excluding the network and broadcast addresses)
+        if self._pool_size < 2:
+            raise Exception('NetworkTooSmall')
+        first_address = intToIpv4(self._network + 1)
+        self._server_id = server_id or first_address
+        self._router = router or first_address
+        self._dns_list = dns_list or [first_address]
+        self._lease_time = lease_time
+        self._response_delay = response_delay
+        self._drop_rate = drop_rate
+        self._nack_rate = nack_rate
+
+        self._random = random.Random()
+        self._random.seed(random_seed)
+
+        self._leases = {}    # Address (as a dotted-decimal string) allocated to each client, indexed by MAC address (as a binary string)
+        self._free_addresses = []    # Released addresses (as ints) that can be allocated again
+        self._next_address = self._network + 2    # Next never-allocated address (the first address of the network is used by the server itself)
+
+        self._pending_replies = []    # Heap of (monotonic deadline, sequence, encoded packet) tuples for delayed replies
+        self._sequence = itertools.count()
+        self._stopped = False
+
+        self.stats = dict([(counter, 0) for counter in MOCK_SERVER_STATS])
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if ifname:
+            self._socket.setsockopt(socket.SOL_SOCKET, IN.SO_BINDTODEVICE, ifname + '\0')
+        self._socket.bind((listen_address, server_port))
+
+    def _allocateAddress(self, chaddr):
+        """
+        Get the address allocated to the client with MAC address chaddr, allocating a new one if needed
+        Returns None if the pool is exhausted
+        """
+        ipv4_address = self._leases.get(chaddr)
+        if ipv4_address is None:
+            if self._free_addresses:
+                address = self._free_addresses.pop()
+            elif self._next_address <= self._network + self._pool_size:
+                address = self._next_address
+                self._next_address += 1
+            else:
+                return None
+            ipv4_address = intToIpv4(address)
+            self._leases[chaddr] = ipv4_address
+        return ipv4_address
+
+    def _releaseAddress(self, chaddr):
+        """
+        Free the address allocated to the client with MAC address chaddr (if any)
+        """
+        ipv4_address = self._leases.pop(chaddr, None)
+        if not ipv4_address is None:
+            self._free_addresses.append(ipv4ToInt(ipv4_address))
+
+    def _buildReply(self, request, message_type, yiaddr = None):
+        """
+        Build the reply of type message_type (eg: 'ACK') to the LazyDhcpPacket request, offering or acknowledging address yiaddr
+        Returns the encoded reply
+        """
+        reply = rfdhcpclientlib.LazyDhcpPacket.LazyDhcpPacket()
+        reply.SetOption('op', [2])    # BOOTREPLY
+        reply.SetOption('htype', [1])
+        reply.SetOption('hlen', [6])
+        for field in ['xid', 'flags', 'giaddr', 'chaddr']:
+            reply.SetOption(field, request.GetOptionBytes(field))
+        reply.SetOption('siaddr', socket.inet_aton(self._server_id))
+        reply.SetOption('dhcp_message_type', [rfdhcpclientlib.LazyDhcpPacket.DHCP_MESSAGE_TYPES[message_type]])
+        reply.SetOption('server_identifier', socket.inet_aton(self._server_id))
+        if not yiaddr is None:
+            reply.SetOption('yiaddr', socket.inet_aton(yiaddr))
+            reply.SetOption('subnet_mask', socket.inet_aton(self._netmask))
+            reply.SetOption('router', socket.inet_aton(self._router))
+            reply.SetOption('domain_name_server', ''.join([socket.inet_aton(dns) for dns in self._dns_list]))
+            reply.SetOption('ip_address_lease_time', struct.pack('!I', self._lease_time))
+            reply.SetOption('renewal_time_value', struct.pack('!I', self._lease_time / 2))    # T1, see RFC 2131 section 4.4.5
+            reply.SetOption('rebinding_time_value', struct.pack('!I', self._lease_time * 7 / 8))    # T2
+        return str(reply.EncodePacket())
+
+    def _sendReply(self, reply):
+        """
+        Send (now or after the configured response delay) the encoded reply
+        """
+        if self._response_delay > 0:
+            heapq.heappush(self._pending_replies, (rfdhcpclientlib.MonotonicClock.monotonic() + self._response_delay, next(self._sequence), reply))
+        else:
+            self._socket.sendto(reply, (self._reply_address, self._client_port))
+
+    def _sendPendingReplies(self):
+        """
+        Send all delayed replies whose deadline has been reached
+        """
+        now = rfdhcpclientlib.MonotonicClock.monotonic()
+        while self._pending_replies and self._pending_replies[0][0] <= now:
+            (deadline, sequence, reply) = heapq.heappop(self._pending_replies)
+            self._socket.sendto(reply, (self._reply_address, self._client_port))
+
+    def handleDhcpDiscover(self, packet, chaddr):
+        self.stats['discover'] += 1
+        yiaddr = self._allocateAddress(chaddr)
+        if yiaddr is None:
+            self.stats['ignored'] += 1    # Pool exhausted, we cannot make any offer
+            return
+        self._sendReply(self._buildReply(packet, 'OFFER', yiaddr))
+        self.stats['offer'] += 1
+
+    def handleDhcpRequest(self, packet, chaddr):
+        self.stats['request'] += 1
+        server_id = packet.GetIpv4Option('server_identifier')
+        if not server_id is None and server_id != self._server_id:
+            self._releaseAddress(chaddr)    # The client selected another server's offer
+            self.stats['ignored'] += 1
+            return
+        requested_ip = packet.GetIpv4Option('request_ip_address')
+        if requested_ip is None:
+            requested_ip = packet.GetIpv4Option('ciaddr')    # Renewing or rebinding client
+        if self._random.random() < self._nack_rate or self._leases.get(chaddr) != requested_ip:
+            self._sendReply(self._buildReply(packet, 'NACK'))
+            self.stats['nack'] += 1
+        else:
+            self._sendReply(self._buildReply(packet, 'ACK', requested_ip))
+            self.stats['ack'] += 1
+
+    def handleDhcpRelease(self, packet, chaddr):
+        self.stats['release'] += 1
+        self._releaseAddress(chaddr)
+
+    def handlePacket(self, data):
+        """
+        Handle one datagram received from a client
+        """
+        packet = rfdhcpclientlib.LazyDhcpPacket.LazyDhcpPacket()
+        if not packet.DecodePacket(data):
+            self.stats['ignored'] += 1
+            return
+        if self._drop_rate > 0 and self._random.random() < self._drop_rate:
+            self.stats['dropped'] += 1
+            return
+        chaddr = packet.GetOptionBytes('chaddr')[:6]
+        message_type = packet.GetDhcpMessageType()
+        if message_type == rfdhcpclientlib.LazyDhcpPacket.DHCP_MESSAGE_TYPES['DISCOVER']:
+            self.handleDhcpDiscover(packet, chaddr)
+        elif message_type == rfdhcpclientlib.LazyDhcpPacket.DHCP_MESSAGE_TYPES['REQUEST']:
+            self.handleDhcpRequest(packet, chaddr)
+        elif message_type == rfdhcpclientlib.LazyDhcpPacket.DHCP_MESSAGE_TYPES['RELEASE']:
+            self.handleDhcpRelease(packet, chaddr)
+        else:
+            self.stats['ignored'] += 1
+
+    def run(self):
+        """
+        Handle incoming requests until stop() is called
+        """
+        while not self._stopped:
+            if self._pending_replies:
+                timeout = max(0, self._pending_replies[0][0] - rfdhcpclientlib.MonotonicClock.monotonic())
+            else:
+                timeout = None
+            try:
+                readable = select.select([self._socket], [], [], timeout)[0]
+            except select.error as ex:
+                if ex.args[0] == errno.EINTR:    # Interrupted by a signal (see stop())
+                    continue
+                raise
+            if readable:
+                (data, source_address) = self._socket.recvfrom(2048)
+                self.handlePacket(data)
+            self._sendPendingReplies()
+
+    def stop(self):
+        """
+        Make run() return
+        """
+        self._stopped = True
+
+    def close(self):
+        self._socket.close()
+
+    def printStats(self):
+        """
+        Display the packet counters on stdout
+        """
+        print(progname + ': ' + ', '.join([counter + '=' + str(self.stats[counter]) for counter in MOCK_SERVER_STATS]) + ', leases=' + str(len(self._leases)))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="This program runs a minimal DHCP server, with fault injection, to test or benchmark the DHCP client without a lab network.", prog=progname)
+	parser.add_argument('-i', '--ifname', type=str, help='network interface on which to receive DHCP requests (eg: one end of a veth pair)', default=None)
+	parser.add_argument('-l', '--listen-address', type=str, help='local address to bind to (eg: 127.0.0.1 on the loopback interface)', default='0.0.0.0')
+	parser.add_argument('--server-port', type=int, help='UDP port on which to receive requests', default=67)
+	parser.add_argument('--client-port', type=int, help='UDP port to which replies are sent', default=68)
+	parser.add_argument('--reply-address', type=str, help='address to which replies are sent (use 127.0.0.1 on the loopback interface)', default='255.255.255.255')
+	parser.add_argument('--server-id', type=str, help='server identifier (defaults to the first address of the network)', default=None)
+	parser.add_argument('--network', type=str, help='network from which addresses are allocated', default='10.200.0.0')
+	parser.add_argument('--netmask', type=str, help='netmask of the network from which addresses are allocated', default='255.255.0.0')
+	parser.add_argument('--router', type=str, help='default gateway sent to clients (defaults to the first address of the network)', default=None)
+	parser.add_argument('--dns', type=str, action='append', help='DNS server sent to clients (can be repeated, defaults to the first address of the network)', default=None)
+	parser.add_argument('--lease-time', type=int, help='lease duration (in seconds)', default=3600)
+	parser.add_argument('--delay', type=float, help='delay (in seconds) before sending each reply', default=0)
+	parser.add_argument('--drop-rate', type=float, help='ratio (between 0 and 1) of received requests that are ignored', default=0)
+	parser.add_argument('--nack-rate', type=float, help='ratio (between 0 and 1) of REQUESTs answered with a NACK', default=0)
+	parser.add_argument('--seed', type=int, help='seed of the fault injection random generator', default=None)
+	args = parser.parse_args()
+
+	signal.signal(signal.SIGINT, signalHandler)
+	signal.signal(signal.SIGTERM, signalHandler)
+
+	server = MockDhcpServer(ifname = args.ifname, listen_address = args.listen_address, client_port = args.client_port, server_port = args.server_port, reply_address = args.reply_address, server_id = args.server_id, network = args.network, netmask = args.netmask, router = args.router, dns_list = args.dns, lease_time = args.lease_time, response_delay = args.delay, drop_rate = args.drop_rate, nack_rate = args.nack_rate, random_seed = args.seed)
+	print(progname + ': Listening on port ' + str(args.server_port))
+	sys.stdout.flush()
+	try:
+		server.run()
+	finally:
+		server.close()
+		server.printStats()
@@ -36,6 +36,6 @@ setup(
     platforms='any',
     classifiers=CLASSIFIERS.splitlines(),
     packages=['rfdhcpclientlib'],
-    scripts=['scripts/DBusControlledDhcpClient.py'],
+    scripts=['scripts/DBusControlledDhcpClient.py'],    # The other scripts are development tools, only run from a source checkout (see README.md)
     install_requires=['robotframework', 'pydhcplib']
 )